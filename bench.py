@@ -0,0 +1,468 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks for jarvis.py
+#   python bench.py startup                      import-time budget (-X importtime) and CLI start-up time
+#   python bench.py make-template --parts 1000   synthetic stand-in for Standard_Template_new.xlsx
+#   python bench.py run --sizes 100 1000         time / peak memory per operation, compared with a baseline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+JARVIS = os.path.join(HERE, "jarvis.py")
+TEMPLATE_DIR = os.path.join(HERE, "bench_templates")
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+RESULTS_FILE = os.path.join(HERE, "bench_results.json")
+
+# Importing jarvis must stay under this many milliseconds (cumulative -X importtime, best of N runs)
+STARTUP_BUDGET_MS = float(os.environ.get("JARVIS_STARTUP_BUDGET_MS", "60"))
+
+# Heavy modules that are only imported by the code paths that need them
+LAZY_MODULES = ["tkinter", "openpyxl", "numpy", "concurrent.futures"]
+
+# A run is a regression when it is this much slower / bigger than the baseline (and above the noise floor)
+REGRESSION_TOLERANCE = 0.25
+NOISE_FLOOR_MS = 20.0
+NOISE_FLOOR_MB = 5.0
+
+sys.path.insert(0, HERE)
+
+
+# Start-up
+def import_time_ms(module="jarvis", runs=5):
+    # Best cumulative import time of `module` in a fresh interpreter, plus any lazy module it pulled in
+    code = (f"import sys; sys.path.insert(0, {HERE!r}); import {module}; "
+            f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    best, leaked = None, []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              capture_output=True, text=True, check=True)
+        for line in proc.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                cumulative_ms = int(parts[1]) / 1000.0
+                best = cumulative_ms if best is None else min(best, cumulative_ms)
+        leaked = [m for m in proc.stdout.strip().split(",") if m]
+    return best, leaked
+
+def wall_time_ms(cmd, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, check=True, cwd=HERE)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def check_startup(runs=5):
+    import_ms, leaked = import_time_ms(runs=runs)
+    python_ms = wall_time_ms([sys.executable, "-c", "pass"], runs)
+    cli_ms = wall_time_ms([sys.executable, JARVIS, "--help"], runs)
+    # As a script jarvis.py is recompiled on every run; `-m jarvis` reuses the cached bytecode
+    module_ms = wall_time_ms([sys.executable, "-m", "jarvis", "--help"], runs)
+
+    print(f"import jarvis:          {import_ms:7.1f} ms  (budget {STARTUP_BUDGET_MS:.0f} ms)")
+    print(f"python -c pass:         {python_ms:7.1f} ms")
+    print(f"python jarvis.py --help {cli_ms:7.1f} ms")
+    print(f"python -m jarvis --help {module_ms:7.1f} ms")
+    ok = True
+    if import_ms > STARTUP_BUDGET_MS:
+        print(f"FAIL: import time over budget by {import_ms - STARTUP_BUDGET_MS:.1f} ms")
+        ok = False
+    if leaked:
+        print(f"FAIL: imported at start-up: {', '.join(leaked)}")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+# Synthetic template for benchmarks only: the same sheets and column layout as Standard_Template_new.xlsx
+# (Calculation rows link to Entries through jarvis.entries_to_calculation; Tooling, Summary and Import look
+# the part up), so the code paths and data volumes are realistic.
+# SYNTHETIC: the cost formulas, factors and Master Data rate tables below are made up to give the evaluator
+# and exports a plausible workload. They are not the real template's cost model, and jarvis.py must not
+# import, mirror or be validated against them.
+LABOR_RATES = {"Skilled": 180, "Semi skilled": 140, "Unskilled": 110}
+# Captions of the synthetic cost columns, which is how jarvis.cost_model() finds them
+COST_CAPTIONS = {"AI": "Raw material cost", "AN": "BOP parts cost", "AV": "Machine cost", "BA": "Labor Cost",
+                 "BH": "Setting-up cost", "BJ": "Part cost", "BL": "Overheads", "BN": "Total cost"}
+
+def _calc_formulas(r):
+    # Derived Calculation columns (everything not linked straight from Entries); invented, see above
+    md = "'Master Data'!"
+    return {
+        "Y": f"=IFERROR(VLOOKUP(H{r},{md}$A$2:$C$31,2,0),0)",                 # injection pressure
+        "AB": f"=ROUND(Y{r}*AA{r}*0.0011,2)",                                  # tonnage
+        "AD": f"=IFERROR(VLOOKUP(H{r},{md}$A$2:$C$31,3,0),0)",                # RM rate / kg
+        "AE": f"=AC{r}*1.05",                                                  # gross weight
+        "AF": f"=ROUND(AE{r}*AD{r},2)",                                        # RM cost
+        "AG": f"=ROUND((AE{r}-AC{r})*AH{r},2)",                                # scrap recovery
+        "AI": f"=AF{r}-AG{r}",                                                 # net raw material cost
+        "AN": f"=ROUND(AL{r}*AM{r},2)",                                        # BOP cost
+        "AP": f"=ROUND(AB{r}*150+M{r}*N{r}*2500,0)",                           # tool cost -> Tooling AB
+        "AQ": f"=IFNA(VLOOKUP(A{r},Tooling!A:AO,30,0),\"\")",
+        "AR": f"=IFNA(VLOOKUP(A{r},Tooling!A:AO,31,0),\"\")",
+        "AT": f"=IFERROR(VLOOKUP(AS{r},{md}$E$2:$F$29,2,0),0)",               # machine hour rate
+        "AV": f"=IFERROR(ROUND(AT{r}*AU{r}/3600/(M{r}*N{r}),2),0)",            # machine cost
+        "AY": f"=IFERROR(VLOOKUP(AX{r},{md}$H$2:$I$4,2,0),0)",                # labour rate
+        "BA": f"=IFERROR(ROUND(AY{r}*AZ{r}*AU{r}/3600/(M{r}*N{r}),2),0)",      # labour cost
+        "BD": f"=IFERROR(VLOOKUP(BC{r},{md}$H$2:$I$4,2,0),0)",                # setting-up rate
+        "BH": f"=IFERROR(ROUND(BD{r}*BE{r}*BG{r}/60/(F{r}/12),2),0)",          # setting-up cost
+        "BJ": f"=AI{r}+AN{r}+AV{r}+BA{r}+BH{r}+IF(AR{r}=\"\",0,AR{r})",       # part cost
+        "BL": f"=ROUND(BJ{r}*0.1,2)",                                          # overheads
+        "BN": f"=BJ{r}+BL{r}",                                                 # total per part
+        "CL": f"=BN{r}*G{r}",                                                  # per vehicle
+    }
+
+def _synthetic_entry(i, rng, jarvis):
+    cav_x = rng.choice(["1", "1", "2", "2", "4"])
+    cav_y = rng.choice(["1", "1", "2"])
+    pct = rng.choice(jarvis.dropdowns["Projected Area %"])
+    material = rng.choice(jarvis.dropdowns["Rawmaterial"])
+    L, W = rng.randint(20, 600), rng.randint(20, 400)
+    area = round(L * W * 1e-2 * float(pct.rstrip("%")) / 100 * int(cav_x) * int(cav_y), 2)
+    tonnage = jarvis.injection_pressure_map[material] * area * 1e-3 * 1.1
+    machine = next((m for m in jarvis.MACHINE_LADDER if m >= tonnage), jarvis.MACHINE_LADDER[-1])
+    entry = {
+        "Sl.#": i, "In-house/Purchase": rng.choice(["In-House", "Purchase"]),
+        "ZF Part Number": f"ZF{i:07d}", "Part No": f"P{i:07d}", "Part Name": f"Part {i}",
+        "Volume P.A Nos": rng.randint(1000, 200000), "No.off (per Vehicle)": rng.randint(1, 4),
+        "Rawmaterial": material, "L(mm)": float(L), "W(mm)": float(W),
+        "H(mm)": float(rng.randint(5, 200)), "T(mm)": float(rng.randint(1, 4)),
+        "No. of cavities -X direction": int(cav_x), "No. of cavities -Y direction": int(cav_y),
+        "Grain requirement": rng.choice(["Y", "N"]), "HRS Type": rng.randint(0, 3), "No.of drop": rng.randint(1, 12),
+        "X Direction Slider": rng.choice(["Y", "N"]), "Y Direction Slider": rng.choice(["Y", "N"]),
+        "No.of Sliders/Cavity": rng.randint(0, 4), "No.of Lifters/cavity": rng.randint(0, 4),
+        "No.of Bosses /cavity": rng.randint(0, 6), "No.of Ejector pads/ cavity": rng.randint(0, 6),
+        "Projected Area %": pct, "Total Projected Area": area,
+        "Finish wt.( Kgs)": round(rng.uniform(0.01, 3.0), 3), "Scrap cost/Kg (INR)": round(rng.uniform(5, 40), 1),
+        "Bop Parts": float(rng.randint(0, 3)), "Qty (Nos)": rng.randint(0, 4),
+        "Cost /part (INR)": round(rng.uniform(0, 50), 2),
+        "Process": rng.choice(["Injection moulding"] * 6 + ["Blow moulding", "Assy", "BOP"]),
+        "M/c selected": machine, "Machine Cycle time (sec)": float(rng.randint(15, 90)),
+        "Labor Type (Machine)": rng.choice(jarvis.dropdowns["Labor Type (Machine)"]), "Operator /machine": rng.randint(1, 2),
+        "Labor Type (Setup)": rng.choice(jarvis.dropdowns["Labor Type (Setup)"]), "No.of operator": rng.randint(1, 3),
+        "Time/Lot (min)": float(rng.randint(15, 120)),
+    }
+    return entry
+
+def make_template(path, n_parts, seed=0):
+    # Streams rows with openpyxl's write-only mode so 100k parts fit in memory
+    import jarvis
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter, column_index_from_string
+
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+    fill = PatternFill("solid", fgColor="FFF2CC")
+    center = Alignment(horizontal="center", wrap_text=True)
+
+    def header_row(ws, values):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font, cell.fill, cell.alignment = bold, fill, center
+            cells.append(cell)
+        return cells
+
+    def sheet_header(ws, title, n_cols, section_row, captions={}):
+        ws.append(header_row(ws, [title]))
+        ws.append([])
+        ws.append(header_row(ws, section_row + [None] * (n_cols - len(section_row))))
+        letters = [get_column_letter(c) for c in range(1, n_cols + 1)]
+        ws.append(header_row(ws, [captions.get(letter, f"{title} {letter}") for letter in letters]))
+        ws.append(header_row(ws, ["(unit)"] * n_cols))
+        ws.merged_cells.add(f"A1:{get_column_letter(min(n_cols, 10))}1")
+        for c in range(1, n_cols + 1):
+            ws.column_dimensions[get_column_letter(c)].width = 14
+
+    entries = [_synthetic_entry(i, rng, jarvis) for i in range(1, n_parts + 1)]
+
+    # Entries: headers on row 2, part i on row i + 2
+    ws = wb.create_sheet("Entries")
+    ws.append(header_row(ws, ["Part entries"]))
+    ws.append(header_row(ws, jarvis.all_fields))
+    for entry in entries:
+        ws.append([entry.get(field, "") for field in jarvis.all_fields])
+
+    # Calculation: part i on row i + 5 (= Entries row + 3), 90 columns (A:CL)
+    ws = wb.create_sheet("Calculation")
+    sheet_header(ws, "Calculation", 90, list(jarvis.section_titles), COST_CAPTIONS)
+    links = [(column_index_from_string(e), column_index_from_string(c))
+             for e, c in jarvis.entries_to_calculation.items()]
+    for i in range(1, n_parts + 1):
+        entry_row, calc_row = i + 2, i + 5
+        row = [None] * 90
+        for entry_col, calc_col in links:
+            row[calc_col - 1] = f"=Entries!{get_column_letter(entry_col)}{entry_row}"
+        for col, formula in _calc_formulas(calc_row).items():
+            row[column_index_from_string(col) - 1] = formula
+        ws.append(row)
+
+    # Tooling: row 6 holds the part being exported (A:AA from Entries, AB/AC from Calculation AP/AS),
+    # rows 8-48 the tool cost breakdown
+    ws = wb.create_sheet("Tooling")
+    sheet_header(ws, "Tooling", 40, ["Part", "Tool"])
+    first = entries[0] if entries else {}
+    row = [first.get(field, "") for field in jarvis.all_fields[:27]] + [None] * 13
+    row[27], row[28] = 0, 0
+    row[29] = "=ROUND(AB6*1.15,0)"                      # AD: tool cost with margin -> Calculation AQ
+    row[30] = "=IFERROR(ROUND(AD6/(F6*5),2),0)"        # AE: amortisation per part -> Calculation AR
+    ws.append(row)
+    ws.append([])
+    for r in range(8, 49):
+        share = round(1.0 / 41, 4)
+        ws.append([f"Tool item {r - 7}", share, f"=ROUND($AB$6*B{r},0)", f"=ROUND(C{r}*1.15,0)"])
+
+    # Summary: row 6 is filled from Entries at export, cost columns look the part up by Sl.#
+    ws = wb.create_sheet("Summary")
+    sheet_header(ws, "Summary", 39, ["Part", "Cost"])
+    cost_cols = [column_index_from_string(c) for c in ("AI", "AN", "AV", "BA", "BH", "AR", "BJ", "BL", "BN", "CL")]
+    row = [first.get(f, "") for f in ("Sl.#", "ZF Part Number", "Part Name", "No.off (per Vehicle)",
+                                      "Volume P.A Nos", "Rawmaterial")] + [None, None, None, None, None]
+    for k, col in enumerate(range(12, 40)):
+        calc_col = cost_cols[k % len(cost_cols)]
+        row.append(f"=IFERROR(VLOOKUP($A6,Calculation!$A:$CL,{calc_col},0),0)")
+    ws.append(row)
+
+    # Import: A2 is the Sl.# of the exported part, B2:AB2 pull its values from Calculation
+    ws = wb.create_sheet("Import")
+    ws.append(header_row(ws, ["Sl.#"] + [f"Field {c}" for c in range(2, 29)]))
+    import_cols = [3, 5, 2, 4, 6, 7, 8, 9, 10, 12] + cost_cols + [27, 28, 29, 45, 47, 49, 26]
+    ws.append([1] + [f"=VLOOKUP(A2,Calculation!A:CL,{c},0)" for c in import_cols[:27]])
+
+    # Master Data: made-up rate tables for the synthetic formulas above, padded to 110 x 18
+    ws = wb.create_sheet("Master Data")
+    materials = sorted(jarvis.injection_pressure_map)
+    material_rates = {name: 80 + (i * 7) % 150 for i, name in enumerate(materials)}
+    for r in range(1, 111):
+        row = [r * c for c in range(1, 19)]
+        if r == 1:
+            row[:9] = ["Material", "Pressure", "Rate/kg", None, "Machine", "Hour rate", None, "Labour", "Rate/h"]
+        else:
+            k = r - 2
+            row[0:3] = ([materials[k], jarvis.injection_pressure_map[materials[k]], material_rates[materials[k]]]
+                        if k < len(materials) else [None, None, None])
+            row[4:6] = ([jarvis.MACHINE_LADDER[k], 400 + jarvis.MACHINE_LADDER[k] // 2]
+                        if k < len(jarvis.MACHINE_LADDER) else [None, None])
+            labor = list(LABOR_RATES.items())
+            row[7:9] = list(labor[k]) if k < len(labor) else [None, None]
+        ws.append(row)
+
+    wb.save(path)
+    return path
+
+def template_for(n_parts, seed=0):
+    # Generated once per size and reused; delete bench_templates/ to regenerate
+    os.makedirs(TEMPLATE_DIR, exist_ok=True)
+    path = os.path.join(TEMPLATE_DIR, f"template_{n_parts}.xlsx")
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        make_template(path, n_parts, seed)
+        print(f"Generated {path} in {time.perf_counter() - start:.1f} s")
+    return path
+
+
+# Operations. Each runs in a fresh interpreter on a private copy of the template, so sidecar files
+# (part index, dependency graph, journal) and caches never leak from one measurement into the next.
+# setup() is not timed; op() is.
+def _middle_part(n_parts):
+    return f"ZF{max(1, n_parts // 2):07d}"
+
+def _ops(jarvis, n_parts, workdir):
+    from jarvis_core import base
+    zf = _middle_part(n_parts)
+    rng = random.Random(1)
+
+    def new_entries(count):
+        raw = [_synthetic_entry(n_parts + k + 1, rng, jarvis) for k in range(count)]
+        return [jarvis.parse_entry({f: str(v) for f, v in e.items()}) for e in raw]
+
+    def write_import_file(count):
+        path = os.path.join(workdir, "import.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(new_entries(count), f)
+        return path
+
+    state = {}
+    return {
+        "load_template": (None, lambda: jarvis.get_workbook(base.EXCEL_TEMPLATE)),
+        "build_index": (None, lambda: jarvis.build_part_index(base.EXCEL_TEMPLATE)),
+        "exists_hit": (None, lambda: jarvis.part_already_exists(zf)),
+        "exists_miss": (None, lambda: jarvis.part_already_exists("NOT-A-PART")),
+        "exists_indexed": (lambda: jarvis.build_part_index(base.EXCEL_TEMPLATE),
+                           lambda: jarvis.part_already_exists(zf)),
+        "update_tooling": (lambda: state.update(wb=jarvis.get_workbook(base.EXCEL_TEMPLATE)),
+                           lambda: jarvis.update_tooling_by_zf_part_number(state["wb"], zf)),
+        "save_entry": (lambda: state.update(entry=new_entries(1)[0]),
+                       lambda: jarvis.save_entry(state["entry"])),
+        "import_100": (lambda: state.update(path=write_import_file(100)),
+                       lambda: jarvis.import_entries(state["path"])),
+        "export_with": (None, lambda: jarvis.export_part(zf, "with", workdir)),
+        "export_values": (None, lambda: jarvis.export_part(zf, "without", workdir)),
+        "export_xml_with": (None, lambda: jarvis.export_xml(zf, "with", workdir)),
+        "export_xml_values": (None, lambda: jarvis.export_xml(zf, "without", workdir)),
+        "export_pruned": (None, lambda: jarvis.export_part(zf, "with", workdir, prune=True)),
+        "export_xml_pruned": (None, lambda: jarvis.export_xml(zf, "with", workdir, prune=True)),
+        "export_warm": (lambda: jarvis.export_part(zf, "with", workdir),
+                        lambda: jarvis.export_part(_middle_part(n_parts // 2 or 1), "with", workdir)),
+        "machines": (lambda: jarvis.get_workbook(base.EXCEL_TEMPLATE, data_only=True),
+                     lambda: jarvis.machine_allocation()),
+        "costs": (None, lambda: jarvis.cost_rollup()),
+        "costs_whatif": (lambda: jarvis.cost_rollup(),
+                         lambda: jarvis.cost_rollup({"Scrap cost/Kg (INR)": 12.5})),
+        "optimize": (lambda: state.update(entry=jarvis.part_entry(zf)),
+                     lambda: jarvis.optimize_design(state["entry"])),
+        # Synthetic rows carry the old whole-column VLOOKUPs; recalc_migrated measures them rewritten
+        "recalc": (None, lambda: jarvis.recalc_cost()),
+        "recalc_migrated": (lambda: jarvis.migrate_formulas(), lambda: jarvis.recalc_cost()),
+    }
+
+OPERATIONS = ["load_template", "build_index", "exists_hit", "exists_miss", "exists_indexed", "update_tooling",
+              "save_entry", "import_100", "export_with", "export_values", "export_xml_with", "export_xml_values",
+              "export_pruned", "export_xml_pruned", "export_warm", "machines",
+              "costs", "costs_whatif", "optimize", "recalc", "recalc_migrated"]
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def _run_child(op, template, n_parts):
+    import jarvis
+    from jarvis_core import base
+    workdir = tempfile.mkdtemp(prefix="jarvis-bench-")
+    try:
+        base.EXCEL_TEMPLATE = shutil.copy(template, os.path.join(workdir, "template.xlsx"))
+        setup, run = _ops(jarvis, n_parts, workdir)[op]
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(json.dumps({"seconds": elapsed, "peak_mb": _peak_rss_mb()}))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def measure(op, n_parts, repeat=1):
+    # Best wall time of `repeat` fresh processes; peak RSS of that same run
+    template = template_for(n_parts)
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_child", op, template, str(n_parts)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # Returns "op@parts: what" lines for every measurement that got worse than the baseline allows
+    regressions = []
+    for key, now in results.items():
+        before = baseline.get(key)
+        if not before or "error" in now or "error" in before:
+            continue
+        if now["seconds"] * 1000 > before["seconds"] * 1000 * (1 + tolerance) + NOISE_FLOOR_MS:
+            regressions.append(f"{key}: {before['seconds']:.3f} s -> {now['seconds']:.3f} s")
+        if (now.get("peak_mb") and before.get("peak_mb")
+                and now["peak_mb"] > before["peak_mb"] * (1 + tolerance) + NOISE_FLOOR_MB):
+            regressions.append(f"{key}: {before['peak_mb']:.0f} MB -> {now['peak_mb']:.0f} MB peak")
+    return regressions
+
+def run_benchmarks(sizes, ops, repeat=1, baseline_path=BASELINE_FILE, save_baseline=False,
+                   output=RESULTS_FILE, tolerance=REGRESSION_TOLERANCE):
+    results = {}
+    print(f"{'operation':<16}{'parts':>8}{'seconds':>10}{'peak MB':>10}")
+    for n_parts in sizes:
+        for op in ops:
+            result = measure(op, n_parts, repeat)
+            results[f"{op}@{n_parts}"] = result
+            if "error" in result:
+                print(f"{op:<16}{n_parts:>8}  ERROR {result['error']}")
+            else:
+                peak = f"{result['peak_mb']:.0f}" if result.get("peak_mb") else "-"
+                print(f"{op:<16}{n_parts:>8}{result['seconds']:>10.3f}{peak:>10}")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    if save_baseline:
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; rerun with --save-baseline to record one")
+        return 0
+    with open(baseline_path, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print("OK" if not regressions else f"{len(regressions)} regressions")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench", description="jarvis.py benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_startup = sub.add_parser("startup", help="Check the import-time budget")
+    p_startup.add_argument("--runs", type=int, default=5)
+
+    p_make = sub.add_parser("make-template", help="Write a synthetic template")
+    p_make.add_argument("--parts", type=int, required=True)
+    p_make.add_argument("--out", help="Output path (default: bench_templates/template_<parts>.xlsx)")
+    p_make.add_argument("--seed", type=int, default=0)
+
+    p_run = sub.add_parser("run", help="Time operations and compare with the baseline")
+    p_run.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    p_run.add_argument("--ops", nargs="+", choices=OPERATIONS, default=OPERATIONS)
+    p_run.add_argument("--repeat", type=int, default=1, help="Fresh runs per measurement, best is kept")
+    p_run.add_argument("--baseline", default=BASELINE_FILE)
+    p_run.add_argument("--save-baseline", action="store_true", help="Record these results as the baseline")
+    p_run.add_argument("--output", default=RESULTS_FILE)
+    p_run.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+
+    p_child = sub.add_parser("_child")
+    p_child.add_argument("op")
+    p_child.add_argument("template")
+    p_child.add_argument("parts", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        return check_startup(args.runs)
+    if args.command == "make-template":
+        start = time.perf_counter()
+        if args.out:
+            make_template(args.out, args.parts, args.seed)
+        path = args.out or template_for(args.parts, args.seed)
+        print(f"{path}: {args.parts} parts in {time.perf_counter() - start:.1f} s")
+        return 0
+    if args.command == "run":
+        return run_benchmarks(args.sizes, args.ops, args.repeat, args.baseline, args.save_baseline,
+                              args.output, args.tolerance)
+    if args.command == "_child":
+        _run_child(args.op, args.template, args.parts)
+        return 0
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,638 +1,208 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Alignment
-from copy import copy
+import atexit
 import os
 import platform
-from openpyxl.styles import Font
-from openpyxl.utils import get_column_letter
-
-
-# Print both current working directory and script directory for comparison
-print('Current working directory:', os.getcwd())
-
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-print('Script directory:', BASE_DIR)
-
-# Use the script directory to ensure the Excel template is found
-EXCEL_TEMPLATE = os.path.join(BASE_DIR, "Standard_Template_new.xlsx")
-print('Excel template path:', EXCEL_TEMPLATE)
-
-# Injection pressure mapping
-injection_pressure_map = {
-    "ABS UV": 700, "ABS Non UV": 700, "PP T20": 650, "PC Clear": 900,
-    "POM": 800, "PC Amber": 850, "PC black": 850, "PMMA Clear": 780,
-    "PMMA Red": 780, "PP+EPDM": 720, "PA66": 950, "EPDM": 750, "PP": 650,
-    "PC ABS": 820, "PP EPDM": 700, "PP HD": 670, "PA6": 940,
-    "PA66 GF30": 1000, "PA66 GF15": 980, "PA66 GF25": 990,
-    "PP GF20": 950, "PP GF10": 900, "PA6 GF30": 990, "PA6 GF15": 970,
-    "PA6 GF25": 980, "PP/PE-T16": 720, "PP EPDM TD10": 710,
-    "SEBS": 680, "HDPE": 650, "PE": 640
-}
-
-# Dropdowns
-dropdowns = {
-    "In-house/Purchase": ["In-House", "Purchase"],
-    "Rawmaterial": list(injection_pressure_map.keys()),
-    "No. of cavities -X direction": ["1", "2", "4", "6", "8", "12", "16"],
-    "No. of cavities -Y direction": ["1", "2", "4", "6", "8", "12", "16"],
-    "Grain requirement": ["Y", "N"],
-    "HRS Type": ["0", "1", "2", "3"],
-    "No.of drop": [str(i) for i in range(1, 13)],
-    "X Direction Slider": ["Y", "N"],
-    "Y Direction Slider": ["Y", "N"],
-    "No.of Sliders/Cavity": [str(i) for i in range(12)],
-    "No.of Lifters/cavity": [str(i) for i in range(12)],
-    "No.of Bosses /cavity": [str(i) for i in range(12)],
-    "No.of Ejector pads/ cavity": [str(i) for i in range(12)],
-    "Projected Area %": ["50%", "55%", "60%", "70%", "75%", "80%", "85%", "90%", "100%"],
-    "Process": ["Injection moulding", "Blow moulding", "Assy", "BOP"],
-    "M/c selected": [str(i) for i in [60, 90, 120, 160, 200, 220, 250, 260, 280, 320, 380,
-                                      470, 530, 600, 700, 800, 900, 1000, 1200, 1300, 1400,
-                                      1600, 1850, 2100, 2400, 2800, 3300, 4000]],
-    "Labor Type (Machine)": ["Skilled", "Semi skilled", "Unskilled"],
-    "Labor Type (Setup)": ["Skilled", "Semi skilled", "Unskilled"]
-}
-
-fields = [
-    "In-house/Purchase", "ZF Part Number", "Part No", "Part Name", "Volume P.A Nos",
-    "No.off (per Vehicle)", "Rawmaterial", "L(mm)", "W(mm)", "H(mm)", "T(mm)",
-    "No. of cavities -X direction", "No. of cavities -Y direction", "Grain requirement",
-    "HRS Type", "No.of drop", "X Direction Slider", "Y Direction Slider",
-    "No.of Sliders/Cavity", "No.of Lifters/cavity", "No.of Bosses /cavity",
-    "No.of Ejector pads/ cavity", "Projected Area %", "Injection Pressure", "Total Projected Area", "Finish wt.( Kgs)",
-    "Scrap cost/Kg (INR)", "Bop Parts", "Qty (Nos)", "Cost /part (INR)", "Process", "M/c selected", "Machine Cycle time (sec)",
-    "Labor Type (Machine)", "Operator /machine", "Labor Type (Setup)", "No.of operator", "Time/Lot (min)"
-]
-
-all_fields = ["Sl.#"] + [f for f in fields if f != "Injection Pressure"]
-
-numeric_fields = {
-    "L(mm)": float, "W(mm)": float, "H(mm)": float, "T(mm)": float,
-    "Volume P.A Nos": int, "No.off (per Vehicle)": int,
-    "No. of cavities -X direction": int, "No. of cavities -Y direction": int, "HRS Type": int,
-    "No.of drop": int, "No.of Sliders/Cavity": int, "No.of Lifters/cavity": int,
-    "No.of Bosses /cavity": int, "No.of Ejector pads/ cavity": int,
-    "Finish wt.( Kgs)": float, "Scrap cost/Kg (INR)": float, "Bop Parts": float,
-    "Qty (Nos)": int, "Cost /part (INR)": float, "M/c selected": int, "Machine Cycle time (sec)": float,
-    "Operator /machine": int, "No.of operator": int, "Time/Lot (min)": float
-}
-
-section_titles = {
-    "Raw material cost": ["Finish wt.( Kgs)", "Scrap cost/Kg (INR)"],
-    "BOP parts cost": ["Bop Parts", "Qty (Nos)", "Cost /part (INR)"],
-    "Machine cost": ["Process", "M/c selected", "Machine Cycle time (sec)"],
-    "Labor Cost": ["Labor Type (Machine)", "Operator /machine"],
-    "Setting-up cost": ["Labor Type (Setup)", "No.of operator", "Time/Lot (min)"],
-}
+import queue
+import subprocess
+import sys
+import threading
+
+# Tk front end and entry point: `python jarvis.py` opens the mode window, `python jarvis.py <command>` (or
+# `python -m jarvis`) runs the command line. The work is done by the headless jarvis_core package; its public
+# API is re-exported here so scripts can keep using jarvis.export_part() and friends. The settings live on
+# jarvis_core.base (base.EXCEL_TEMPLATE, base.DB_PATH) and jarvis_core.export (EXPORT_ENGINE).
+from jarvis_core import base
+from jarvis_core.base import (SHEET_SCHEMA, CostModelError, ExportError, JarvisError, JobCancelled, PartNotFoundError,
+                              SaveError, TemplateError, ValidationError, all_fields, compile_schema, dropdowns,
+                              entries_to_calculation, fields, get_section, injection_pressure_map, log,
+                              numeric_fields, section_titles, sheet_schema, span)
+from jarvis_core.workbook import (build_part_index, find_entry_row, get_workbook, invalidate_workbook_cache,
+                                  lookup_part, stream_entries, stream_sheet)
+from jarvis_core.formulas import (ExcelError, FormulaError, FormulaEvaluator, build_dependency_graph,
+                                  compile_formula, dirty_cells, format_recalc_cost, get_dependency_graph,
+                                  recalc_cost)
+from jarvis_core.entries import parse_entry, validate_entries
+from jarvis_core.lock import TemplateLock
+from jarvis_core.store import (check_store_roundtrip, migrate_to_store, render_template, search_parts,
+                               store_has_part, store_rows, store_save_entries, store_search)
+from jarvis_core.journal import (JOURNAL_FLUSH_SECONDS, flush_journal, format_import_report, import_entries,
+                                 journal_entry, list_parts, migrate_formulas, part_already_exists,
+                                 pending_journal_entries, read_entry_rows, save_entries, save_entry, sync_template)
+from jarvis_core.export import (ExportOverlay, export_batch, export_logic, export_part, export_portfolio, export_xml,
+                                format_batch_report, portfolio_logic, pruned_row_maps, read_part_numbers,
+                                update_tooling_by_zf_part_number)
+from jarvis_core.costs import (DESIGN_FIELDS, MACHINE_LADDER, apply_machine_allocation, check_cost_rollup,
+                               compute_results, cost_model, cost_rollup, format_cost_report, format_design_report,
+                               format_machine_report, machine_allocation, optimize_design, part_entry, part_results,
+                               validate_cost_model, write_cost_report, write_machine_report)
+from jarvis_core.cli import build_arg_parser, main
+
+# tkinter is imported on first use so command line runs don't pay for it; _load_gui() binds these names
+tk = ttk = messagebox = simpledialog = filedialog = None
+
+def _load_gui():
+    global tk, ttk, messagebox, simpledialog, filedialog
+    if tk is None:
+        import tkinter as tk
+        from tkinter import ttk, messagebox, simpledialog, filedialog
+
+def _load_openpyxl():
+    # Only imports openpyxl; each jarvis_core module binds the names it uses on first use, which is then cheap
+    import openpyxl
 
 export_mode = None
 
-def get_section(field):
-    for section, items in section_titles.items():
-        if field in items:
-            return section
-    return None
-
-def update_tooling_by_zf_part_number(wb, zf_part):
-    try:
-        entries_ws = wb["Entries"]
-        tooling_ws = wb["Tooling"]
-        calculation_ws = wb["Calculation"]
-
-        found_entries_row = None
-        found_calc_row = None
-        
-        # Find the correct row in Entries sheet
-        for row in range(3, entries_ws.max_row + 1):
-            cell_val = entries_ws.cell(row=row, column=3).value  # Column C = ZF Part Number
-            if cell_val and str(cell_val).strip().lower() == zf_part.strip().lower():
-                found_entries_row = row
-                print(f"Tooling update: Found ZF Part '{zf_part}' in Entries at row {found_entries_row}")
-                break
-
-        if not found_entries_row:
-            messagebox.showerror("Not Found", f"ZF Part Number '{zf_part}' not found in Entries sheet.")
-            return False
-
-        # Find the correct row in Calculation sheet
-        for row in range(6, calculation_ws.max_row + 1):
-            cell_val = calculation_ws.cell(row=row, column=3).value  # Column C = ZF Part Number
-            if cell_val and str(cell_val).strip().lower() == zf_part.strip().lower():
-                found_calc_row = row
-                print(f"Tooling update: Found ZF Part '{zf_part}' in Calculation at row {found_calc_row}")
-                break
-
-        # Copy data from found entries row to tooling row 6 (columns A to AA)
-        for col in range(1, 28):  # A to AA
-            tooling_ws.cell(row=6, column=col).value = entries_ws.cell(row=found_entries_row, column=col).value
-        
-        print(f"Tooling update: Copied data from Entries row {found_entries_row} to Tooling row 6")
-        
-        # Verify the part name was copied correctly
-        part_name_tooling = tooling_ws.cell(row=6, column=4).value  # Column D = Part Name
-        print(f"Tooling update: Part name in tooling sheet is now: {part_name_tooling}")
-
-        # Copy calculation data if found (AP (42) → AB (28), AS (45) → AC (29))
-        if found_calc_row:
-            tooling_ws.cell(row=6, column=28).value = calculation_ws.cell(row=found_calc_row, column=42).value
-            tooling_ws.cell(row=6, column=29).value = calculation_ws.cell(row=found_calc_row, column=45).value
-
-        return True
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to update tooling sheet.\n{e}")
-        return False
-
-def export_with_formulas(zf_part):
-    try:
-        print(f">>> Starting export WITH formulas for: {zf_part}")
-        wb = load_workbook(EXCEL_TEMPLATE, data_only=False)
-        if export_logic(wb, zf_part, export_type="with"):
-            print("✅ Export with formulas completed successfully")
-    except Exception as e:
-        messagebox.showerror("Export Error", str(e))
-        print("❌ Export with formulas failed:", e)
-
-def export_without_formulas(zf_part):
-    try:
-        print(f">>> Starting export WITHOUT formulas for: {zf_part}")
-        wb = load_workbook(EXCEL_TEMPLATE, data_only=True)
-        if export_logic(wb, zf_part, export_type="without"):
-            print("✅ Export without formulas completed successfully")
-    except Exception as e:
-        messagebox.showerror("Export Error", str(e))
-        print("❌ Export without formulas failed:", e)
-
+def open_file(path):
+    # No shell: export file names come from typed part numbers
+    if platform.system() == "Windows":
+        os.startfile(path)
+    elif platform.system() == "Darwin":
+        subprocess.Popen(["open", path])
+    else:
+        subprocess.Popen(["xdg-open", path])
 
-def export_logic(wb, zf_part, export_type="with"):
-    export_wb = Workbook()
-    export_wb.remove(export_wb.active)
+def _export_in_background(zf_part, export_type):
+    def done(export_filename):
+        messagebox.showinfo("Success", f"Exported to '{export_filename}'")
+        open_file(export_filename)
 
-    # Debug: Print all available sheet names
-    print(f"Available sheets in workbook: {wb.sheetnames}")
+    def failed(e):
+        if not isinstance(e, JobCancelled):
+            messagebox.showerror("Export Error", str(e))
 
-    calc_ws = wb["Calculation"]
-    tooling_ws = wb["Tooling"]
-    summary_ws = wb["Summary"] if "Summary" in wb.sheetnames else None
+    what = "with formulas" if export_type == "with" else "values only"
+    submit_job(f"Export {zf_part} ({what})",
+               lambda progress: export_part(zf_part, export_type=export_type, progress=progress),
+               on_done=done, on_error=failed)
 
-    found_row = None
-    found_entries_row = None
+def export_with_formulas(zf_part):
+    _export_in_background(zf_part, "with")
 
-    # 🟡 STEP 1: Find row by ZF Part Number in Calculation sheet
-    for row in range(6, calc_ws.max_row + 1):
-        val = calc_ws[f"C{row}"].value
-        if val and str(val).strip().lower() == zf_part.strip().lower():
-            found_row = row
-            print(f"Found ZF Part '{zf_part}' in Calculation sheet at row {found_row}")
-            break
+def export_without_formulas(zf_part):
+    _export_in_background(zf_part, "without")
+
+# Background jobs for the Tk windows: exports, flushes and imports run one at a time on a worker
+# thread in the order they were asked for; the Tk loop polls events so the windows never freeze
+_job_queue = queue.Queue()
+_job_events = queue.Queue()
+_job_cancel = threading.Event()
+_job_worker = None
+
+def submit_job(label, func, on_done=None, on_error=None, quiet=False):
+    # func(progress) runs on the worker thread; on_done(result) / on_error(exc) run on the Tk thread.
+    # Quiet jobs (the periodic journal flush) don't open the progress window
+    global _job_worker
+    _job_queue.put((label, func, on_done, on_error, quiet))
+    if _job_worker is None or not _job_worker.is_alive():
+        _job_worker = threading.Thread(target=_run_jobs, name="jarvis-jobs", daemon=True)
+        _job_worker.start()
+
+def cancel_current_job():
+    _job_cancel.set()
+
+def _run_jobs():
+    while True:
+        label, func, on_done, on_error, quiet = _job_queue.get()
+        _job_cancel.clear()
+        _job_events.put(("start", label, quiet))
+
+        def progress(done, total, text=""):
+            if _job_cancel.is_set():
+                raise JobCancelled(f"{label} cancelled")
+            _job_events.put(("progress", label, (done, total, text)))
 
-    if not found_row and export_type == "with":
         try:
-            temp_wb = load_workbook(EXCEL_TEMPLATE, data_only=True)
-            temp_calc = temp_wb["Calculation"]
-            for row in range(6, temp_calc.max_row + 1):
-                val = temp_calc[f"C{row}"].value
-                if val and str(val).strip().lower() == zf_part.strip().lower():
-                    found_row = row
-                    print(f"Fallback: Found ZF Part '{zf_part}' in Calculation sheet at row {found_row}")
-                    break
+            event = ("done", label, (on_done, func(progress)))
         except Exception as e:
-            messagebox.showerror("Lookup Error", f"Fallback lookup failed:\n{str(e)}")
-            return False
-
-    if not found_row:
-        messagebox.showerror("Not Found", f"ZF Part Number '{zf_part}' not found in Calculation sheet.")
-        return False
-
-    # 🟡 STEP 2: Find corresponding row in Entries sheet
-    entries_ws = wb["Entries"] if "Entries" in wb.sheetnames else None
-    if entries_ws:
-        for row in range(3, entries_ws.max_row + 1):
-            val = entries_ws[f"C{row}"].value
-            if val and str(val).strip().lower() == zf_part.strip().lower():
-                found_entries_row = row
-                print(f"Found ZF Part '{zf_part}' in Entries sheet at row {found_entries_row}")
-                break
-
-    # 🟡 STEP 3: Update tooling sheet with correct data BEFORE export
-    if found_entries_row and not update_tooling_by_zf_part_number(wb, zf_part):
-        return False
-
-    # 🟡 STEP 3.5: Update Summary sheet with the same data as Tooling
-    if found_entries_row and summary_ws:
+            log(f"{label} failed: {e}", "error", job=label)
+            event = ("error", label, (on_error, e))
+        # Marked finished before the event is seen, so the Tk side knows whether more jobs are waiting
+        _job_queue.task_done()
+        _job_events.put(event)
+
+_progress_widgets = {}
+
+def _show_progress(label):
+    win = _progress_widgets.get("window")
+    if win is None or not win.winfo_exists():
+        win = tk.Toplevel()
+        win.title("Working")
+        win.geometry("360x140")
+        win.protocol("WM_DELETE_WINDOW", cancel_current_job)
+        _progress_widgets["label"] = tk.Label(win, anchor="w")
+        _progress_widgets["label"].pack(fill="x", padx=10, pady=(10, 0))
+        _progress_widgets["bar"] = ttk.Progressbar(win, maximum=100, length=340)
+        _progress_widgets["bar"].pack(padx=10, pady=5)
+        _progress_widgets["detail"] = tk.Label(win, anchor="w")
+        _progress_widgets["detail"].pack(fill="x", padx=10)
+        tk.Button(win, text="Cancel", command=cancel_current_job).pack(pady=5)
+        _progress_widgets["window"] = win
+    _progress_widgets["label"].config(text=label)
+    _progress_widgets["bar"]["value"] = 0
+    _update_progress_detail("")
+
+def _update_progress_detail(text):
+    waiting = _job_queue.unfinished_tasks - 1
+    suffix = f"  ({waiting} more queued)" if waiting > 0 else ""
+    _progress_widgets["detail"].config(text=text + suffix)
+
+def poll_jobs(root):
+    while True:
         try:
-            print(f"Updating Summary sheet with data from Entries row {found_entries_row}")
-            
-            # Instead of copying from Tooling, let's copy directly from Entries with proper column mapping for Summary
-            entries_ws_ref = wb["Entries"]
-            
-            # Define the correct column mapping for Summary sheet
-            # Map from Entries columns to Summary columns based on actual column headers
-            summary_column_mapping = {
-                # Entries -> Summary mapping
-                1: 1,   # Sl.# (Entries A) -> Sl.# (Summary A)
-                3: 2,   # ZF Part Number (Entries C) -> ZF Part Number (Summary B)
-                5: 3,   # Part Name (Entries E) -> Part Name (Summary C)
-                7: 4,   # No.off (per Vehicle) (Entries G) -> No.off (per Vehicle) (Summary D)
-                6: 5,   # Volume P.A Nos (Entries F) -> Volume P.A Nos (Summary E)
-                8: 6,   # Rawmaterial (Entries H) -> Rawmaterial (Summary F)
-                # Part Size not in Entries, will be calculated/set separately
-                10: 8,  # W(mm) (Entries J) -> W(mm) (Summary H)
-                11: 9,  # H(mm) (Entries K) -> H(mm) (Summary I)
-                12: 10, # T(mm) (Entries L) -> T(mm) (Summary J)
-                # Number of Cavity = X direction * Y direction cavities from Entries
-                # Will be calculated separately
-                # Other fields like costs will be calculated by the application logic
-            }
-            
-            # Special calculation fields that need to be computed
-            # Number of Cavity = X direction * Y direction
-            x_cavities = entries_ws_ref.cell(row=found_entries_row, column=13).value or 1  # No. of cavities -X direction
-            y_cavities = entries_ws_ref.cell(row=found_entries_row, column=14).value or 1  # No. of cavities -Y direction
-            total_cavities = int(x_cavities) * int(y_cavities)
-            summary_ws.cell(row=6, column=11).value = total_cavities  # Number of Cavity Nos
-            
-            # Part Size calculation (L x W x H from Entries)
-            l_mm = entries_ws_ref.cell(row=found_entries_row, column=9).value or 0   # L(mm)
-            w_mm = entries_ws_ref.cell(row=found_entries_row, column=10).value or 0  # W(mm) 
-            h_mm = entries_ws_ref.cell(row=found_entries_row, column=11).value or 0  # H(mm)
-            if l_mm and w_mm and h_mm:
-                part_size = f"{l_mm} x {w_mm} x {h_mm}"
-                summary_ws.cell(row=6, column=7).value = part_size  # Part Size (As per tooling direction)
-            
-            # Copy data using the correct column mapping
-            for entries_col, summary_col in summary_column_mapping.items():
-                summary_ws.cell(row=6, column=summary_col).value = entries_ws_ref.cell(row=found_entries_row, column=entries_col).value
-            
-            print("Summary sheet updated with data from Entries using correct column mapping")
-            
-            # Verify the data was copied correctly - checking actual Summary sheet columns
-            sl_no_summary = summary_ws.cell(row=6, column=1).value      # Column A = Sl.#
-            zf_part_summary = summary_ws.cell(row=6, column=2).value    # Column B = ZF Part Number  
-            part_name_summary = summary_ws.cell(row=6, column=3).value  # Column C = Part Name
-            no_off_summary = summary_ws.cell(row=6, column=4).value     # Column D = No.off (per Vehicle)
-            volume_summary = summary_ws.cell(row=6, column=5).value     # Column E = Volume P.A Nos
-            rawmaterial_summary = summary_ws.cell(row=6, column=6).value # Column F = Rawmaterial
-            part_size_summary = summary_ws.cell(row=6, column=7).value  # Column G = Part Size
-            w_mm_summary = summary_ws.cell(row=6, column=8).value       # Column H = W(mm)
-            h_mm_summary = summary_ws.cell(row=6, column=9).value       # Column I = H(mm)
-            t_mm_summary = summary_ws.cell(row=6, column=10).value      # Column J = T(mm)
-            cavities_summary = summary_ws.cell(row=6, column=11).value  # Column K = Number of Cavity Nos
-            
-            print(f"Summary sheet verification:")
-            print(f"  Sl.#: {sl_no_summary}")
-            print(f"  ZF Part Number: {zf_part_summary}")
-            print(f"  Part Name: {part_name_summary}")
-            print(f"  No.off (per Vehicle): {no_off_summary}")
-            print(f"  Volume P.A Nos: {volume_summary}")
-            print(f"  Rawmaterial: {rawmaterial_summary}")
-            print(f"  Part Size: {part_size_summary}")
-            print(f"  W(mm): {w_mm_summary}")
-            print(f"  H(mm): {h_mm_summary}")
-            print(f"  T(mm): {t_mm_summary}")
-            print(f"  Number of Cavity Nos: {cavities_summary}")
-            
-        except Exception as e:
-            print(f"Warning: Failed to update Summary sheet: {e}")
-
-    # Refresh the tooling worksheet reference after update
-    tooling_ws = wb["Tooling"]
-    
-    # Get the updated tooling values and copy to calculation
-    calc_ws[f"AQ{found_row}"] = tooling_ws["AD6"].value
-    calc_ws[f"AR{found_row}"] = tooling_ws["AE6"].value
-
-    # Find corresponding summary row (after we updated it to row 6)
-    found_summary_row = 6  # We always update Summary at row 6, same as Tooling
-    if summary_ws:
-        print(f"Using Summary sheet row 6 (updated with current part data)")
-    else:
-        print("Warning: Summary sheet not found, using calculation row number")
-        found_summary_row = found_row
-
-    sheet_rows = {"Calculation": found_row, "Tooling": 6, "Summary": found_summary_row}
-    sheet_headers = {"Calculation": [3, 4, 5], "Tooling": [3, 4, 5], "Summary": [3, 4, 5]}
-    sheet_col_limits = {
-        "Calculation": 90,
-        "Tooling": 40,
-        "Summary": 39,
-        "Import": 28,
-        "Master Data": 18,
-        "Entries": 38
-    }
-    
-    print(f"Export data rows: Calculation={found_row}, Tooling=6, Summary={found_summary_row}")
-    
-    # Debug: Show what's in Summary row 6 after our update
-    if summary_ws and found_summary_row == 6:
-        sl_no_summary = summary_ws.cell(row=6, column=1).value      # Column A = Sl.#
-        zf_part_summary = summary_ws.cell(row=6, column=2).value    # Column B = ZF Part Number  
-        part_name_summary = summary_ws.cell(row=6, column=3).value  # Column C = Part Name
-        no_off_summary = summary_ws.cell(row=6, column=4).value     # Column D = No.off (per Vehicle)
-        print(f"Final Summary verification - Sl.#: {sl_no_summary}, ZF Part: {zf_part_summary}, Part Name: {part_name_summary}, No.off: {no_off_summary}")
-
-    for sheet_name in ["Calculation", "Tooling", "Summary", "Master Data", "Entries", "Import"]:
-        # Check if the sheet exists before trying to access it
-        if sheet_name not in wb.sheetnames:
-            print(f"Warning: Sheet '{sheet_name}' not found in workbook, skipping...")
-            continue
-            
-        source = wb[sheet_name]
-        target = export_wb.create_sheet(sheet_name)
-        # Hide Master Data and Entries sheets in exported file
-        if sheet_name in ["Master Data", "Entries"]:
-            target.sheet_state = 'hidden'
-
-        if sheet_name == "Master Data":
-            for row in range(1, 111):  # Rows 1 to 110
-                for col in range(1, 19):  # Columns A to R
-                    cell = source.cell(row=row, column=col)
-                    tgt = target.cell(row=row, column=col, value=cell.value)
-                    if cell.has_style:
-                        tgt.font = copy(cell.font)
-                        tgt.border = copy(cell.border)
-                        tgt.fill = copy(cell.fill)
-                        tgt.number_format = copy(cell.number_format)
-                        tgt.protection = copy(cell.protection)
-                        tgt.alignment = copy(cell.alignment)
-            for col_idx in range(1, 19):
-                col_letter = get_column_letter(col_idx)
-                if col_letter in source.column_dimensions:
-                    target.column_dimensions[col_letter].width = source.column_dimensions[col_letter].width
-            for m in source.merged_cells.ranges:
-                target.merge_cells(str(m))
-            continue
-
-        elif sheet_name == "Entries":
-            for row in source.iter_rows(min_row=1, max_row=source.max_row, min_col=1, max_col=38):
-                for cell in row:
-                    tgt = target.cell(row=cell.row, column=cell.column, value=cell.value)
-                    if cell.has_style:
-                        tgt.font = copy(cell.font)
-                        tgt.border = copy(cell.border)
-                        tgt.fill = copy(cell.fill)
-                        tgt.number_format = copy(cell.number_format)
-                        tgt.protection = copy(cell.protection)
-                        tgt.alignment = copy(cell.alignment)
-            for col_idx in range(1, 39):
-                col_letter = get_column_letter(col_idx)
-                if col_letter in source.column_dimensions:
-                    target.column_dimensions[col_letter].width = source.column_dimensions[col_letter].width
-            for m in source.merged_cells.ranges:
-                target.merge_cells(str(m))
-            continue
-
-        elif sheet_name == "Import":
-            # For Import sheet, we always need to preserve formulas so they can reference the updated Sl.#
-            # Load the source with formulas preserved regardless of export_type
-            if export_type == "without":
-                # For "without formulas" export, we need to temporarily load with formulas preserved
-                # to ensure VLOOKUP formulas work with the updated Sl.#, then evaluate them
-                temp_wb = load_workbook(EXCEL_TEMPLATE, data_only=False)
-                temp_source = temp_wb["Import"]
-            else:
-                temp_source = source
-            
-            # Copy all rows and columns to preserve formulas and structure
-            for row in temp_source.iter_rows(min_row=1, max_row=temp_source.max_row, min_col=1, max_col=28):
-                for cell in row:
-                    tgt = target.cell(row=cell.row, column=cell.column)
-                    
-                    # For cell A2 (Sl.#), set the correct Sl.# for the requested part
-                    if cell.row == 2 and cell.column == 1:
-                        # Find the Sl.# from the Entries sheet for the requested ZF part
-                        if found_entries_row:
-                            entries_sl_no = entries_ws.cell(row=found_entries_row, column=1).value  # Sl.# from Entries
-                            print(f"Import sheet: Setting Sl.# to {entries_sl_no} for ZF Part '{zf_part}'")
-                            tgt.value = entries_sl_no
-                        else:
-                            tgt.value = cell.value
-                    else:
-                        # Copy the original value (formulas will reference the updated A2)
-                        if export_type == "with":
-                            # Keep formulas for "with formulas" export
-                            tgt.value = cell.value
-                        else:
-                            # For "without formulas" export, check if it's a formula
-                            if cell.value and isinstance(cell.value, str) and cell.value.startswith('='):
-                                # For VLOOKUP formulas, keep the formula so it can be evaluated with the new Sl.#
-                                # The formula will be evaluated when the file is saved/opened
-                                tgt.value = cell.value
-                            else:
-                                # For non-formula cells, copy the value directly
-                                tgt.value = cell.value
-                    
-                    # Copy cell styling
-                    if cell.has_style:
-                        tgt.font = copy(cell.font)
-                        tgt.border = copy(cell.border)
-                        tgt.fill = copy(cell.fill)
-                        tgt.number_format = copy(cell.number_format)
-                        tgt.protection = copy(cell.protection)
-                        tgt.alignment = copy(cell.alignment)
-            
-            # Close temporary workbook if we created one
-            if export_type == "without":
-                temp_wb.close()
-            
-            # Copy column widths
-            for col_idx in range(1, 29):
-                col_letter = get_column_letter(col_idx)
-                if col_letter in source.column_dimensions:
-                    target.column_dimensions[col_letter].width = source.column_dimensions[col_letter].width
-            
-            # Copy merged cells
-            for m in source.merged_cells.ranges:
-                target.merge_cells(str(m))
-            
-            # Debug: Verify Import sheet data after update
-            if found_entries_row:
-                import_sl_no = target.cell(row=2, column=1).value
-                print(f"Import sheet verification:")
-                print(f"  Sl.# in A2: {import_sl_no}")
-                print(f"  This should match the Sl.# from Entries row {found_entries_row}")
-                print(f"  Import sheet formulas will now reference this Sl.# to pull correct data from Calculation sheet")
-                
-                # Verify some key formulas are preserved
-                b2_formula = target.cell(row=2, column=2).value
-                f2_formula = target.cell(row=2, column=6).value
-                j2_formula = target.cell(row=2, column=10).value
-                print(f"  Key formulas preserved:")
-                print(f"    B2 (Part Number): {b2_formula}")
-                print(f"    F2 (Part Name): {f2_formula}")
-                print(f"    J2 (Quantity): {j2_formula}")
-            continue
-
-        # ✅ Logic for Calculation, Tooling, Summary (one row + headers)
-        max_col = sheet_col_limits[sheet_name]
-        data_row = sheet_rows[sheet_name]
-        
-        print(f"Processing sheet '{sheet_name}': copying data from row {data_row} to export row 6")
-
-        # Copy headers (rows 3, 4, 5)
-        for row_idx in sheet_headers[sheet_name]:
-            for col in range(1, max_col + 1):
-                cell = source.cell(row=row_idx, column=col)
-                tgt = target.cell(row=row_idx, column=col, value=cell.value)
-                if cell.has_style:
-                    tgt.font = copy(cell.font)
-                    tgt.border = copy(cell.border)
-                    tgt.fill = copy(cell.fill)
-                    tgt.number_format = copy(cell.number_format)
-                    tgt.protection = copy(cell.protection)
-                    tgt.alignment = copy(cell.alignment)
-
-        # Copy the actual data row to row 6 in export
-        for col in range(1, max_col + 1):
-            src = source.cell(row=data_row, column=col)
-            # Get the actual value (whether formula result or raw value)
-            if export_type == "with" and src.data_type == 'f':
-                # Keep formula for "with formulas" export
-                cell_value = src.value
-            else:
-                # Get calculated value for "without formulas" export or non-formula cells
-                cell_value = src.value
-            
-            tgt = target.cell(row=6, column=col, value=cell_value)
-            if src.has_style:
-                tgt.font = copy(src.font)
-                tgt.border = copy(src.border)
-                tgt.fill = copy(src.fill)
-                tgt.number_format = copy(src.number_format)
-                tgt.protection = copy(src.protection)
-                tgt.alignment = copy(src.alignment)
-
-        # Copy merged cells for headers
-        for m in source.merged_cells.ranges:
-            if (m.min_row in sheet_headers[sheet_name] or m.max_row in sheet_headers[sheet_name]):
-                target.merge_cells(str(m))
-
-        # Special handling for Tooling sheet - copy additional rows
-        if sheet_name == "Tooling":
-            # Copy merged cells for the additional rows
-            for m in source.merged_cells.ranges:
-                if 8 <= m.min_row <= 48:
-                    target.merge_cells(str(m))
-            
-            # Copy rows 8-48 for tooling sheet
-            for r in range(8, 49):
-                for c in range(1, max_col + 1):
-                    cell = source.cell(row=r, column=c)
-                    tgt = target.cell(row=r, column=c, value=cell.value)
-                    if cell.has_style:
-                        tgt.font = copy(cell.font)
-                        tgt.border = copy(cell.border)
-                        tgt.fill = copy(cell.fill)
-                        tgt.number_format = copy(cell.number_format)
-                        tgt.protection = copy(cell.protection)
-                        tgt.alignment = copy(cell.alignment)
-
-        for col_idx in range(1, max_col + 1):
-            col_letter = get_column_letter(col_idx)
-            src_width = source.column_dimensions[col_letter].width
-
-            # If original width is None or too small, set a fallback width (like 15)
-            target.column_dimensions[col_letter].width = src_width if (src_width and src_width > 6) else 15
-
-    # ✅ Save the exported file
-    safe_name = zf_part.replace(" ", "_").replace("/", "_").replace("\\", "_")
-    suffix = "WithFormulas" if export_type == "with" else "ValuesOnly"
-    export_filename = f"{safe_name}_Export_{suffix}.xlsx"
-    
+            kind, label, data = _job_events.get_nowait()
+        except queue.Empty:
+            break
+        win = _progress_widgets.get("window")
+        if kind == "start" and not data:
+            _show_progress(label)
+        elif kind == "progress" and win is not None and win.winfo_exists():
+            done, total, text = data
+            _progress_widgets["bar"]["value"] = 100.0 * done / total if total else 0
+            _update_progress_detail(text)
+        elif kind in ("done", "error"):
+            if _job_queue.unfinished_tasks == 0 and win is not None and win.winfo_exists():
+                win.destroy()
+            callback, value = data
+            if callback:
+                callback(value)
+    root.after(100, poll_jobs, root)
+
+def _flush_journal_quietly():
     try:
-        export_wb.save(export_filename)
-        messagebox.showinfo("Success", f"Exported to '{export_filename}'")
-        
-        if platform.system() == "Windows":
-            os.startfile(export_filename)
-        
-        return True
+        flush_journal()
     except Exception as e:
-        messagebox.showerror("Save Error", f"Failed to save export file: {str(e)}")
-        return False
+        log(f"Journal flush failed, entries stay queued: {e}", "error")
 
 def save_to_standard_excel(entry_data):
+    # Submit only journals the entry, so the form is free again at once; a background job then writes the
+    # journal into 'Entries' and opens the workbook, as Submit always did. With the store it is one indexed
+    # upsert, saved right away, and the workbook is rendered and opened behind it.
+    zf_part = entry_data.get("ZF Part Number", "").strip()
+    part_no = entry_data.get("Part No", "").strip()
     try:
-        wb = load_workbook(EXCEL_TEMPLATE) if os.path.exists(EXCEL_TEMPLATE) else Workbook()
-
-        # Create Entries sheet if it doesn't exist
-        if "Entries" not in wb.sheetnames:
-            ws = wb.create_sheet("Entries")
-            for col_index, field in enumerate(all_fields, start=1):
-                ws.cell(row=2, column=col_index).value = field
-                ws.cell(row=2, column=col_index).font = Font(bold=True)
-                ws.cell(row=2, column=col_index).alignment = Alignment(horizontal="center")
-        else:
-            ws = wb["Entries"]
-            ws.data_validations.dataValidation = []
-
-        zf_part = entry_data.get("ZF Part Number", "").strip()
-        part_no = entry_data.get("Part No", "").strip()
-        overwrite_row = None
-
-        # Look for existing row to edit
-        for row_idx, row in enumerate(ws.iter_rows(min_row=3, max_row=ws.max_row), start=3):
-            zf_value = str(row[2].value).strip() if row[2].value else ""
-            part_value = str(row[3].value).strip() if row[3].value else ""
-            if zf_value == zf_part and part_value == part_no:
-                overwrite_row = row_idx
-                break
-
-        # If match found, update that row; else add new row
-        if overwrite_row:
-            target_row = overwrite_row
-            sl_no = target_row - 2
-            entry_data["Sl.#"] = sl_no
-        else:
-            target_row = ws.max_row + 1 if ws.max_row >= 2 else 3
-            sl_no = target_row - 2
-            entry_data["Sl.#"] = sl_no
-
-        # Write to Entries
-        for col_index, field in enumerate(all_fields, start=1):
-            ws.cell(row=target_row, column=col_index).value = entry_data.get(field, "")
-
-        # Transfer to Calculation sheet with formulas
-        if "Calculation" not in wb.sheetnames:
-            wb.create_sheet("Calculation")
-        calc_ws = wb["Calculation"]
-        calc_ws.data_validations.dataValidation = []
-
-        entries_to_calculation = {
-            "A": "A", "B": "B", "C": "C", "D": "D", "E": "E", "F": "F", "G": "G", "H": "H", "I": "I",
-            "J": "J", "K": "K", "L": "L", "M": "M", "N": "N", "O": "P", "P": "Q", "Q": "R", "R": "S",
-            "S": "T", "T": "U", "U": "V", "V": "W", "W": "X", "X": "Z", "Y": "AA", "Z": "AC", "AA": "AH",
-            "AB": "AK", "AC": "AL", "AD": "AM", "AE": "AO", "AF": "AS", "AG": "AU", "AH": "AX", "AI": "AZ",
-            "AJ": "BC", "AK": "BE", "AL": "BG"
-        }
-
-        entry_row = target_row
-        calc_row = entry_row + 3
-
-        for entry_col, calc_col in entries_to_calculation.items():
-            formula = f"=Entries!{entry_col}{entry_row}"
-            calc_ws[f"{calc_col}{calc_row}"] = formula
-
-        # Tooling Lookup Formulas
-        calc_ws[f"AQ{calc_row}"] = f"=IFNA(VLOOKUP(A{calc_row},Tooling!A:AO,30,0),\"\")"
-        calc_ws[f"AR{calc_row}"] = f"=IFNA(VLOOKUP(A{calc_row},Tooling!A:AO,31,0),\"\")"
-
-        wb.save(EXCEL_TEMPLATE)
-
-        # Open the file
-        if platform.system() == "Windows":
-            os.startfile(EXCEL_TEMPLATE)
-        elif platform.system() == "Darwin":
-            os.system(f'open "{EXCEL_TEMPLATE}"')
-        else:
-            os.system(f'xdg-open "{EXCEL_TEMPLATE}"')
-
-        messagebox.showinfo("Success", f"Data {'updated' if overwrite_row else 'saved'} with Sl.# {sl_no} in 'Entries'.")
-
+        if base.DB_PATH:
+            result = save_entry(entry_data)
+            messagebox.showinfo("Success", f"Data for '{zf_part}' saved as Sl.# {result['sl_no']}.")
+            open_excel_file()
+            return
+        journal_entry(entry_data)
     except Exception as e:
         messagebox.showerror("Error", str(e))
+        return
+
+    def write(progress):
+        flush_journal()
+        return lookup_part(zf_part, part_no)
+
+    def done(part):
+        open_file(base.EXCEL_TEMPLATE)
+        where = f" with Sl.# {part['sl_no']}" if part else ""
+        messagebox.showinfo("Success", f"Data saved{where} in 'Entries'.")
+
+    def failed(e):
+        messagebox.showerror("Error", f"Data for '{zf_part}' is queued but could not be written yet "
+                                      f"(retried every {int(JOURNAL_FLUSH_SECONDS)} s): {e}")
+
+    submit_job(f"Saving {zf_part}", write, on_done=done, on_error=failed)
 
 def run_main_form(root=None, prefill_data=None):
     def update_injection_pressure(event=None):
@@ -677,23 +247,28 @@ def run_main_form(root=None, prefill_data=None):
             tonnage = round((inj * area * 1e-3) * 1.1, 2)
             messagebox.showinfo("Tonnage", f"Tonnage = {tonnage} tons")
 
-            # ✅ Enable machine selection after tonnage is calculated
+            # Enable machine selection after tonnage is calculated
             inputs["M/c selected"].config(state="readonly")
 
         except Exception as e:
             messagebox.showerror("Error", f"Check inputs. {e}")
 
+    def find_cheapest_setup():
+        entry = {field: inputs[field].get() for field in fields if field in inputs}
+        def show(result):
+            messagebox.showinfo("Cheapest setups", format_design_report(dict(result, best=result["best"][:5])))
+        workers = max(1, (os.cpu_count() or 1) - 1)  # a core stays free for the window
+        submit_job("Searching cavity / material / machine combinations",
+                   lambda progress: optimize_design(entry, top=5, workers=workers, progress=progress),
+                   on_done=show, on_error=lambda e: messagebox.showerror("Error", str(e)))
+
     def submit():
         try:
-            entry = {}
-            for field in fields:
-                val = inputs[field].get().strip()
-                if field in dropdowns and not val:
-                    messagebox.showerror("Missing Input", f"Select a value for '{field}'")
-                    return
-                if field in numeric_fields and val:
-                    val = numeric_fields[field](val)
-                entry[field] = val
+            try:
+                entry = parse_entry({field: inputs[field].get() for field in fields})
+            except ValidationError as e:
+                messagebox.showerror("Missing Input", str(e))
+                return
 
             save_to_standard_excel(entry)
             root.destroy()
@@ -820,55 +395,112 @@ def run_main_form(root=None, prefill_data=None):
                             bg="blue", fg="white", font=("Arial", 12, "bold"))
     tonnage_btn.grid(row=max(row_left, row_right) + 1, column=1, pady=10)
 
+    # Only offered once the cost roll-up has given the template's own results for a sample of parts
+    optimize_btn = tk.Button(scrollable_frame, text="Find Cheapest Setup (checking costs...)",
+                             command=find_cheapest_setup, state="disabled",
+                             bg="blue", fg="white", font=("Arial", 12, "bold"))
+    optimize_btn.grid(row=max(row_left, row_right) + 1, column=2, pady=10)
+
+    def cost_model_checked(problem):
+        if not optimize_btn.winfo_exists():
+            return
+        if problem is None:
+            optimize_btn.config(text="Find Cheapest Setup", state="normal")
+        else:
+            optimize_btn.config(text="Find Cheapest Setup (cost model not validated)")
+
+    submit_job("Checking the cost model", lambda progress: validate_cost_model(), quiet=True,
+               on_done=cost_model_checked, on_error=lambda e: cost_model_checked(str(e)))
+
     submit_btn = tk.Button(scrollable_frame, text="Submit", command=submit,
                            bg="green", fg="white", font=("Arial", 12, "bold"))
     submit_btn.grid(row=max(row_left, row_right) + 2, columnspan=4, pady=20)
 
     root.mainloop()
 
-# ✅ Check if part exists in Entries sheet
-def part_already_exists(zf_part):
-    try:
-        if not os.path.exists(EXCEL_TEMPLATE):
-            return False
-        wb = load_workbook(EXCEL_TEMPLATE)
-        if "Entries" not in wb.sheetnames:
-            return False
-        ws = wb["Entries"]
-        for row in ws.iter_rows(min_row=3, max_row=ws.max_row, values_only=True):
-            if row and len(row) > 2:
-                if str(row[2]).strip() == zf_part:
-                    return True
-        return False
-    except Exception as e:
-        print("Error checking part existence:", e)
-        return False
-
 def show_export_options():
     popup = tk.Toplevel()
     popup.title("Export Options")
-    popup.geometry("300x150")
+    popup.geometry("300x210")
     popup.resizable(False, False)
     popup.grab_set()  # Makes the popup modal
 
     label = tk.Label(popup, text="Choose Export Type", font=("Arial", 12))
     label.pack(pady=10)
 
+    batch_var = tk.BooleanVar(value=False)
+    portfolio_var = tk.BooleanVar(value=False)
+
     def export_with():
+        batch, portfolio = batch_var.get(), portfolio_var.get()
         popup.destroy()
-        ask_and_export("with")
+        ask_and_export("with", batch, portfolio)
 
     def export_without():
+        batch, portfolio = batch_var.get(), portfolio_var.get()
         popup.destroy()
-        ask_and_export("without")
+        ask_and_export("without", batch, portfolio)
 
     btn1 = tk.Button(popup, text="Export with Formulas", command=export_with, width=25, bg="white", fg="black")
     btn2 = tk.Button(popup, text="Export without Formulas", command=export_without, width=25, bg="white", fg="black")
+    batch_chk = tk.Checkbutton(popup, text="Batch export from a list file", variable=batch_var)
+    portfolio_chk = tk.Checkbutton(popup, text="All listed parts in one workbook", variable=portfolio_var)
 
     btn1.pack(pady=5)
     btn2.pack(pady=5)
+    batch_chk.pack()
+    portfolio_chk.pack()
+
+def ask_and_batch_export(mode, portfolio=False):
+    list_file = filedialog.askopenfilename(
+        title="Select file with ZF Part Numbers",
+        filetypes=[("Text / CSV", "*.txt *.csv"), ("All files", "*.*")]
+    )
+    if not list_file:
+        return
+    zf_parts = read_part_numbers(list_file)
+    if not zf_parts:
+        messagebox.showwarning("Batch Export", "No ZF Part Numbers found in the selected file.")
+        return
+    output_dir = os.path.join(os.path.dirname(list_file), "exports")
+
+    if portfolio:
+        def portfolio_done(export_filename):
+            messagebox.showinfo("Portfolio Export", f"Exported {len(zf_parts)} parts to '{export_filename}'")
+            open_file(export_filename)
+
+        def portfolio_failed(e):
+            if not isinstance(e, JobCancelled):
+                messagebox.showerror("Portfolio Export", str(e))
+
+        name = os.path.splitext(os.path.basename(list_file))[0]
+        submit_job(f"Portfolio export of {len(zf_parts)} parts",
+                   lambda progress: export_portfolio(zf_parts, export_type=mode, output_dir=output_dir,
+                                                     name=name, progress=progress),
+                   on_done=portfolio_done, on_error=portfolio_failed)
+        return
+
+    def done(results):
+        report = format_batch_report(results)
+        log(report, ok=sum(r["ok"] for r in results), parts=len(results))
+        if all(r["ok"] for r in results):
+            messagebox.showinfo("Batch Export", f"{report}\n\nFiles saved to '{output_dir}'")
+        else:
+            messagebox.showwarning("Batch Export", f"{report}\n\nFiles saved to '{output_dir}'")
+
+    def failed(e):
+        if not isinstance(e, JobCancelled):
+            messagebox.showerror("Batch Export", str(e))
 
-def ask_and_export(mode):
+    submit_job(f"Batch export of {len(zf_parts)} parts",
+               lambda progress: export_batch(zf_parts, export_type=mode, output_dir=output_dir,
+                                             workers=None, progress=progress),
+               on_done=done, on_error=failed)
+
+def ask_and_export(mode, batch=False, portfolio=False):
+    if batch or portfolio:
+        ask_and_batch_export(mode, portfolio)
+        return
     zf_part = simpledialog.askstring("Export", "Enter ZF Part Number to export:")
     if not zf_part:
         return
@@ -877,7 +509,7 @@ def ask_and_export(mode):
     elif mode == "without":
         export_without_formulas(zf_part)
 
-# ✅ Small window for basic inputs
+# Small window for basic inputs
 def open_initial_entry_window():
     small_win = tk.Toplevel()
     small_win.title("New Entry - Basic Info")
@@ -891,7 +523,12 @@ def open_initial_entry_window():
             messagebox.showwarning("Missing", "Please fill all fields")
             return
 
-        if part_already_exists(zf_part):
+        try:
+            exists = part_already_exists(zf_part)
+        except JarvisError as e:
+            log(f"Existence check failed, treating '{zf_part}' as new: {e}", "warning")
+            exists = False
+        if exists:
             messagebox.showerror("Exists", "This ZF Part Number already exists!")
         else:
             small_win.destroy()
@@ -910,27 +547,42 @@ def open_initial_entry_window():
 
     tk.Button(small_win, text="Next", command=proceed).grid(row=2, columnspan=2, pady=10)
 
+def ask_and_import():
+    path = filedialog.askopenfilename(title="Entries to import",
+                                      filetypes=[("Entry files", "*.csv *.json *.xlsx *.xlsm"), ("All files", "*.*")])
+    if not path:
+        return
+
+    def done(report):
+        text = format_import_report(report)
+        if len(text) > 3000:
+            text = text[:3000] + "\n..."
+        if report["errors"]:
+            messagebox.showwarning("Import", text)
+        else:
+            messagebox.showinfo("Import", text)
+
+    submit_job(f"Import {os.path.basename(path)}", lambda progress: import_entries(path),
+               on_done=done, on_error=lambda e: messagebox.showerror("Import", str(e)))
+
 def open_excel_file():
-    try:
-        if os.path.exists(EXCEL_TEMPLATE):
-            if platform.system() == "Windows":
-                os.startfile(EXCEL_TEMPLATE)
-            elif platform.system() == "Darwin":
-                os.system(f'open "{EXCEL_TEMPLATE}"')
-            else:
-                os.system(f'xdg-open "{EXCEL_TEMPLATE}"')
+    def done(_):
+        if os.path.exists(base.EXCEL_TEMPLATE):
+            open_file(base.EXCEL_TEMPLATE)
         else:
             messagebox.showerror("Not Found", "Excel file not found.")
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
 
-# ✅ Entry type selection window (as Toplevel)
+    # Queued behind any running export so Excel never opens a half-written template
+    submit_job("Saving queued entries", lambda progress: sync_template(), on_done=done,
+               on_error=lambda e: messagebox.showerror("Error", str(e)))
+
+# Entry type selection window (as Toplevel)
 def choose_entry_type(parent_window):
-    parent_window.destroy()  # ✅ Close the old root window first
+    parent_window.destroy()  # Close the old root window first
 
     entry_win = tk.Toplevel()
     entry_win.title("Choose Entry Type")
-    entry_win.geometry("300x150")
+    entry_win.geometry("300x200")
 
     tk.Button(entry_win, text="New Entry", width=20,
               command=lambda: [entry_win.destroy(), open_initial_entry_window()]).pack(pady=10)
@@ -938,10 +590,33 @@ def choose_entry_type(parent_window):
     tk.Button(entry_win, text="Edit Existing Entry", width=20,
               command=lambda: [entry_win.destroy(), open_excel_file()]).pack(pady=10)
 
-# ✅ Initial mode selection window — only one root window
+    tk.Button(entry_win, text="Import from File", width=20,
+              command=lambda: [entry_win.destroy(), ask_and_import()]).pack(pady=10)
+
+# Initial mode selection window — only one root window
 def select_mode():
+    _load_gui()
     root = tk.Tk()
-    root.withdraw()  # ✅ Hide the blank root window
+    root.withdraw()  # Hide the blank root window
+
+    # Replay entries journaled before a crash, then flush periodically and on exit
+    try:
+        recovered = flush_journal()
+        if recovered:
+            messagebox.showinfo("Recovered", f"{len(recovered)} unsaved entries were written to 'Entries'.")
+    except Exception as e:
+        messagebox.showerror("Error", f"Queued entries could not be saved yet: {e}")
+    atexit.register(_flush_journal_quietly)
+
+    def periodic_flush():
+        # Runs as a quiet job so it never saves the template while an export is reading it
+        if pending_journal_entries():
+            submit_job("Saving queued entries", lambda progress: _flush_journal_quietly(), quiet=True)
+        root.after(int(JOURNAL_FLUSH_SECONDS * 1000), periodic_flush)
+    root.after(int(JOURNAL_FLUSH_SECONDS * 1000), periodic_flush)
+    poll_jobs(root)
+    # Import openpyxl while the user is still choosing, so the first export doesn't wait for it
+    submit_job("Loading Excel support", lambda progress: _load_openpyxl(), quiet=True)
 
     mode_win = tk.Toplevel()
     mode_win.title("Select Mode")
@@ -958,4 +633,6 @@ def select_mode():
     root.mainloop()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
     select_mode()
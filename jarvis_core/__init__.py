@@ -0,0 +1 @@
+# Headless layers behind jarvis.py; import the API from jarvis, settings live on jarvis_core.base
@@ -0,0 +1,293 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# Settings, field tables and sheet schema, errors and tracing: what every other jarvis_core module builds on.
+# EXCEL_TEMPLATE and DB_PATH are set by the command line and the tests, so read them as base.EXCEL_TEMPLATE.
+
+# The directory of jarvis.py, one level above this package
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Use the script directory to ensure the Excel template is found
+EXCEL_TEMPLATE = os.path.join(BASE_DIR, "Standard_Template_new.xlsx")
+
+# SQLite store holding the Entries rows (see store.py); None keeps them in the template
+DB_PATH = os.environ.get("JARVIS_DB") or None
+
+# Injection pressure mapping
+injection_pressure_map = {
+    "ABS UV": 700, "ABS Non UV": 700, "PP T20": 650, "PC Clear": 900,
+    "POM": 800, "PC Amber": 850, "PC black": 850, "PMMA Clear": 780,
+    "PMMA Red": 780, "PP+EPDM": 720, "PA66": 950, "EPDM": 750, "PP": 650,
+    "PC ABS": 820, "PP EPDM": 700, "PP HD": 670, "PA6": 940,
+    "PA66 GF30": 1000, "PA66 GF15": 980, "PA66 GF25": 990,
+    "PP GF20": 950, "PP GF10": 900, "PA6 GF30": 990, "PA6 GF15": 970,
+    "PA6 GF25": 980, "PP/PE-T16": 720, "PP EPDM TD10": 710,
+    "SEBS": 680, "HDPE": 650, "PE": 640
+}
+
+# Dropdowns
+dropdowns = {
+    "In-house/Purchase": ["In-House", "Purchase"],
+    "Rawmaterial": list(injection_pressure_map.keys()),
+    "No. of cavities -X direction": ["1", "2", "4", "6", "8", "12", "16"],
+    "No. of cavities -Y direction": ["1", "2", "4", "6", "8", "12", "16"],
+    "Grain requirement": ["Y", "N"],
+    "HRS Type": ["0", "1", "2", "3"],
+    "No.of drop": [str(i) for i in range(1, 13)],
+    "X Direction Slider": ["Y", "N"],
+    "Y Direction Slider": ["Y", "N"],
+    "No.of Sliders/Cavity": [str(i) for i in range(12)],
+    "No.of Lifters/cavity": [str(i) for i in range(12)],
+    "No.of Bosses /cavity": [str(i) for i in range(12)],
+    "No.of Ejector pads/ cavity": [str(i) for i in range(12)],
+    "Projected Area %": ["50%", "55%", "60%", "70%", "75%", "80%", "85%", "90%", "100%"],
+    "Process": ["Injection moulding", "Blow moulding", "Assy", "BOP"],
+    "M/c selected": [str(i) for i in [60, 90, 120, 160, 200, 220, 250, 260, 280, 320, 380,
+                                      470, 530, 600, 700, 800, 900, 1000, 1200, 1300, 1400,
+                                      1600, 1850, 2100, 2400, 2800, 3300, 4000]],
+    "Labor Type (Machine)": ["Skilled", "Semi skilled", "Unskilled"],
+    "Labor Type (Setup)": ["Skilled", "Semi skilled", "Unskilled"]
+}
+
+fields = [
+    "In-house/Purchase", "ZF Part Number", "Part No", "Part Name", "Volume P.A Nos",
+    "No.off (per Vehicle)", "Rawmaterial", "L(mm)", "W(mm)", "H(mm)", "T(mm)",
+    "No. of cavities -X direction", "No. of cavities -Y direction", "Grain requirement",
+    "HRS Type", "No.of drop", "X Direction Slider", "Y Direction Slider",
+    "No.of Sliders/Cavity", "No.of Lifters/cavity", "No.of Bosses /cavity",
+    "No.of Ejector pads/ cavity", "Projected Area %", "Injection Pressure", "Total Projected Area", "Finish wt.( Kgs)",
+    "Scrap cost/Kg (INR)", "Bop Parts", "Qty (Nos)", "Cost /part (INR)", "Process", "M/c selected", "Machine Cycle time (sec)",
+    "Labor Type (Machine)", "Operator /machine", "Labor Type (Setup)", "No.of operator", "Time/Lot (min)"
+]
+
+all_fields = ["Sl.#"] + [f for f in fields if f != "Injection Pressure"]
+
+numeric_fields = {
+    "L(mm)": float, "W(mm)": float, "H(mm)": float, "T(mm)": float,
+    "Volume P.A Nos": int, "No.off (per Vehicle)": int,
+    "No. of cavities -X direction": int, "No. of cavities -Y direction": int, "HRS Type": int,
+    "No.of drop": int, "No.of Sliders/Cavity": int, "No.of Lifters/cavity": int,
+    "No.of Bosses /cavity": int, "No.of Ejector pads/ cavity": int,
+    "Finish wt.( Kgs)": float, "Scrap cost/Kg (INR)": float, "Bop Parts": float,
+    "Qty (Nos)": int, "Cost /part (INR)": float, "M/c selected": int, "Machine Cycle time (sec)": float,
+    "Operator /machine": int, "No.of operator": int, "Time/Lot (min)": float
+}
+
+# Entries column -> Calculation column; each saved part gets "=Entries!<col><row>" links in these columns
+entries_to_calculation = {
+    "A": "A", "B": "B", "C": "C", "D": "D", "E": "E", "F": "F", "G": "G", "H": "H", "I": "I",
+    "J": "J", "K": "K", "L": "L", "M": "M", "N": "N", "O": "P", "P": "Q", "Q": "R", "R": "S",
+    "S": "T", "T": "U", "U": "V", "V": "W", "W": "X", "X": "Z", "Y": "AA", "Z": "AC", "AA": "AH",
+    "AB": "AK", "AC": "AL", "AD": "AM", "AE": "AO", "AF": "AS", "AG": "AU", "AH": "AX", "AI": "AZ",
+    "AJ": "BC", "AK": "BE", "AL": "BG"
+}
+
+section_titles = {
+    "Raw material cost": ["Finish wt.( Kgs)", "Scrap cost/Kg (INR)"],
+    "BOP parts cost": ["Bop Parts", "Qty (Nos)", "Cost /part (INR)"],
+    "Machine cost": ["Process", "M/c selected", "Machine Cycle time (sec)"],
+    "Labor Cost": ["Labor Type (Machine)", "Operator /machine"],
+    "Setting-up cost": ["Labor Type (Setup)", "No.of operator", "Time/Lot (min)"],
+}
+
+# Sheet schema: every column that moves between sheets, in one place. sheet_schema() compiles it once into
+# column-index tuples; saves, renders and the Tooling/Summary staging of an export read whole rows as tuples
+# and write through those, so no mapping is spelled out twice.
+SHEET_SCHEMA = {
+    "entries": {"first_row": 3, "fields": all_fields},          # all_fields from column A
+    "calculation": {
+        "row_offset": 3,                                        # Calculation row = Entries row + 3
+        "links": entries_to_calculation,                        # "=Entries!<col><row>" in these columns
+        "tool_key": "A",                                        # Sl.#, matched against Tooling's key column
+        # MATCH of the key in Tooling, right of A:CL. A helper column of ours: saves and migrate_formulas()
+        # refuse to write it while it holds anything but these MATCH formulas, so point it at a free column
+        # if the template uses CM
+        "tool_match": "CM",
+        "tool_results": {"AQ": "AD", "AR": "AE"},               # INDEXed from Tooling by that match
+        # Column captions (header rows 3-5, compared without case and extra spaces) of the five section_titles
+        # blocks and the totals. cost_model() looks them up in the template and names any it can't find;
+        # the columns they head are read from there, never assumed
+        "cost_blocks": list(section_titles),
+        "cost_totals": {"part_cost": "Part cost", "overheads": "Overheads", "total": "Total cost"},
+    },
+    "tooling": {
+        "row": 6,
+        "from_entries": ("A", "AA"),                            # Entries A:AA into the same columns
+        "from_calculation": {"AB": "AP", "AC": "AS"},           # tool cost, machine
+        "key": "A",
+        "lookup_rows": (6, 48),                                 # part row and tool breakdown
+    },
+    "summary": {
+        "row": 6,
+        "from_entries": {"A": "Sl.#", "B": "ZF Part Number", "C": "Part Name", "D": "No.off (per Vehicle)",
+                         "E": "Volume P.A Nos", "F": "Rawmaterial", "H": "W(mm)", "I": "H(mm)", "J": "T(mm)"},
+        "part_size": ("G", ["L(mm)", "W(mm)", "H(mm)"]),        # "L x W x H"
+        "cavities": ("K", ["No. of cavities -X direction", "No. of cavities -Y direction"]),
+    },
+}
+_compiled_schema = None
+
+# Errors raised by the headless layer; the Tk windows turn them into messageboxes
+class JarvisError(Exception):
+    pass
+
+class TemplateError(JarvisError):
+    pass
+
+class CostModelError(TemplateError):
+    pass
+
+class PartNotFoundError(JarvisError):
+    pass
+
+class ValidationError(JarvisError):
+    pass
+
+class ExportError(JarvisError):
+    pass
+
+class SaveError(JarvisError):
+    pass
+
+class JobCancelled(JarvisError):
+    pass
+
+# Tracing: named spans with wall time. JARVIS_TRACE=<file> turns it on; a .json file gets Chrome trace
+# events (chrome://tracing, Perfetto), anything else JSON lines. JARVIS_TRACE_FORMAT=chrome|jsonl overrides.
+# Unset, span() returns a shared do-nothing object, so instrumented code pays one call per span.
+TRACE_PATH = os.environ.get("JARVIS_TRACE") or None
+TRACE_FORMAT = os.environ.get("JARVIS_TRACE_FORMAT") or ("chrome" if (TRACE_PATH or "").endswith(".json") else "jsonl")
+_trace_lock = threading.Lock()
+_trace_file = None
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _write_trace(self.name, self.wall, elapsed, self.args)
+        return False
+
+    def set(self, **args):
+        # Adds fields that are only known once the work is done (rows found, file written, ...)
+        self.args.update(args)
+
+def span(name, **args):
+    if TRACE_PATH is None:
+        return _NO_SPAN
+    return _Span(name, args)
+
+def log(message, level="info", **args):
+    # Messages from the headless layer: a zero-length "log" event in the trace, and warnings / errors
+    # also on stderr so a failure is never silent. Nothing goes to stdout, which belongs to the CLI output
+    if level != "info":
+        print(message, file=sys.stderr)
+    if TRACE_PATH is not None:
+        _write_trace("log", time.time(), 0.0, dict(args, level=level, message=message))
+
+def _write_trace(name, wall, elapsed, args):
+    global _trace_file
+    if TRACE_FORMAT == "chrome":
+        line = json.dumps({"name": name, "ph": "X", "ts": round(wall * 1e6), "dur": round(elapsed * 1e6),
+                           "pid": os.getpid(), "tid": threading.get_ident(), "args": args}, default=str) + ",\n"
+    else:
+        line = json.dumps(dict({"name": name, "ts": wall, "ms": round(elapsed * 1000, 3),
+                                "pid": os.getpid(), "tid": threading.get_ident()}, **args), default=str) + "\n"
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, "a", encoding="utf-8")
+            if TRACE_FORMAT == "chrome" and _trace_file.tell() == 0:
+                _trace_file.write("[\n")  # the trace viewers accept the array without its closing bracket
+        _trace_file.write(line)
+        _trace_file.flush()
+
+def sheet_schema():
+    global _compiled_schema
+    if _compiled_schema is None:
+        _compiled_schema = compile_schema(SHEET_SCHEMA)
+    return _compiled_schema
+
+def compile_schema(schema):
+    # Column letters and field names -> 1-based column numbers, grouped the way the row transfers use them
+    col = _column_number
+    entries = {field: i for i, field in enumerate(schema["entries"]["fields"], start=1)}
+    calc, tooling, summary = schema["calculation"], schema["tooling"], schema["summary"]
+    first, last = (col(letter) for letter in tooling["from_entries"])
+    return {
+        "entries_first_row": schema["entries"]["first_row"],
+        "entries_columns": tuple(range(1, len(entries) + 1)),
+        "calc_offset": calc["row_offset"],
+        # (Calculation column, Entries column letter)
+        "calc_links": tuple((col(c), e) for e, c in calc["links"].items()),
+        # (Calculation column, Tooling column, Tooling column letter)
+        "calc_tool_results": tuple((col(c), col(t), t) for c, t in calc["tool_results"].items()),
+        "calc_tool_match": (col(calc["tool_match"]), calc["tool_match"]),
+        # (title or total, header caption); cost_model() finds their columns in the template
+        "cost_blocks": tuple((title, title) for title in calc["cost_blocks"]),
+        "cost_totals": tuple(calc["cost_totals"].items()),
+        "tool_key": (calc["tool_key"], tooling["key"]),
+        "tooling_row": tooling["row"],
+        "tooling_entries": tuple(range(first, last + 1)),
+        # (Tooling column, Calculation column, Calculation column letter)
+        "tooling_calc": tuple((col(t), col(c), c) for t, c in tooling["from_calculation"].items()),
+        "tooling_lookup_rows": tuple(tooling["lookup_rows"]),
+        "summary_row": summary["row"],
+        # (Summary column, Entries column)
+        "summary_entries": tuple((col(c), entries[field]) for c, field in summary["from_entries"].items()),
+        "summary_size": (col(summary["part_size"][0]), tuple(entries[f] for f in summary["part_size"][1])),
+        "summary_cavities": (col(summary["cavities"][0]), tuple(entries[f] for f in summary["cavities"][1])),
+    }
+
+def get_section(field):
+    for section, items in section_titles.items():
+        if field in items:
+            return section
+    return None
+
+def _column_number(ref):
+    # "AB12" -> 28 without importing openpyxl
+    col = 0
+    for ch in ref:
+        if ch.isdigit():
+            break
+        col = col * 26 + ord(ch.upper()) - 64
+    return col
+
+# Sheets an export carries, in workbook order
+EXPORT_SHEETS = ["Calculation", "Tooling", "Summary", "Master Data", "Entries", "Import"]
+
+# Columns copied per sheet and the header rows above the part rows (row 6 on)
+EXPORT_COLUMNS = {
+    "Calculation": 91,  # A:CL plus the CM Tooling match column
+    "Tooling": 40,
+    "Summary": 39,
+    "Import": 28,
+    "Master Data": 18,
+    "Entries": 38
+}
+EXPORT_HEADER_ROWS = [3, 4, 5]
+EXPORT_MAX_ROWS = {"Master Data": 110}  # Rows copied of the sheets exported whole (all of the others)
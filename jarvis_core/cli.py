@@ -0,0 +1,279 @@
+# Command line: python jarvis.py {export,save,flush,import,machines,costs,optimize,exists,list,search,db,formulas} ...
+import argparse
+import json
+import os
+import sys
+
+from . import base, export
+from .base import JarvisError, ValidationError, injection_pressure_map
+from .workbook import _require_template
+from .formulas import format_recalc_cost, recalc_cost
+from .entries import parse_entry
+from .store import check_store_roundtrip, migrate_to_store, render_template, search_parts, _store_path
+from .journal import (flush_journal, format_import_report, import_entries, journal_entry, _journal_path, list_parts,
+                      migrate_formulas, part_already_exists, pending_journal_entries, save_entry, sync_template)
+from .export import export_batch, export_portfolio, format_batch_report, read_part_numbers
+from .costs import (DESIGN_FIELDS, apply_machine_allocation, check_cost_rollup, compute_results, cost_model,
+                    cost_rollup, format_cost_report, format_design_report, format_machine_report, machine_allocation,
+                    optimize_design, part_entry, part_results, write_cost_report, write_machine_report)
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="jarvis", description="Plastic part costing template tools")
+    parser.add_argument("--template", help="Path to the standard template (default: %(default)s)",
+                        default=base.EXCEL_TEMPLATE)
+    parser.add_argument("--db", help="SQLite store holding the Entries rows (default: $JARVIS_DB, "
+                                     "otherwise the template is the store)", default=base.DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Export one or more parts to separate workbooks (or one with --portfolio)")
+    p_export.add_argument("zf_parts", nargs="*", help="ZF Part Numbers")
+    p_export.add_argument("--from-file", help="File with one ZF Part Number per line")
+    p_export.add_argument("--values-only", action="store_true", help="Export without formulas")
+    p_export.add_argument("--output-dir", help="Directory for exported files")
+    p_export.add_argument("--workers", type=int, default=1, help="Worker processes (0 = all cores)")
+    p_export.add_argument("--portfolio", action="store_true", help="Write all parts into one workbook")
+    p_export.add_argument("--name", help="File name stem of the --portfolio workbook")
+    p_export.add_argument("--engine", choices=["copy", "xml"],
+                          help="copy: rebuild each workbook with openpyxl; xml: clone the template package")
+    p_export.add_argument("--prune", action="store_true",
+                          help="Keep only the Entries / Master Data rows the exported formulas reference")
+
+    p_save = sub.add_parser("save", help="Save or update one entry")
+    p_save.add_argument("--json", dest="json_file", help="JSON file with the entry ('-' for stdin)")
+    p_save.add_argument("--set", dest="values", action="append", default=[], metavar="FIELD=VALUE",
+                        help="Field value, may be repeated")
+    p_save.add_argument("--queue", action="store_true", help="Append to the journal instead of saving now")
+
+    sub.add_parser("flush", help="Write journaled entries into the template")
+
+    p_import = sub.add_parser("import", help="Save every valid row of a CSV/JSON/XLSX file in one go")
+    p_import.add_argument("path")
+
+    p_machines = sub.add_parser("machines", help="Check the machine of every part against its tonnage")
+    p_machines.add_argument("--report", help="Write the per-part allocation to this CSV file")
+    p_machines.add_argument("--pressure", dest="pressures", action="append", default=[],
+                            metavar="MATERIAL=BAR", help="Override an injection pressure, may be repeated")
+    p_machines.add_argument("--apply", action="store_true",
+                            help="Write projected area and suggested machine back to Entries")
+
+    p_costs = sub.add_parser("costs", help="Roll up the five cost blocks of every part")
+    p_costs.add_argument("--report", help="Write the per-part costs to this CSV file")
+    p_costs.add_argument("--set", dest="values", action="append", default=[], metavar="FIELD=VALUE",
+                         help="What-if: use this value for every part, may be repeated")
+    p_costs.add_argument("--check", type=int, metavar="N",
+                         help="Compare N parts with the template's Calculation formulas")
+
+    p_optimize = sub.add_parser("optimize", help="Rank cavity / Rawmaterial / M/c combinations of a part by cost")
+    p_optimize.add_argument("zf_part", nargs="?", help="Part to start from (or --json)")
+    p_optimize.add_argument("--json", dest="json_file", help="JSON file with the entry ('-' for stdin)")
+    p_optimize.add_argument("--top", type=int, default=10)
+    p_optimize.add_argument("--workers", type=int, default=1, help="Worker processes (0 = all cores)")
+    p_optimize.add_argument("--only", dest="options", action="append", default=[], metavar="FIELD=V1,V2",
+                            help="Only try these values of a field, may be repeated")
+
+    p_exists = sub.add_parser("exists", help="Exit 0 if the ZF Part Number is in Entries, 1 otherwise")
+    p_exists.add_argument("zf_part")
+
+    sub.add_parser("list", help="List parts in the Entries sheet")
+
+    p_search = sub.add_parser("search", help="Find parts whose ZF Part Number, Part No or name contains TEXT")
+    p_search.add_argument("text")
+    p_search.add_argument("--limit", type=int, default=50)
+
+    p_db = sub.add_parser("db", help="SQLite store: migrate Entries into it, check, render the template, results")
+    p_db.add_argument("action", choices=["migrate", "check", "render", "results"])
+    p_db.add_argument("zf_part", nargs="?", help="Part to show with 'results' (all stale parts otherwise)")
+    p_db.add_argument("--replace", action="store_true", help="Migrate again over a store that has parts")
+    p_db.add_argument("--full", action="store_true", help="Render every row, not only the changed ones")
+
+    p_formulas = sub.add_parser("formulas", help="Calculation formulas: recalculation cost, or migrate old lookups")
+    p_formulas.add_argument("action", choices=["cost", "migrate"])
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    base.EXCEL_TEMPLATE = os.path.abspath(args.template)
+    base.DB_PATH = os.path.abspath(args.db) if args.db else None
+
+    try:
+        if args.command == "export":
+            zf_parts = list(args.zf_parts)
+            if args.from_file:
+                zf_parts += read_part_numbers(args.from_file)
+            if not zf_parts:
+                print("No ZF Part Numbers given.", file=sys.stderr)
+                return 2
+            _require_template()
+            export_type = "without" if args.values_only else "with"
+            export.EXPORT_ENGINE = args.engine or export.EXPORT_ENGINE
+            if args.portfolio:
+                print(export_portfolio(zf_parts, export_type, args.output_dir, name=args.name, prune=args.prune or None))
+                return 0
+            results = export_batch(zf_parts, export_type, args.output_dir, workers=args.workers or None,
+                                   prune=args.prune or None)
+            for r in results:
+                print(f"{r['zf_part']}\t{r['path'] if r['ok'] else 'FAILED: ' + r['error']}")
+            print(format_batch_report(results).splitlines()[0])
+            return 0 if all(r["ok"] for r in results) else 1
+
+        if args.command == "save":
+            raw = {}
+            if args.json_file:
+                with (sys.stdin if args.json_file == "-" else open(args.json_file, encoding="utf-8")) as f:
+                    raw.update(json.load(f))
+            for item in args.values:
+                field, sep, value = item.partition("=")
+                if not sep:
+                    raise ValidationError(f"Expected FIELD=VALUE, got '{item}'")
+                raw[field.strip()] = value
+            if args.queue:
+                journal_entry(parse_entry(raw))
+                print(f"Queued {len(pending_journal_entries())} entries in {_journal_path()}")
+                return 0
+            result = save_entry(parse_entry(raw))
+            print(f"{'Updated' if result['updated'] else 'Saved'} Sl.# {result['sl_no']} at Entries row {result['row']}")
+            return 0
+
+        if args.command == "flush":
+            results = flush_journal()
+            print(f"Flushed {len(results)} entries")
+            return 0
+
+        if args.command == "import":
+            report = import_entries(args.path)
+            print(format_import_report(report))
+            return 1 if report["errors"] else 0
+
+        if args.command == "machines":
+            pressure_map = dict(injection_pressure_map)
+            for item in args.pressures:
+                material, sep, value = item.partition("=")
+                try:
+                    pressure_map[material.strip()] = float(value)
+                except ValueError:
+                    sep = ""
+                if not sep:
+                    raise ValidationError(f"Expected MATERIAL=BAR, got '{item}'")
+            flush_journal()
+            alloc = machine_allocation(pressure_map)
+            print(format_machine_report(alloc))
+            if args.report:
+                write_machine_report(alloc, args.report)
+                print(f"Report written to {args.report}")
+            if args.apply:
+                print(f"Updated M/c selected on {apply_machine_allocation(alloc)} parts")
+            return 0
+
+        if args.command == "costs":
+            overrides = {}
+            for item in args.values:
+                field, sep, value = item.partition("=")
+                if not sep:
+                    raise ValidationError(f"Expected FIELD=VALUE, got '{item}'")
+                overrides[field.strip()] = value.strip()
+            flush_journal()
+            costs = cost_rollup(overrides)
+            print(format_cost_report(costs))
+            if args.report:
+                write_cost_report(costs, args.report)
+                print(f"Report written to {args.report}")
+            if args.check:
+                check = check_cost_rollup(args.check)
+                model = cost_model()
+                print("Cost columns: " + ", ".join(f"{name} = Calculation!{letter}"
+                                                   for name, _, letter in model["blocks"] + model["totals"]))
+                for problem in check["problems"]:
+                    print(problem, file=sys.stderr)
+                if check["problems"]:
+                    print(f"Check against the template FAILED: {len(check['problems'])} of {check['cells']} cells "
+                          "differ, so the captioned cost columns or the formulas there are not what the "
+                          "roll-up assumes", file=sys.stderr)
+                    return 1
+                if not check["cells"]:
+                    print("Check against the template FAILED: no parts to compare", file=sys.stderr)
+                    return 1
+                print(f"Check against the template: ok ({check['cells']} cells of {check['parts']} parts, "
+                      f"{check['excel_cells']} also against Excel's cached values)")
+                return 0
+            return 0
+
+        if args.command == "optimize":
+            if args.json_file:
+                with (sys.stdin if args.json_file == "-" else open(args.json_file, encoding="utf-8")) as f:
+                    entry = json.load(f)
+            elif args.zf_part:
+                flush_journal()
+                entry = part_entry(args.zf_part.strip())
+            else:
+                print("Give a ZF Part Number or --json.", file=sys.stderr)
+                return 2
+            options = {}
+            for item in args.options:
+                field, sep, values = item.partition("=")
+                if not sep or field.strip() not in DESIGN_FIELDS:
+                    raise ValidationError(f"Expected FIELD=V1,V2 with FIELD one of {', '.join(DESIGN_FIELDS)}, got '{item}'")
+                options[field.strip()] = [v.strip() for v in values.split(",") if v.strip()]
+            print(format_design_report(optimize_design(entry, args.top, args.workers or None, options)))
+            return 0
+
+        if args.command == "exists":
+            exists = part_already_exists(args.zf_part.strip())
+            print("yes" if exists else "no")
+            return 0 if exists else 1
+
+        if args.command == "search":
+            _require_template()
+            for part in search_parts(args.text, args.limit):
+                print("\t".join("" if part.get(f) is None else str(part.get(f))
+                                for f in ("Sl.#", "ZF Part Number", "Part No", "Part Name")))
+            return 0
+
+        if args.command == "list":
+            for part in list_parts():
+                print("\t".join("" if part.get(f) is None else str(part.get(f))
+                                for f in ("Sl.#", "ZF Part Number", "Part No", "Part Name")))
+            return 0
+
+        if args.command == "db":
+            base.DB_PATH = _store_path()  # next to the template unless --db / JARVIS_DB names one
+            if args.action == "migrate":
+                report = migrate_to_store(args.replace)
+                print(f"Migrated {report['parts']} parts into {report['path']}")
+                for row_idx in report["duplicates"]:
+                    print(f"  Entries row {row_idx}: duplicate ZF Part Number / Part No, left in the sheet only")
+                problems = check_store_roundtrip()
+                print("Round trip: " + ("ok" if not problems else f"{len(problems)} differences"))
+                for problem in problems[:50]:
+                    print(f"  {problem}")
+                print(f"Set JARVIS_DB={report['path']} (or pass --db) to use it")
+                return 1 if problems else 0
+            if args.action == "check":
+                problems = check_store_roundtrip()
+                for problem in problems:
+                    print(problem)
+                print("Round trip: " + ("ok" if not problems else f"{len(problems)} differences"))
+                return 1 if problems else 0
+            if args.action == "render":
+                flush_journal()
+                print(f"Rendered {render_template(full=args.full)} parts into {base.EXCEL_TEMPLATE}")
+                return 0
+            if args.zf_part:
+                for column, value in part_results(args.zf_part.strip()).items():
+                    print(f"{column}\t{value}")
+                return 0
+            print(f"Computed results for {len(compute_results())} parts")
+            return 0
+
+        if args.command == "formulas":
+            sync_template()
+            print(("Before: " if args.action == "migrate" else "") + format_recalc_cost(recalc_cost()))
+            if args.action == "migrate":
+                rows = migrate_formulas()
+                print(f"Rewrote the Tooling lookups of {len(rows)} Calculation rows")
+                if rows:
+                    print("After:  " + format_recalc_cost(recalc_cost()))
+            return 0
+    except JarvisError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 2
@@ -0,0 +1,1162 @@
+# Costs in Python: machine allocation, the vectorized cost roll-up over the template's own formulas and the
+# design-space search built on it
+from bisect import bisect_left
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+
+from . import base
+from .base import (EXPORT_COLUMNS, EXPORT_HEADER_ROWS, CostModelError, JarvisError, PartNotFoundError, SaveError,
+                   ValidationError, all_fields, _column_number, dropdowns, injection_pressure_map, log, sheet_schema,
+                   span)
+from .workbook import (_XL_NS, _cell_value, get_workbook, lookup_part, _package_sheets, _require_template,
+                       _sheet_part_name, stream_entries, stream_sheet, _template_stamp, _xml_cell_value)
+from .formulas import (DIV0_ERROR, _FORMULA_FUNCTIONS, NA_ERROR, NUM_ERROR, REF_ERROR, VALUE_ERROR, _ClosureBuilder,
+                       ExcelError, FormulaError, FormulaEvaluator, _Range, _arith, _compare, _compile_tokens,
+                       _fn_concatenate, _formula_references, _rounding, _split_reference, _to_bool, _to_number)
+from .lock import _locked_save
+from .store import _bump_store_version, _connect_store, _same_cell_value, _store_meta, _store_path, store_rows
+from .journal import flush_journal, sync_template
+
+# openpyxl and NumPy are imported by _load_openpyxl() / _load_numpy() on first use, so importing this module
+# stays cheap
+get_column_letter = range_boundaries = Tokenizer = Token = None
+np = None
+
+def _load_openpyxl():
+    global get_column_letter, range_boundaries, Tokenizer, Token
+    if get_column_letter is None:
+        from openpyxl.utils import get_column_letter
+        from openpyxl.utils.cell import range_boundaries
+        from openpyxl.formula.tokenizer import Tokenizer, Token
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise JarvisError("NumPy is required for machine allocation (pip install numpy)")
+
+# Machine allocation for every part at once: projected area, tonnage and smallest adequate machine
+MACHINE_LADDER = sorted(int(m) for m in dropdowns["M/c selected"])
+
+def _entries_columns(names):
+    # Entries rows with a ZF Part Number as {field: [values]} plus their sheet row numbers
+    if base.DB_PATH:
+        wanted = [all_fields.index(name) for name in names]
+        stored = store_rows()
+        return ([row_idx for row_idx, _ in stored],
+                {name: [values[i] for _, values in stored] for name, i in zip(names, wanted)})
+    _require_template()
+    wb = get_workbook(base.EXCEL_TEMPLATE, data_only=True)
+    if "Entries" not in wb.sheetnames:
+        return [], {name: [] for name in names}
+    ws = wb["Entries"]
+    wanted = [(name, all_fields.index(name)) for name in names]
+    rows, columns = [], {name: [] for name in names}
+    for row_idx, row in enumerate(ws.iter_rows(min_row=3, max_row=ws.max_row, max_col=len(all_fields),
+                                               values_only=True), start=3):
+        if len(row) < 3 or row[2] in (None, ""):
+            continue
+        rows.append(row_idx)
+        for name, i in wanted:
+            columns[name].append(row[i] if i < len(row) else None)
+    return rows, columns
+
+def _float_column(values):
+    out = np.full(len(values), np.nan)
+    for i, val in enumerate(values):
+        try:
+            out[i] = float(str(val).replace("%", "")) if val not in (None, "") else np.nan
+        except ValueError:
+            pass
+    return out
+
+def machine_allocation(pressure_map=None):
+    # Same arithmetic as the entry form, vectorized over every Entries row
+    _load_numpy()
+    pressure_map = injection_pressure_map if pressure_map is None else pressure_map
+    rows, cols = _entries_columns(["ZF Part Number", "Part No", "Rawmaterial", "L(mm)", "W(mm)",
+                                   "No. of cavities -X direction", "No. of cavities -Y direction",
+                                   "Projected Area %", "M/c selected"])
+
+    pct = _float_column(cols["Projected Area %"])
+    pct = np.where(pct > 1, pct / 100.0, pct)  # "60%" text or a 0.6 percent-formatted cell
+    area = np.round(_float_column(cols["L(mm)"]) * _float_column(cols["W(mm)"]) * 1e-2 * pct
+                    * _float_column(cols["No. of cavities -X direction"])
+                    * _float_column(cols["No. of cavities -Y direction"]), 2)
+
+    materials = [str(m).strip() if m is not None else "" for m in cols["Rawmaterial"]]
+    names, inverse = np.unique(np.array(materials, dtype=object), return_inverse=True)
+    lookup = np.array([float(pressure_map.get(name, np.nan)) for name in names]) if len(names) else np.zeros(0)
+    inj = lookup[inverse] if len(rows) else np.zeros(0)
+    tonnage = np.round(inj * area * 1e-3 * 1.1, 2)
+
+    ladder = np.array(MACHINE_LADDER)
+    slot = np.searchsorted(ladder, np.nan_to_num(tonnage, nan=np.inf), side="left")
+    fits = np.isfinite(tonnage) & (slot < len(ladder))
+    suggested = np.where(fits, ladder[np.minimum(slot, len(ladder) - 1)], 0)
+    current = _float_column(cols["M/c selected"])
+
+    status = np.full(len(rows), "ok", dtype=object)
+    status[np.isfinite(current) & (current > suggested)] = "oversized"
+    status[np.isfinite(current) & (current < tonnage)] = "undersized"
+    status[~np.isfinite(current)] = "unassigned"
+    status[np.isfinite(tonnage) & ~fits] = "no machine"
+    status[~np.isfinite(tonnage)] = "missing inputs"
+
+    return {
+        "rows": rows, "zf_part": cols["ZF Part Number"], "part_no": cols["Part No"],
+        "rawmaterial": materials, "injection_pressure": inj, "projected_area": area,
+        "tonnage": tonnage, "current": current, "suggested": suggested, "status": status,
+    }
+
+def format_machine_report(alloc):
+    counts = {}
+    for s in alloc["status"]:
+        counts[s] = counts.get(s, 0) + 1
+    return f"{len(alloc['rows'])} parts: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items()))
+
+def write_machine_report(alloc, path):
+    def cell(val):
+        if isinstance(val, float) and math.isnan(val):
+            return ""
+        return val
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Entries row", "ZF Part Number", "Part No", "Rawmaterial", "Injection Pressure",
+                         "Total Projected Area", "Tonnage", "M/c selected", "Suggested M/c", "Status"])
+        for i, row in enumerate(alloc["rows"]):
+            writer.writerow([row, alloc["zf_part"][i], alloc["part_no"][i], alloc["rawmaterial"][i],
+                             cell(float(alloc["injection_pressure"][i])), cell(float(alloc["projected_area"][i])),
+                             cell(float(alloc["tonnage"][i])), cell(float(alloc["current"][i])),
+                             int(alloc["suggested"][i]) or "", alloc["status"][i]])
+
+def apply_machine_allocation(alloc):
+    # Writes Total Projected Area and the suggested M/c back to Entries with one save
+    flush_journal()
+    area_col = all_fields.index("Total Projected Area") + 1
+    machine_col = all_fields.index("M/c selected") + 1
+    if base.DB_PATH:
+        return _store_machine_allocation(alloc)
+    def apply(wb):
+        ws = wb["Entries"]
+        changed = 0
+        for i, row in enumerate(alloc["rows"]):
+            if not alloc["suggested"][i] or _cell_value(ws, row, 3) != alloc["zf_part"][i]:
+                continue  # the row moved or was replaced in a save merged in since the allocation ran
+            ws.cell(row=row, column=area_col).value = float(alloc["projected_area"][i])
+            if ws.cell(row=row, column=machine_col).value != int(alloc["suggested"][i]):
+                ws.cell(row=row, column=machine_col).value = int(alloc["suggested"][i])
+                changed += 1
+        return changed, (), None
+
+    try:
+        changed = _locked_save(apply)
+    except JarvisError:
+        raise
+    except Exception as e:
+        raise SaveError(str(e))
+    return changed
+
+def _store_machine_allocation(alloc):
+    con = _connect_store()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        version = _bump_store_version(con)
+        changed = 0
+        for i, row in enumerate(alloc["rows"]):
+            if not alloc["suggested"][i]:
+                continue
+            found = con.execute('SELECT "Total Projected Area", "M/c selected" FROM entries '
+                                'WHERE entries_row = ? AND zf_part = ?', (row, str(alloc["zf_part"][i]).strip())).fetchone()
+            area, machine = float(alloc["projected_area"][i]), int(alloc["suggested"][i])
+            if found is None or (_same_cell_value(found[0], area) and _same_cell_value(found[1], machine)):
+                continue  # replaced since the allocation ran, or already up to date
+            con.execute('UPDATE entries SET "Total Projected Area" = ?, "M/c selected" = ?, version = ? '
+                        'WHERE entries_row = ?', (area, machine, version, row))
+            changed += not _same_cell_value(found[1], machine)
+        con.execute("COMMIT")
+    except sqlite3.Error as e:
+        raise SaveError(f"Could not save to {_store_path()}: {e}")
+    finally:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        con.close()
+    return changed
+
+# Cost roll-up in Python. The cost model is the template's own Calculation formulas; nothing of it is restated
+# here. Part rows filled down from one another share a "shape", and each shape's formulas are compiled once into
+# column programs that price all of its parts in one NumPy pass, falling back to the formula evaluator's
+# functions (once per distinct input, e.g. per material) where NumPy has no equivalent. Constants such as the
+# Master Data rates and the Tooling lookups are read from the template package by the same evaluator. The
+# result columns are the ones the template's header rows caption with SHEET_SCHEMA's "cost_blocks" /
+# "cost_totals" labels, and `jarvis costs --check` compares the results with the whole workbook evaluated and
+# with the values Excel cached. Costs are kept per Entries row and only recomputed for rows whose inputs or
+# formulas, or the constants they read, changed.
+_cost_models = {}  # template path -> cost_model() of one template version
+_cost_cache = {}  # template (or store) path -> {"stamp", "inputs", "model", "parts": {entries row: (key, costs)}}
+_REF_END_RE = re.compile(r"^(\$?)([A-Za-z]{0,3})(\$?)(\d*)$")
+_ROW_EXPANDING = ("SUM", "MIN", "MAX", "AVERAGE", "AND", "OR")  # a range is the same as its cells as arguments
+_PART_SHEETS = ("entries", "calculation")
+
+def _vector(values):
+    # A list of cell values as the densest array: float64 when all are numbers, bool when all are flags
+    kinds = set(map(type, values))
+    if kinds <= {int, float}:
+        return np.array(values, dtype=float)
+    if kinds == {bool}:
+        return np.array(values, dtype=bool)
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return out
+
+def _as_float(value, flags=True):
+    # The value as float64 when NumPy can do the arithmetic itself (numbers, blanks, TRUE/FALSE), else None
+    if isinstance(value, np.ndarray):
+        if value.dtype == float:
+            return value
+        return value.astype(float) if flags and value.dtype == bool else None
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return float(value) if flags else None
+    return float(value) if isinstance(value, (int, float)) else None
+
+def _elementwise(fn, values):
+    # fn(*cell values) for each part, called once per distinct combination of the per-part values
+    arrays = [(i, value.tolist()) for i, value in enumerate(values) if isinstance(value, np.ndarray)]
+    if not arrays:
+        return fn(*values)
+    args, memo, out = list(values), {}, []
+    for k in range(len(arrays[0][1])):
+        key = tuple((type(a[k]), a[k]) for _, a in arrays)  # TRUE and 1 hash alike but aren't the same value
+        if key not in memo:
+            for i, a in arrays:
+                args[i] = a[k]
+            memo[key] = fn(*args)
+        out.append(memo[key])
+    return _vector(out)
+
+def _call_scalar(fn, ev, values):
+    # A _FORMULA_FUNCTIONS entry applied per part
+    return _elementwise(lambda *cells: fn(ev, [(lambda v: lambda ev: v)(v) for v in cells]), values)
+
+def _concat_pair(a, b):
+    return _fn_concatenate(None, [lambda ev: a, lambda ev: b])
+
+_NUMPY_ARITH = {"+": lambda x, y: x + y, "-": lambda x, y: x - y, "*": lambda x, y: x * y,
+                "/": lambda x, y: x / y, "^": lambda x, y: np.power(x, y)}
+_NUMPY_COMPARE = {"=": lambda x, y: x == y, "<>": lambda x, y: x != y, "<": lambda x, y: x < y,
+                  ">": lambda x, y: x > y, "<=": lambda x, y: x <= y, ">=": lambda x, y: x >= y}
+
+def _varith(op, a, b):
+    x, y = _as_float(a), _as_float(b)
+    if x is None or y is None or not (isinstance(a, np.ndarray) or isinstance(b, np.ndarray)):
+        return _elementwise(lambda a, b: _arith(op, a, b), [a, b])
+    with np.errstate(all="ignore"):
+        result = _NUMPY_ARITH[op](x, y)
+    bad = ~np.isfinite(result)
+    if not bad.any():
+        return result
+    out = result.astype(object)
+    out[bad] = NUM_ERROR
+    if op == "/":
+        out[np.broadcast_to(y == 0, out.shape)] = DIV0_ERROR
+    return out
+
+def _vcompare(op, a, b):
+    x, y = _as_float(a, flags=False), _as_float(b, flags=False)
+    if x is None or y is None or not (isinstance(a, np.ndarray) or isinstance(b, np.ndarray)):
+        return _elementwise(lambda a, b: _compare(op, a, b), [a, b])
+    return _NUMPY_COMPARE[op](x, y)
+
+def _vnumber(value):
+    x = _as_float(value)
+    return x if x is not None and isinstance(value, np.ndarray) else _elementwise(_to_number, [value])
+
+def _vselect(flags, yes, no):
+    # Per part: yes where the flag is set, no where it isn't, the flag itself where it is an error
+    if flags.dtype == object:
+        return _elementwise(lambda flag, a, b: flag if isinstance(flag, ExcelError) else (a if flag else b),
+                            [flags, yes, no])
+    x, y = _as_float(yes, flags=False), _as_float(no, flags=False)
+    if x is not None and y is not None and yes is not None and no is not None:
+        return np.where(flags, x, y)
+    return _elementwise(lambda flag, a, b: a if flag else b, [flags, yes, no])
+
+def _vfn_if(run, args):
+    cond = args[0](run)
+    if not isinstance(cond, np.ndarray):
+        # The same condition for every part: only the branch taken is computed, like in Excel
+        flag = _to_bool(cond)
+        if isinstance(flag, ExcelError):
+            return flag
+        if flag:
+            return args[1](run) if len(args) > 1 else True
+        return args[2](run) if len(args) > 2 else False
+    if cond.dtype == bool:
+        flags = cond
+    else:
+        flags = cond != 0 if cond.dtype == float else _elementwise(_to_bool, [cond])
+    return _vselect(flags, args[1](run) if len(args) > 1 else True, args[2](run) if len(args) > 2 else False)
+
+def _vfn_catch(caught):
+    # IFERROR / IFNA: the second argument where the first is a (matching) error
+    def call(run, args):
+        value = args[0](run)
+        if not isinstance(value, np.ndarray):
+            return args[1](run) if caught(value) else value
+        if value.dtype != object:
+            return value  # numbers and flags are never errors
+        flags = _vector([caught(v) for v in value.tolist()])
+        return _vselect(flags, args[1](run), value) if flags.any() else value
+    return call
+
+def _vrounding(mode):
+    scalar = _rounding(mode)
+
+    def call(run, args):
+        number = args[0](run)
+        digits = args[1](run) if len(args) > 1 else 0
+        x = _as_float(number)
+        if x is None or not isinstance(number, np.ndarray) or type(digits) not in (int, float):
+            return _call_scalar(scalar, run.ev, [number, digits])
+        factor = 10.0 ** int(digits)
+        scaled = np.abs(x) * factor
+        if mode == "up":
+            scaled = np.ceil(scaled - 1e-9)
+        elif mode == "down":
+            scaled = np.floor(scaled + 1e-9)
+        else:
+            scaled = np.floor(scaled + 0.5 + 1e-9)
+        return np.where(x == 0, 0.0, np.copysign(scaled / factor, x))
+    return call
+
+def _vaggregate(name, numpy_name):
+    scalar = _FORMULA_FUNCTIONS[name]
+
+    def call(run, args):
+        values = [arg(run) for arg in args]
+        numeric = all((isinstance(v, np.ndarray) and v.dtype == float) or type(v) in (int, float) for v in values)
+        if values and numeric and any(isinstance(v, np.ndarray) for v in values):
+            return getattr(np, numpy_name)(np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in values]), axis=0)
+        return _call_scalar(scalar, run.ev, values)
+    return call
+
+_VECTOR_FUNCTIONS = {
+    "IF": _vfn_if, "IFERROR": _vfn_catch(lambda v: isinstance(v, ExcelError)), "IFNA": _vfn_catch(lambda v: v == NA_ERROR),
+    "ROUND": _vrounding("half"), "ROUNDUP": _vrounding("up"), "ROUNDDOWN": _vrounding("down"),
+    "SUM": _vaggregate("SUM", "sum"), "MIN": _vaggregate("MIN", "min"), "MAX": _vaggregate("MAX", "max"),
+    "AVERAGE": _vaggregate("AVERAGE", "mean"),
+}
+
+class _RowCells:
+    # A range on one row that moves with the part, e.g. AC6:AF6: its cells, for the _ROW_EXPANDING functions
+    __slots__ = ("cells",)
+
+    def __init__(self, cells):
+        self.cells = cells
+
+def _program(arg):
+    if isinstance(arg, _RowCells):
+        raise FormulaError("A range of the part's own row is only supported inside " + "/".join(_ROW_EXPANDING))
+    return arg
+
+class _ColumnBuilder(_ClosureBuilder):
+    # Column programs: closures over a _PricingRun. A reference into the host row is that column for every
+    # part, any other reference with a relative row is read per part, an absolute one is a constant.
+    # deps collects the host-row columns, per-part references and constant sheets a formula reads
+    def __init__(self, host_sheet, host_row, deps):
+        super().__init__(host_sheet)
+        self.host_row, self.deps = host_row, deps
+
+    def _cell(self, sheet, row, col, moving):
+        if not moving:
+            self.deps["constants"].add(sheet.lower())
+            return lambda run: run.ev.value(sheet, row, col)
+        d = row - self.host_row
+        if d == 0 and sheet.lower() == self.host_sheet.lower():
+            self.deps["columns"].add(col)
+            return lambda run: run.column(col)
+        self.deps["refs"].add((sheet, d, col))
+        return lambda run: run.ref(sheet, d, col)
+
+    def operand(self, token):
+        if token.subtype != Token.RANGE:
+            return super().operand(token)
+        sheet, ref = _split_reference(token.value, self.host_sheet)
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(ref.replace("$", ""))
+        except ValueError:
+            raise FormulaError(f"Unsupported reference '{token.value}'")
+        moving = [m is not None and m.group(4) != "" and m.group(3) == "" for m in map(_REF_END_RE.match, ref.split(":"))]
+        if min_row == max_row and min_col == max_col and min_row is not None:
+            return self._cell(sheet, min_row, min_col, moving[0])
+        if not any(moving):
+            self.deps["constants"].add(sheet.lower())
+            return super().operand(token)
+        if min_row == max_row and all(moving):
+            return _RowCells([self._cell(sheet, min_row, col, True) for col in range(min_col, max_col + 1)])
+        if sheet.lower() == self.host_sheet.lower():
+            raise FormulaError(f"'{token.value}' spans the rows of other parts")
+        self.deps["refs"].add((sheet, None, None))
+        host_row = self.host_row
+        return lambda run: _vector([_Range(sheet, min_row + (row - host_row if moving[0] else 0), min_col,
+                                           max_row + (row - host_row if moving[-1] else 0), max_col)
+                                    for row in run.rows])
+
+    def call(self, name, args):
+        cells = []
+        for arg in args:
+            if isinstance(arg, _RowCells) and name in _ROW_EXPANDING:
+                cells.extend(arg.cells)
+            else:
+                cells.append(_program(arg))
+        vector = _VECTOR_FUNCTIONS.get(name)
+        if vector is not None:
+            return lambda run: vector(run, cells)
+        fn = _FORMULA_FUNCTIONS.get(name)
+        if fn is None:
+            raise FormulaError(f"Unsupported function {name}()")
+        return lambda run: _call_scalar(fn, run.ev, [arg(run) for arg in cells])
+
+    def prefix(self, op, operand):
+        operand = _program(operand)
+        if op == "-":
+            return lambda run: _varith("-", 0, operand(run))
+        return lambda run: _vnumber(operand(run))
+
+    def percent(self, inner):
+        inner = _program(inner)
+        return lambda run: _varith("/", inner(run), 100)
+
+    def infix(self, op, a, b):
+        a, b = _program(a), _program(b)
+        if op == "&":
+            return lambda run: _elementwise(_concat_pair, [a(run), b(run)])
+        if op in ("+", "-", "*", "/", "^"):
+            return lambda run: _varith(op, a(run), b(run))
+        return lambda run: _vcompare(op, a(run), b(run))
+
+def _compile_columns(formula, host_row, deps):
+    _load_openpyxl()
+    try:
+        tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+    except Exception as e:
+        raise FormulaError(f"Cannot parse {formula}: {e}")
+    return _program(_compile_tokens(tokens, _ColumnBuilder("Calculation", host_row, deps)))
+
+def _cell_result(value):
+    # What a formula cell shows: a range is #VALUE! and a blank 0, as in FormulaEvaluator.value()
+    if isinstance(value, np.ndarray):
+        if value.dtype != object:
+            return value
+        return _vector([VALUE_ERROR if isinstance(v, _Range) else (0 if v is None else v) for v in value.tolist()])
+    return VALUE_ERROR if isinstance(value, _Range) else (0 if value is None else value)
+
+def _cost_numbers(value, n):
+    # A result column as float64, NaN where the cell shows text, a flag or an error
+    if isinstance(value, np.ndarray):
+        if value.dtype == float:
+            return value
+        return np.array([v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                         for v in value.tolist()], dtype=float)
+    number = value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+    return np.full(n, float(number))
+
+class _PricingRun:
+    # One pass of a shape's programs over a group of parts; each column of the row is computed once for all of
+    # them. The parts' own Entries rows come from `entries` {column: values}, so what-ifs apply; the shape's
+    # value (not formula) columns from `literals` {column: values}; anything else from the template
+    def __init__(self, shape, ev, rows, entries, literals):
+        self.shape, self.ev, self.rows, self.entries, self.literals = shape, ev, rows, entries, literals
+        self._values = {}
+        self._in_progress = set()
+
+    def column(self, col):
+        if col not in self._values:
+            program = self.shape["programs"].get(col)
+            if program is None:
+                values = self.literals.get(col)
+                self._values[col] = None if values is None else _vector(values)
+            else:
+                if col in self._in_progress:
+                    raise FormulaError(f"Circular reference at Calculation!{get_column_letter(col)}{self.shape['row']}")
+                self._in_progress.add(col)
+                try:
+                    self._values[col] = _cell_result(program(self))
+                finally:
+                    self._in_progress.discard(col)
+        return self._values[col]
+
+    def ref(self, sheet, d, col):
+        key = (sheet, d, col)
+        if key not in self._values:
+            if sheet.lower() == "entries" and d == -sheet_schema()["calc_offset"] and col in self.entries:
+                self._values[key] = _vector(self.entries[col])
+            else:
+                self._values[key] = _vector([self.ev.value(sheet, row + d, col) for row in self.rows])
+        return self._values[key]
+
+def _cost_columns(headers):
+    # (blocks, totals) as [(title or total, Calculation column, column letter)] from the header captions
+    # {(row, col): value}; a caption on a lower header row wins over the same text on a banner above it
+    schema = sheet_schema()
+    found = {}
+    for (row, col), value in sorted(headers.items(), key=lambda item: (-item[0][0], item[0][1])):
+        found.setdefault(" ".join(str(value).split()).lower(), col)
+    columns, missing = [], []
+    for name, caption in schema["cost_blocks"] + schema["cost_totals"]:
+        col = found.get(" ".join(caption.split()).lower())
+        if col is None:
+            missing.append(caption)
+        else:
+            columns.append((name, col, get_column_letter(col)))
+    if missing:
+        rows = "-".join(str(row) for row in (min(EXPORT_HEADER_ROWS), max(EXPORT_HEADER_ROWS)))
+        raise CostModelError(f"No Calculation column is captioned {', '.join(repr(c) for c in missing)} in header "
+                             f"rows {rows}; fix the captions or SHEET_SCHEMA's cost_blocks / cost_totals")
+    n_blocks = len(schema["cost_blocks"])
+    return columns[:n_blocks], columns[n_blocks:]
+
+def _cost_shape(row_idx, formula_of, results):
+    # The programs of the result columns and of every column of the row they read, compiled from one row.
+    # formula_of(col) is the row's formula in that column, None for a value, which is then read per part
+    offset = -sheet_schema()["calc_offset"]
+    shape = {"row": row_idx, "formulas": {}, "programs": {}, "literals": [], "refs": set(), "constants": set()}
+    pending = list(results)
+    while pending:
+        col = pending.pop()
+        if col in shape["formulas"] or col in shape["literals"]:
+            continue
+        formula = formula_of(col)
+        if formula is None:
+            shape["literals"].append(col)
+            continue
+        deps = {"columns": set(), "refs": set(), "constants": set()}
+        try:
+            shape["programs"][col] = _compile_columns(formula, row_idx, deps)
+        except FormulaError as e:
+            raise CostModelError(f"Calculation!{get_column_letter(col)}{row_idx}: {e}")
+        shape["formulas"][col] = formula
+        shape["refs"] |= deps["refs"]
+        shape["constants"] |= deps["constants"]
+        pending.extend(deps["columns"])
+    shape["literals"].sort()
+    # Entries columns of the part's own row, which the caller passes in
+    shape["entries"] = sorted(col for sheet, d, col in shape["refs"]
+                              if sheet.lower() == "entries" and d == offset and col <= len(all_fields))
+    return shape
+
+def _formula_pieces(formula, host_row):
+    # The formula cut around its relative row numbers, kept as offsets from host_row, so rows filled down from
+    # one another have equal pieces. None when the tokens don't give the text back
+    _load_openpyxl()
+    try:
+        tokens = Tokenizer(formula).items
+    except Exception:
+        return None
+    pieces, text = [], "="
+    for token in tokens:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
+            text += token.value
+            continue
+        sheet, bang, ref = token.value.rpartition("!")
+        text += sheet + bang
+        for k, end in enumerate(ref.split(":")):
+            match = _REF_END_RE.match(end)
+            text += ":" if k else ""
+            if match and match.group(4) and not match.group(3):
+                pieces += [text + match.group(1) + match.group(2), int(match.group(4)) - host_row]
+                text = ""
+            else:
+                text += end
+    pieces = tuple(pieces) + (text,)
+    return pieces if _render_pieces(pieces, host_row) == formula else None
+
+def _render_pieces(pieces, row):
+    return "".join(piece if isinstance(piece, str) else str(row + piece) for piece in pieces)
+
+def _sheet_raw_cells(archive, part, template_path):
+    # {(row, col): value or "=formula"} of one sheet part. Cells of a shared formula are kept as
+    # (master formula, master cell) and translated by _TemplateCells.raw() when asked for
+    from xml.etree import ElementTree
+    cells, masters = {}, {}
+    with archive.open(part) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f"{_XL_NS}row":
+                continue
+            row_idx = int(elem.get("r"))
+            for cell in elem.iter(f"{_XL_NS}c"):
+                ref = cell.get("r")
+                col = _column_number(ref)
+                formula = cell.find(f"{_XL_NS}f")
+                if formula is not None and formula.text:
+                    value = "=" + formula.text
+                    if formula.get("t") == "shared":
+                        masters[formula.get("si")] = (value, ref)
+                elif formula is not None and formula.get("si") in masters:
+                    value = masters[formula.get("si")]
+                else:
+                    value = _xml_cell_value(cell, archive, template_path)
+                if value is not None:
+                    cells[(row_idx, col)] = value
+            elem.clear()
+    return cells
+
+class _TemplateCells(FormulaEvaluator):
+    # The formula evaluator over cells read straight from the template package instead of a parsed workbook:
+    # every sheet but Entries and Calculation at once, those two only if a formula asks for them
+    def __init__(self, template_path):
+        import zipfile
+        super().__init__(None)
+        self.path = template_path
+        self.cells = {}
+        with zipfile.ZipFile(template_path) as archive:
+            self.parts = {name: part for name, _, part in _package_sheets(archive)}
+            for name, part in self.parts.items():
+                if name.lower() not in _PART_SHEETS:
+                    self.cells[name] = _sheet_raw_cells(archive, part, template_path)
+
+    def _cells(self, sheet):
+        name = sheet if sheet in self.parts else next((n for n in self.parts if n.lower() == sheet.lower()), None)
+        if name is not None and name not in self.cells:
+            import zipfile
+            with zipfile.ZipFile(self.path) as archive:
+                self.cells[name] = _sheet_raw_cells(archive, self.parts[name], self.path)
+        return self.cells.get(name)
+
+    def raw(self, sheet, row, col):
+        key = (sheet, row, col)
+        if key in self.overrides:
+            return self.overrides[key]
+        cells = self._cells(sheet)
+        if cells is None:
+            return REF_ERROR
+        value = cells.get((row, col))
+        if isinstance(value, tuple):
+            from openpyxl.formula.translate import Translator
+            formula, origin = value
+            value = cells[(row, col)] = Translator(formula, origin=origin).translate_formula(
+                f"{get_column_letter(col)}{row}")
+        return value
+
+    def max_row(self, sheet):
+        if sheet not in self._max_rows:
+            cells = self._cells(sheet)
+            self._max_rows[sheet] = max((row for row, _ in cells), default=0) if cells else 0
+        return self._max_rows[sheet]
+
+    def max_column(self, sheet):
+        cells = self._cells(sheet)
+        return max((col for _, col in cells), default=0) if cells else 0
+
+    def sheets_read(self, sheets):
+        # The sheets whose cells can reach a program reading `sheets`, following the formulas on them
+        names = {sheet.lower(): sheet for sheet in self.parts}
+        seen, pending = set(), [sheet.lower() for sheet in sheets]
+        while pending:
+            sheet = pending.pop()
+            if sheet in seen or sheet not in names:
+                continue
+            seen.add(sheet)
+            if sheet in _PART_SHEETS:
+                continue
+            for (row, col), value in self._cells(names[sheet]).items():
+                formula = value[0] if isinstance(value, tuple) else value
+                if isinstance(formula, str) and formula.startswith("="):
+                    cells, ranges = _formula_references(formula, names[sheet])
+                    pending.extend(ref[0].lower() for ref in cells + ranges)
+        return {names[sheet] for sheet in seen}
+
+def cost_model(template_path=None):
+    # The template's cost model, rebuilt when the template changes: the result columns its headers caption,
+    # the shapes of the Calculation part rows, the shape (and per-part values) of each row, the evaluator for
+    # the constants and a key that changes whenever the priced results can. Rows without formulas in the result
+    # columns (not laid out yet, e.g. parts of the store not rendered) are priced with the shape most part rows
+    # have
+    import zipfile
+    from collections import Counter
+    from xml.etree import ElementTree
+    _load_openpyxl()
+    _load_numpy()
+    path = os.path.abspath(template_path or base.EXCEL_TEMPLATE)
+    stamp = _template_stamp(path)
+    model = _cost_models.get(path)
+    if model is not None and model["stamp"] == stamp:
+        return model
+    schema = sheet_schema()
+    first_row = schema["entries_first_row"] + schema["calc_offset"]
+    formula_tag = f"{_XL_NS}f"
+    shapes, rows, masters, counts, headers = [], {}, {}, Counter(), {}
+    blocks = totals = results = None
+
+    def formula(cell, row_idx, col):
+        f = cell.find(formula_tag)
+        if f is None:
+            return None
+        if f.text:
+            return "=" + f.text
+        master = masters.get(f.get("si")) if f.get("t") == "shared" else None
+        if master is None:
+            return None
+        text, master_row, master_col, pieces = master
+        if master_col == col:
+            if pieces is None:
+                pieces = master[3] = _formula_pieces(text, master_row) or ()
+            if pieces:
+                return _render_pieces(pieces, row_idx)
+        from openpyxl.formula.translate import Translator
+        return Translator(text, origin=f"{get_column_letter(master_col)}{master_row}").translate_formula(
+            f"{get_column_letter(col)}{row_idx}")
+
+    def matches(shape, row_idx, cells):
+        for col in shape["literals"]:
+            if col in cells and cells[col].find(formula_tag) is not None:
+                return False
+        for col, pieces in shape["pieces"].items():
+            f = cells[col].find(formula_tag) if col in cells else None
+            if f is None:
+                return False
+            if f.get("t") == "shared" and f.get("si") == shape["shared"].get(col):
+                continue
+            if pieces is None:
+                if row_idx != shape["row"]:
+                    return False
+            elif formula(cells[col], row_idx, col) != _render_pieces(pieces, row_idx):
+                return False
+        return True
+
+    with span("costs.model") as trace, zipfile.ZipFile(path) as archive:
+        part = _sheet_part_name(archive, "Calculation")
+        if part is None:
+            raise CostModelError(f"{path} has no Calculation sheet")
+        last = None
+        with archive.open(part) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag != f"{_XL_NS}row":
+                    continue
+                row_idx = int(elem.get("r"))
+                cells = {}
+                for cell in elem.iter(f"{_XL_NS}c"):
+                    col = _column_number(cell.get("r"))
+                    cells[col] = cell
+                    f_elem = cell.find(formula_tag)
+                    if f_elem is not None and f_elem.text and f_elem.get("t") == "shared":
+                        masters[f_elem.get("si")] = ["=" + f_elem.text, row_idx, col, None]
+                    if row_idx in EXPORT_HEADER_ROWS and f_elem is None:
+                        value = _xml_cell_value(cell, archive, path)
+                        if isinstance(value, str) and value.strip():
+                            headers[(row_idx, col)] = value
+                if row_idx >= first_row:
+                    if results is None:
+                        blocks, totals = _cost_columns(headers)
+                        results = [col for _, col, _ in blocks + totals]
+                    order = ([last] if last is not None else []) + [k for k in range(len(shapes)) if k != last]
+                    k = next((k for k in order if matches(shapes[k], row_idx, cells)), None)
+                    formula_of = lambda col: formula(cells[col], row_idx, col) if col in cells else None
+                    if k is None and all(formula_of(col) is not None for col in results):
+                        shape = _cost_shape(row_idx, formula_of, results)
+                        shape["pieces"] = {col: _formula_pieces(text, row_idx) for col, text in shape["formulas"].items()}
+                        shape["shared"] = {col: cells[col].find(formula_tag).get("si") for col in shape["formulas"]
+                                           if cells[col].find(formula_tag).get("t") == "shared"}
+                        shape["key"] = (tuple(sorted((col, pieces if pieces is not None else (row_idx, shape["formulas"][col]))
+                                                     for col, pieces in shape["pieces"].items())), tuple(shape["literals"]))
+                        shapes.append(shape)
+                        k = len(shapes) - 1
+                    if k is not None:
+                        rows[row_idx] = (k, tuple(_xml_cell_value(cells[col], archive, path) if col in cells else None
+                                                  for col in shapes[k]["literals"]))
+                        counts[k] += 1
+                        last = k
+                elem.clear()
+        trace.set(rows=len(rows), shapes=len(shapes))
+    if results is None:
+        blocks, totals = _cost_columns(headers)
+    if not shapes:
+        letters = ", ".join(letter for _, _, letter in blocks + totals)
+        raise CostModelError(f"No Calculation row from row {first_row} on has formulas in all of {letters}, "
+                             "the columns captioned as cost blocks and totals")
+
+    ev = _TemplateCells(path)
+    offset = -schema["calc_offset"]
+    read = set()
+    for shape in shapes:
+        read |= shape["constants"] | {sheet for sheet, d, _ in shape["refs"] if sheet.lower() != "entries" or d != offset}
+    read = ev.sheets_read(read)
+    # Constants on the big sheets (or per-part reads of other rows) change with any save: then so does the key
+    reads_parts = any(sheet.lower() in _PART_SHEETS for sheet in read)
+    key = (tuple(results), tuple(shape["key"] for shape in shapes),
+           tuple(sorted((sheet, hash(frozenset(ev._cells(sheet).items()))) for sheet in read if sheet.lower() not in _PART_SHEETS)),
+           stamp if reads_parts else None)
+    model = {"stamp": stamp, "path": path, "blocks": blocks, "totals": totals, "results": results,
+             "shapes": shapes, "rows": rows, "default": counts.most_common(1)[0][0], "ev": ev, "key": key}
+    _cost_models[path] = model
+    return model
+
+def _price_parts(model, k, rows, entries, literals):
+    # {result column: float64 per part} for parts laid out like shape k. rows are their Calculation rows,
+    # entries {Entries column: values} their own Entries rows, literals a tuple per part (None: all blank)
+    shape = model["shapes"][k]
+    values = {col: [lit[j] if lit else None for lit in literals] for j, col in enumerate(shape["literals"])}
+    run = _PricingRun(shape, model["ev"], rows, entries, values)
+    with np.errstate(all="ignore"):
+        return {col: _cost_numbers(run.column(col), len(rows)) for col in model["results"]}
+
+def _cost_inputs():
+    # Entries rows with a ZF Part Number: their row numbers and values (all_fields)
+    if base.DB_PATH:
+        stored = store_rows()
+    else:
+        _require_template()
+        stored = [(row_idx, values) for row_idx, values in stream_entries(1, len(all_fields))
+                  if values[2] not in (None, "")]
+    return [row_idx for row_idx, _ in stored], [tuple(values) for _, values in stored]
+
+def _cost_inputs_stamp():
+    if base.DB_PATH:
+        con = _connect_store()
+        try:
+            return "store", _store_meta(con).get("version")
+        finally:
+            con.close()
+    return "template", _template_stamp()
+
+def _excel_numbers(values):
+    # Blank cells count as 0, text that is not a number is #VALUE! (NaN here)
+    out = np.empty(len(values))
+    for i, val in enumerate(values):
+        number = _to_number(val)
+        out[i] = np.nan if isinstance(number, ExcelError) else number
+    return out
+
+def cost_rollup(overrides=None):
+    # Per-part and portfolio costs. overrides {field: value} go into every part's Entries row (a what-if such
+    # as a new scrap rate)
+    _load_numpy()
+    _require_template()  # The formulas and Master Data stay in the template, also with the SQLite store
+    model = cost_model()
+    schema = sheet_schema()
+    results = model["results"]
+    cache = _cost_cache.setdefault(os.path.abspath(base.DB_PATH or base.EXCEL_TEMPLATE),
+                                   {"stamp": None, "inputs": None, "model": None, "parts": {}})
+    # Entries are only read again when the template (or the store) changed, so what-ifs reprice from memory
+    stamp = _cost_inputs_stamp()
+    if cache["stamp"] != stamp:
+        cache["stamp"], cache["inputs"] = stamp, _cost_inputs()
+    rows, values = cache["inputs"]
+    if overrides:
+        changed = {}
+        for field, value in overrides.items():
+            if field not in all_fields:
+                raise ValidationError(f"'{field}' is not an Entries field")
+            changed[all_fields.index(field)] = value
+        values = [tuple(changed.get(i, v) for i, v in enumerate(row)) for row in values]
+    if cache["model"] != model["key"]:
+        cache["model"], cache["parts"] = model["key"], {}
+    parts = cache["parts"]
+    offset = schema["calc_offset"]
+    placed = [model["rows"].get(row_idx + offset, (model["default"], None)) for row_idx in rows]
+    stale = [i for i, row_idx in enumerate(rows) if parts.get(row_idx, (None,))[0] != (placed[i], values[i])]
+    with span("costs.rollup", parts=len(rows), recomputed=len(stale)):
+        groups = {}
+        for i in stale:
+            groups.setdefault(placed[i][0], []).append(i)
+        for k, group in groups.items():
+            priced = _price_parts(model, k, [rows[i] + offset for i in group],
+                                  {col: [values[i][col - 1] for i in group] for col in model["shapes"][k]["entries"]},
+                                  [placed[i][1] for i in group])
+            for j, i in enumerate(group):
+                parts[rows[i]] = ((placed[i], values[i]), tuple(float(priced[col][j]) for col in results))
+        for row_idx in set(parts) - set(rows):
+            del parts[row_idx]
+        table = np.array([parts[row_idx][1] for row_idx in rows]).reshape(len(rows), len(results))
+
+    n_blocks = len(model["blocks"])
+    totals = {name: table[:, n_blocks + k] for k, (name, _, _) in enumerate(model["totals"])}
+    column = lambda field: [row[all_fields.index(field)] for row in values]
+    with np.errstate(all="ignore"):
+        per_vehicle = totals["total"] * _excel_numbers(column("No.off (per Vehicle)"))
+        annual = per_vehicle * _excel_numbers(column("Volume P.A Nos"))
+    return dict(totals, **{
+        "rows": rows, "zf_part": column("ZF Part Number"), "part_no": column("Part No"),
+        "blocks": {title: table[:, k] for k, (title, _, _) in enumerate(model["blocks"])},
+        "per_vehicle": per_vehicle, "annual": annual, "recomputed": len(stale),
+    })
+
+def format_cost_report(costs):
+    lines = [f"{len(costs['rows'])} parts ({costs['recomputed']} recomputed), per-part cost totals:"]
+    for title, values in costs["blocks"].items():
+        lines.append(f"  {title:<18} {np.nansum(values):>16,.2f}")
+    for title, key in (("Part cost", "part_cost"), ("Overheads", "overheads"), ("Total", "total")):
+        lines.append(f"  {title:<18} {np.nansum(costs[key]):>16,.2f}")
+    lines.append(f"Annual spend (total x No.off x Volume P.A): {np.nansum(costs['annual']):,.2f}")
+    missing = int(np.sum(~np.isfinite(costs["total"])))
+    if missing:
+        lines.append(f"{missing} parts have no numeric total (text or an error in the template) and are left out")
+    return "\n".join(lines)
+
+def write_cost_report(costs, path):
+    def cell(val):
+        val = float(val)
+        return "" if math.isnan(val) else round(val, 2)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Entries row", "ZF Part Number", "Part No"] + list(costs["blocks"])
+                        + ["Part cost", "Overheads", "Total", "Per vehicle", "Annual"])
+        for i, row in enumerate(costs["rows"]):
+            writer.writerow([row, costs["zf_part"][i], costs["part_no"][i]]
+                            + [cell(values[i]) for values in costs["blocks"].values()]
+                            + [cell(costs[key][i]) for key in ("part_cost", "overheads", "total", "per_vehicle", "annual")])
+
+def _same_cost(got, want):
+    if isinstance(want, bool) or not isinstance(want, (int, float)):
+        return math.isnan(got)  # text or an error in the cell: no cost either way
+    return abs(got - want) <= 0.005
+
+def check_cost_rollup(sample=20):
+    # The roll-up against two independent evaluations of the same cells, for `sample` parts spread over the
+    # sheet: the formula evaluator over the whole parsed workbook and, where the template was last saved by
+    # Excel, the values Excel cached. Returns how much was compared and the differences as text
+    sync_template()
+    costs = cost_rollup()
+    schema = sheet_schema()
+    model = cost_model()
+    columns = ([(title, col, letter, costs["blocks"][title]) for title, col, letter in model["blocks"]]
+               + [(name, col, letter, costs[name]) for name, col, letter in model["totals"]])
+    step = max(1, len(costs["rows"]) // max(1, sample))
+    picked = {costs["rows"][i] + schema["calc_offset"]: i for i in range(0, len(costs["rows"]), step)[:sample]}
+    cached = {}
+    if picked:
+        for row_idx, values in stream_sheet("Calculation", min(picked), 1, max(col for _, col, _, _ in columns)):
+            if row_idx in picked:
+                cached[row_idx] = values
+            if row_idx >= max(picked):
+                break
+    evaluator = FormulaEvaluator(get_workbook(base.EXCEL_TEMPLATE, data_only=False))
+    report = {"parts": len(picked), "cells": 0, "excel_cells": 0, "problems": []}
+    for calc_row, i in sorted(picked.items()):
+        for title, col, letter, values in columns:
+            got = float(values[i])
+            checks = [("formulas", evaluator.value("Calculation", calc_row, col))]
+            excel = cached.get(calc_row, (None,) * col)[col - 1]
+            if excel is not None:
+                checks.append(("Excel", excel))
+                report["excel_cells"] += 1
+            report["cells"] += 1
+            for source, want in checks:
+                if not _same_cost(got, want):
+                    report["problems"].append(f"{costs['zf_part'][i]} {title} (Calculation!{letter}{calc_row}): "
+                                              f"{source} {want!r}, roll-up {got!r}")
+    return report
+
+# Calculation results of the store's parts (`jarvis db results`), kept in its results table
+def compute_results(entries_rows=None):
+    # Calculation row values per part ({column letter: value}) as the rendered template computes them,
+    # kept in the results table and recomputed only for parts whose entry changed since
+    _load_openpyxl()
+    sync_template()
+    con = _connect_store()
+    try:
+        stale = con.execute("SELECT e.entries_row, e.zf_part, e.part_no, e.version FROM entries e "
+                            "LEFT JOIN results r USING (entries_row) "
+                            "WHERE r.version IS NULL OR r.version != e.version ORDER BY e.entries_row").fetchall()
+    finally:
+        con.close()
+    if entries_rows is not None:
+        wanted = set(entries_rows)
+        stale = [row for row in stale if row[0] in wanted]
+    if not stale:
+        return {}
+    wb = get_workbook(base.EXCEL_TEMPLATE, data_only=False)
+    evaluator = FormulaEvaluator(wb)
+    computed, stored = {}, []
+    with span("store.results", parts=len(stale)):
+        for entries_row, zf_part, part_no, version in stale:
+            hit = lookup_part(zf_part, part_no)
+            calc_row = hit["calc_row"] if hit and hit["calc_row"] else entries_row + sheet_schema()["calc_offset"]
+            data = {}
+            for col in range(1, EXPORT_COLUMNS["Calculation"] + 1):
+                if evaluator.raw("Calculation", calc_row, col) is None:
+                    continue
+                try:
+                    value = evaluator.value("Calculation", calc_row, col)
+                except FormulaError as e:
+                    value = f"#ERROR: {e}"
+                data[get_column_letter(col)] = value if not isinstance(value, ExcelError) else str(value)
+            computed[entries_row] = data
+            stored.append((entries_row, version, calc_row, json.dumps(data, default=str)))
+    con = _connect_store()
+    try:
+        con.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", stored)
+    finally:
+        con.close()
+    return computed
+
+def part_results(zf_part, part_no=None):
+    con = _connect_store()
+    try:
+        sql = ("SELECT e.entries_row, e.version, r.version, r.data FROM entries e "
+               "LEFT JOIN results r USING (entries_row) WHERE e.zf_part = ?")
+        params = (zf_part,)
+        if part_no is not None:
+            sql += " AND e.part_no = ?"
+            params += (part_no,)
+        found = con.execute(sql + " ORDER BY e.entries_row LIMIT 1", params).fetchone()
+    finally:
+        con.close()
+    if not found:
+        raise PartNotFoundError(f"ZF Part Number '{zf_part}' not found in {_store_path()}")
+    entries_row, version, result_version, data = found
+    if result_version == version:
+        return json.loads(data)
+    return compute_results([entries_row])[entries_row]
+
+# Design-space search for one part: every combination of the cavity, Rawmaterial and M/c selected
+# dropdowns, minus machines too small for the tonnage, priced with the cost roll-up and ranked cheapest first
+DESIGN_FIELDS = ["No. of cavities -X direction", "No. of cavities -Y direction", "Rawmaterial", "M/c selected"]
+
+def part_entry(zf_part, part_no=None):
+    # The Entries row of a part as {field: value}
+    if base.DB_PATH:
+        where, params = "WHERE zf_part = ?", (zf_part,)
+        if part_no is not None:
+            where, params = where + " AND part_no = ?", params + (part_no,)
+        found = store_rows(where, params, 1)
+        if found:
+            return dict(zip(all_fields, found[0][1]))
+    else:
+        _require_template()
+        for _, values in stream_entries(1, len(all_fields)):
+            if (str(values[2]).strip() if values[2] is not None else "") != zf_part:
+                continue
+            if part_no is None or (str(values[3]).strip() if values[3] is not None else "") == part_no:
+                return dict(zip(all_fields, values))
+    raise PartNotFoundError(f"ZF Part Number '{zf_part}' not found in Entries.")
+
+def _design_candidates(entry, options, pressure_map):
+    # (cav X, cav Y, material, machine, tonnage) for every machine at least as large as the tonnage.
+    # Tonnage only depends on cavities and material, so the machine ladder is cut once per pair.
+    base = [_to_number(entry.get(field)) for field in ("L(mm)", "W(mm)", "Projected Area %")]
+    if any(isinstance(v, ExcelError) or not v for v in base):
+        raise ValidationError("L(mm), W(mm) and Projected Area % are needed to work out the tonnage")
+    length, width, pct = base
+    pct = pct / 100.0 if pct > 1 else pct
+    machines = sorted(int(m) for m in options["M/c selected"])
+    candidates, pruned = [], 0
+    for cav_x in options["No. of cavities -X direction"]:
+        for cav_y in options["No. of cavities -Y direction"]:
+            area = round(length * width * 1e-2 * pct * int(cav_x) * int(cav_y), 2)
+            for material in options["Rawmaterial"]:
+                if material not in pressure_map:
+                    pruned += len(machines)
+                    continue
+                tonnage = round(pressure_map[material] * area * 1e-3 * 1.1, 2)
+                first = bisect_left(machines, tonnage)
+                pruned += first
+                candidates.extend((int(cav_x), int(cav_y), material, machine, tonnage) for machine in machines[first:])
+    return candidates, pruned
+
+def _design_costs(template_path, entry, candidates, calc_row):
+    # Runs in worker processes too: one pass of the part's Calculation formulas over the candidates as if each
+    # were its own part. Workers are spawned, so each builds the cost model of template_path once
+    _load_numpy()
+    model = cost_model(template_path)
+    k, literals = model["rows"].get(calc_row, (model["default"], None))
+    shape = model["shapes"][k]
+    entries = {col: [entry.get(all_fields[col - 1])] * len(candidates) for col in shape["entries"]}
+    for j, field in enumerate(DESIGN_FIELDS):
+        col = all_fields.index(field) + 1
+        if col in entries:
+            entries[col] = [candidate[j] for candidate in candidates]
+    priced = _price_parts(model, k, [calc_row or shape["row"]] * len(candidates), entries, [literals] * len(candidates))
+    total = priced[dict((name, col) for name, col, _ in model["totals"])["total"]]
+    return [(float(total[i]), {title: float(priced[col][i]) for title, col, _ in model["blocks"]})
+            for i in range(len(candidates))]
+
+def optimize_design(entry, top=10, workers=1, options=None, pressure_map=None, progress=None):
+    # options {field: [values]} narrows DESIGN_FIELDS (default: their dropdowns); workers as in export_batch.
+    # A part already in the template is priced with the formulas of its own Calculation row. Workers are
+    # spawned, not forked: the entry form calls this from a job thread, and a fork copies the other threads'
+    # locks (Tk's, the workbook cache's) in whatever state they are in
+    pressure_map = injection_pressure_map if pressure_map is None else pressure_map
+    options = {field: list((options or {}).get(field) or dropdowns[field]) for field in DESIGN_FIELDS}
+    _require_template()
+    template_path = os.path.abspath(base.EXCEL_TEMPLATE)
+    cost_model(template_path)
+    zf_part, part_no = (str(entry.get(field) or "").strip() for field in ("ZF Part Number", "Part No"))
+    hit = lookup_part(zf_part, part_no or None) if zf_part else None
+    calc_row = hit["calc_row"] if hit else None
+    with span("design.search") as trace:
+        candidates, pruned = _design_candidates(entry, options, pressure_map)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(candidates) // 500 or 1))
+        trace.set(candidates=len(candidates), pruned=pruned, workers=workers)
+        if workers <= 1:
+            priced = _design_costs(template_path, entry, candidates, calc_row)
+        else:
+            n_chunks = workers * 4
+            chunks = [candidates[i::n_chunks] for i in range(n_chunks)]
+            by_chunk = {}
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {pool.submit(_design_costs, template_path, entry, chunk, calc_row): k
+                           for k, chunk in enumerate(chunks)}
+                try:
+                    for future in as_completed(futures):
+                        by_chunk[futures[future]] = future.result()
+                        if progress:
+                            progress(len(by_chunk), n_chunks, f"{len(by_chunk)} of {n_chunks} chunks")
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            priced = [None] * len(candidates)
+            for k, results in by_chunk.items():
+                priced[k::n_chunks] = results
+
+    # Cheapest first; among equal costs the smaller machine and the lower tonnage
+    ranked = sorted(range(len(candidates)), key=lambda i: (math.isnan(priced[i][0]), priced[i][0],
+                                                          candidates[i][3], candidates[i][4]))
+    best = []
+    for i in ranked[:top]:
+        cav_x, cav_y, material, machine, tonnage = candidates[i]
+        best.append(dict(zip(DESIGN_FIELDS, (cav_x, cav_y, material, machine)),
+                         tonnage=tonnage, total=priced[i][0], blocks=priced[i][1]))
+    return {"combinations": len(candidates) + pruned, "pruned": pruned, "evaluated": len(candidates), "best": best}
+
+_cost_validations = {}  # template path -> (stamp, problem or None)
+
+def validate_cost_model(sample=5):
+    # None when check_cost_rollup() finds the roll-up equal to the template's formulas, else what is wrong.
+    # Kept per template version, so the entry form only checks once per save
+    path = os.path.abspath(base.EXCEL_TEMPLATE)
+    done = _cost_validations.get(path)
+    if done is not None and done[0] == _template_stamp(path):
+        return done[1]
+    try:
+        check = check_cost_rollup(sample)
+        if check["problems"]:
+            problem = f"{len(check['problems'])} of {check['cells']} cells differ, e.g. {check['problems'][0]}"
+        else:
+            problem = None if check["cells"] else "no parts to compare"
+    except JarvisError as e:
+        problem = str(e)
+    if problem is not None:
+        log(f"Cost model not validated against {path}: {problem}", "warning")
+    _cost_validations[path] = (_template_stamp(path), problem)
+    return problem
+
+def format_design_report(result):
+    lines = [f"{result['combinations']} combinations, {result['pruned']} pruned (machine below tonnage), "
+             f"{result['evaluated']} priced"]
+    for rank, option in enumerate(result["best"], start=1):
+        lines.append(f"{rank:>3}. {option['No. of cavities -X direction']}x{option['No. of cavities -Y direction']} "
+                     f"cavities, {option['Rawmaterial']}, {option['M/c selected']} t machine "
+                     f"({option['tonnage']} t needed): {option['total']:.2f} per part")
+    return "\n".join(lines)
@@ -0,0 +1,185 @@
+# Entries rows: validation of typed or imported values and writing an entry, with its Calculation links
+import os
+
+from . import base
+from .base import SaveError, ValidationError, all_fields, dropdowns, fields, numeric_fields, sheet_schema
+from .workbook import _cell_value, _norm, _open_part_index, _write_row
+
+# openpyxl is imported by _load_openpyxl() on first use, so importing this module stays cheap
+load_workbook = Workbook = Alignment = Font = None
+
+def _load_openpyxl():
+    global load_workbook, Workbook, Alignment, Font
+    if load_workbook is None:
+        from openpyxl import load_workbook, Workbook
+        from openpyxl.styles import Alignment, Font
+
+# Same checks as the entry form: dropdowns must be filled, numeric fields are cast
+def _clean_value(val):
+    if val is None:
+        return ""
+    if isinstance(val, str):
+        val = val.strip()
+        whole, dot, frac = val.partition(".")
+        if dot and whole.lstrip("-").isdigit() and frac.strip("0") == "":
+            return whole  # "2.0" from a CSV export means the dropdown value "2"
+        return val
+    if isinstance(val, float) and val.is_integer():
+        return int(val)
+    return val
+
+def validate_entries(raw_entries, require_zf=False):
+    # Column at a time over all rows: returns (entries, errors) where errors maps the
+    # row position to every problem found in that row and entries[i] is None for bad rows
+    errors = {}
+    columns = {}
+    for field in fields:
+        column = [_clean_value(raw.get(field, "")) for raw in raw_entries]
+        blanks = [i for i, val in enumerate(column) if val == ""]
+        if field in dropdowns:
+            for i in blanks:
+                errors.setdefault(i, []).append(f"Select a value for '{field}'")
+        elif require_zf and field == "ZF Part Number":
+            for i in blanks:
+                errors.setdefault(i, []).append("'ZF Part Number' is required")
+        if field in dropdowns:
+            allowed = set(dropdowns[field])
+            for i, val in enumerate(column):
+                if val != "" and str(val) not in allowed:
+                    errors.setdefault(i, []).append(f"'{field}' must be one of the listed values, got '{val}'")
+        if field in numeric_fields:
+            cast = numeric_fields[field]
+            for i, val in enumerate(column):
+                if val == "":
+                    continue
+                try:
+                    column[i] = cast(val)
+                except (TypeError, ValueError):
+                    errors.setdefault(i, []).append(f"'{field}' must be a number, got '{val}'")
+        columns[field] = column
+
+    entries = [None if i in errors else {field: columns[field][i] for field in fields}
+               for i in range(len(raw_entries))]
+    return entries, errors
+
+def parse_entry(raw_entry):
+    entries, errors = validate_entries([raw_entry])
+    if errors:
+        raise ValidationError(errors[0][0])
+    return entries[0]
+
+# Writing entries into a parsed workbook; journal.save_entries() does the parse, the lock and the save
+def _load_entries_workbook():
+    _load_openpyxl()
+    # Parse a private copy: the save writes rows and strips validations, and the cached workbook may be read by
+    # an export on another thread meanwhile. It replaces the cached one only once it is saved, so a failed
+    # save never leaves a half-applied workbook in the cache
+    wb = load_workbook(base.EXCEL_TEMPLATE) if os.path.exists(base.EXCEL_TEMPLATE) else Workbook()
+
+    # Create Entries sheet if it doesn't exist
+    if "Entries" not in wb.sheetnames:
+        ws = wb.create_sheet("Entries")
+        for col_index, field in enumerate(all_fields, start=1):
+            ws.cell(row=2, column=col_index).value = field
+            ws.cell(row=2, column=col_index).font = Font(bold=True)
+            ws.cell(row=2, column=col_index).alignment = Alignment(horizontal="center")
+    else:
+        wb["Entries"].data_validations.dataValidation = []
+
+    # Transfer to Calculation sheet with formulas
+    if "Calculation" not in wb.sheetnames:
+        wb.create_sheet("Calculation")
+    wb["Calculation"].data_validations.dataValidation = []
+    return wb
+
+def _find_entry_row(ws, zf_part, part_no, new_rows):
+    # Rows added earlier in this save, then the part index (trusted when it matches the file), then a scan
+    if (zf_part, part_no) in new_rows:
+        return new_rows[(zf_part, part_no)]
+    con = _open_part_index()
+    if con is not None:
+        try:
+            rows = con.execute("SELECT entries_row FROM parts WHERE zf_norm = ? AND part_no_norm = ?",
+                               (_norm(zf_part), _norm(part_no))).fetchall()
+        finally:
+            con.close()
+        if not rows:
+            return None
+        row_zf = ws.cell(row=rows[0][0], column=3).value
+        row_pn = ws.cell(row=rows[0][0], column=4).value
+        if (str(row_zf).strip() if row_zf else "") == zf_part and (str(row_pn).strip() if row_pn else "") == part_no:
+            return rows[0][0]
+    for row_idx, row in enumerate(ws.iter_rows(min_row=3, max_row=ws.max_row), start=3):
+        zf_value = str(row[2].value).strip() if row[2].value else ""
+        part_value = str(row[3].value).strip() if row[3].value else ""
+        if zf_value == zf_part and part_value == part_no:
+            return row_idx
+    return None
+
+def _apply_entry(wb, entry_data, new_rows):
+    ws = wb["Entries"]
+    calc_ws = wb["Calculation"]
+
+    zf_part = str(entry_data.get("ZF Part Number", "")).strip()
+    part_no = str(entry_data.get("Part No", "")).strip()
+
+    # Look for existing row to edit
+    overwrite_row = _find_entry_row(ws, zf_part, part_no, new_rows)
+
+    # If match found, update that row; else add new row
+    if overwrite_row:
+        target_row = overwrite_row
+    else:
+        target_row = ws.max_row + 1 if ws.max_row >= 2 else 3
+        new_rows[(zf_part, part_no)] = target_row
+    sl_no = target_row - 2
+    entry_data["Sl.#"] = sl_no
+
+    # Write to Entries
+    _write_row(ws, target_row, sheet_schema()["entries_columns"], [entry_data.get(field, "") for field in all_fields])
+
+    entry_row = target_row
+    calc_row = _write_calculation_links(calc_ws, entry_row)
+
+    return {"sl_no": sl_no, "row": target_row, "updated": bool(overwrite_row),
+            "zf_part": zf_part, "part_no": part_no, "calc_row": calc_row}
+
+def _write_calculation_links(calc_ws, entry_row):
+    # Calculation row for an Entries row: links to the Entries cells plus the Tooling lookups
+    schema = sheet_schema()
+    calc_row = entry_row + schema["calc_offset"]
+    _check_tool_match_column(calc_ws, list(range(1, schema["entries_first_row"] + schema["calc_offset"])) + [calc_row])
+    links = schema["calc_links"]
+    _write_row(calc_ws, calc_row, [calc_col for calc_col, _ in links],
+               [f"=Entries!{entry_col}{entry_row}" for _, entry_col in links])
+
+    # Tooling Lookup Formulas
+    lookups = _tool_lookup_formulas(calc_row)
+    _write_row(calc_ws, calc_row, list(lookups), list(lookups.values()))
+    return calc_row
+
+def _is_tool_match(value):
+    text = str(value or "").upper()
+    return text.startswith("=MATCH(") and "TOOLING!" in text
+
+def _check_tool_match_column(calc_ws, rows):
+    # The MATCH helper column (SHEET_SCHEMA tool_match) is only ever written where it is blank or already ours
+    match_col, match_letter = sheet_schema()["calc_tool_match"]
+    for row in rows:
+        value = _cell_value(calc_ws, row, match_col)
+        if value not in (None, "") and not _is_tool_match(value):
+            raise SaveError(f"Calculation!{match_letter}{row} holds {value!r}, but the Tooling lookups need column "
+                            f"{match_letter} for their MATCH; set SHEET_SCHEMA's tool_match to a free column")
+
+def _tool_lookup_formulas(calc_row, last_row=None):
+    # {Calculation column: formula}: one MATCH of the part's Sl.# in Tooling that the result columns INDEX,
+    # over the Tooling rows that hold parts only, so Excel neither scans whole columns nor matches twice
+    schema = sheet_schema()
+    first, last = schema["tooling_lookup_rows"]
+    last = last_row or last
+    match_col, match_letter = schema["calc_tool_match"]
+    calc_key, tooling_key = schema["tool_key"]
+    formulas = {match_col: f"=MATCH({calc_key}{calc_row},Tooling!${tooling_key}${first}:${tooling_key}${last},0)"}
+    for calc_col, _, letter in schema["calc_tool_results"]:
+        formulas[calc_col] = f'=IFNA(INDEX(Tooling!${letter}${first}:${letter}${last},{match_letter}{calc_row}),"")'
+    return formulas
@@ -0,0 +1,1510 @@
+# Export engines: one part copied into a new workbook with openpyxl (export_logic), many parts into one
+# workbook (portfolio_logic), the template package cloned part by part (export_xml), and batch exports
+from bisect import bisect_left, bisect_right
+from copy import copy
+import math
+import os
+import weakref
+
+from . import base
+from .base import (EXPORT_COLUMNS, EXPORT_HEADER_ROWS, EXPORT_MAX_ROWS, EXPORT_SHEETS, ExportError, JarvisError,
+                   PartNotFoundError, ValidationError, all_fields, _column_number, log, sheet_schema, span)
+from .workbook import (_XL_NS, _cell_value, find_entry_row, get_workbook, _indexed_rows, lookup_part, _norm,
+                       _package_sheets, _require_template, _row_values, _sheet_part_name, _stored_cells, stream_sheet,
+                       _template_stamp, _write_row, _xml_cell_value)
+from .formulas import (EXCEL_MAX_COLUMNS, ExcelError, FormulaError, FormulaEvaluator, _formula_references,
+                       _split_reference, _template_dependency_graph)
+from .entries import _tool_lookup_formulas
+from .journal import sync_template
+
+# openpyxl is imported by _load_openpyxl() on first use, so importing this module stays cheap
+Workbook = Cell = get_column_letter = range_boundaries = Tokenizer = Token = None
+
+def _load_openpyxl():
+    global Workbook, Cell, get_column_letter, range_boundaries, Tokenizer, Token
+    if Workbook is None:
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import Cell
+        from openpyxl.utils import get_column_letter
+        from openpyxl.utils.cell import range_boundaries
+        from openpyxl.formula.tokenizer import Tokenizer, Token
+
+# Per-export overlay: the cells an export changes (Tooling/Summary row 6, Calculation AQ/AR, Import A2)
+# live here instead of in the template workbook, so one cached, parsed template can serve concurrent exports.
+# Reads go through _cell_value/_source_cell, which never create cells in the shared worksheets.
+def _source_cell(ws, row, col):
+    cell = _stored_cells(ws).get((row, col))
+    return cell if cell is not None else Cell(ws, row=row, column=col)
+
+class ExportOverlay:
+    def __init__(self, evaluator=None):
+        # Values-only exports share the evaluator's overrides, so changed cells are also recalculated
+        self.evaluator = evaluator
+        self.cells = evaluator.overrides if evaluator is not None else {}
+
+    def raw(self, ws, row, col):
+        key = (ws.title, row, col)
+        if key in self.cells:
+            return self.cells[key]
+        return _cell_value(ws, row, col)
+
+    def update(self, changes):
+        self.cells.update(changes)
+        if self.evaluator is not None:
+            self.evaluator.invalidate(changes)
+
+def update_tooling_by_zf_part_number(wb, zf_part, overlay=None):
+    # Without an overlay the Tooling row is written into the workbook itself
+    with span("tooling.update", zf_part=zf_part):
+        changes = _tooling_changes(wb, zf_part, overlay)
+        if overlay is not None:
+            overlay.update(changes)
+        else:
+            for (sheet, row, col), value in changes.items():
+                wb[sheet].cell(row=row, column=col).value = value
+        return True
+
+def _tooling_changes(wb, zf_part, overlay):
+    try:
+        entries_ws = wb["Entries"]
+        calculation_ws = wb["Calculation"]
+        evaluator = overlay.evaluator if overlay is not None else None
+
+        found_entries_row, found_calc_row = _indexed_rows(wb, zf_part)
+
+        # Find the correct row in Entries sheet
+        for row in ([] if found_entries_row else range(3, entries_ws.max_row + 1)):
+            cell_val = _cell_value(entries_ws, row, 3)  # Column C = ZF Part Number
+            if cell_val and str(cell_val).strip().lower() == zf_part.strip().lower():
+                found_entries_row = row
+                break
+
+        if not found_entries_row:
+            raise PartNotFoundError(f"ZF Part Number '{zf_part}' not found in Entries sheet.")
+
+        # Find the correct row in Calculation sheet
+        link = f"=entries!c{found_entries_row}"
+        for row in ([] if found_calc_row else range(6, calculation_ws.max_row + 1)):
+            cell_val = _cell_value(calculation_ws, row, 3)  # Column C = ZF Part Number or its Entries link
+            if cell_val and str(cell_val).strip().lower() in (zf_part.strip().lower(), link):
+                found_calc_row = row
+                break
+
+        # Copy data from found entries row to tooling row 6 (columns A to AA)
+        schema = sheet_schema()
+        tooling_row = schema["tooling_row"]
+        entry_values = _row_values(entries_ws, found_entries_row, schema["tooling_entries"][-1])
+        changes = {("Tooling", tooling_row, col): entry_values[col - 1] for col in schema["tooling_entries"]}
+
+        # Copy calculation data if found (AP → AB, AS → AC)
+        if found_calc_row and evaluator is not None:
+            # Values-only export: copy the computed results, not the row-relative formulas.
+            # Tooling A:AA goes in first, AP/AS may depend on it
+            overlay.update(changes)
+            changes = {}
+            for tooling_col, calc_col, _ in schema["tooling_calc"]:
+                value = evaluator.value("Calculation", found_calc_row, calc_col)
+                changes[("Tooling", tooling_row, tooling_col)] = value.code if isinstance(value, ExcelError) else value
+        elif found_calc_row:
+            # Formulas: link to the part's Calculation row, which "with formulas" exports move under the headers
+            calc_row = max(EXPORT_HEADER_ROWS) + 1 if overlay is not None else found_calc_row
+            for tooling_col, _, letter in schema["tooling_calc"]:
+                changes[("Tooling", tooling_row, tooling_col)] = f"=Calculation!{letter}{calc_row}"
+        return changes
+    except JarvisError:
+        raise
+    except Exception as e:
+        raise ExportError(f"Failed to update tooling sheet.\n{e}")
+
+# Headless export: returns the path of the exported file
+def export_part(zf_part, export_type="with", output_dir=None, progress=None, prune=None):
+    sync_template()
+    _require_template()
+    if EXPORT_ENGINE == "xml":
+        return export_xml(zf_part, export_type, output_dir=output_dir, progress=progress, prune=prune)
+    wb = get_workbook(base.EXCEL_TEMPLATE, data_only=False)
+    return export_logic(wb, zf_part, export_type, output_dir=output_dir, progress=progress, prune=prune)
+
+
+# Style interning for export copies: each distinct source style is built once in the
+# target workbook, every other cell with the same source style reuses the target style ids
+def _style_copier():
+    interned = {}
+
+    def copy_style(src, tgt):
+        if not src.has_style:
+            return
+        # Style ids are per workbook, so the source workbook is part of the key
+        key = (id(src.parent.parent), tuple(src._style))
+        style = interned.get(key)
+        if style is None:
+            tgt.font = copy(src.font)
+            tgt.border = copy(src.border)
+            tgt.fill = copy(src.fill)
+            tgt.number_format = copy(src.number_format)
+            tgt.protection = copy(src.protection)
+            tgt.alignment = copy(src.alignment)
+            interned[key] = copy(tgt._style)
+        else:
+            tgt._style = copy(style)
+
+    return copy_style
+
+# Merged ranges of a sheet sorted by first and last row, built once per (cached) source sheet
+_merged_index_cache = weakref.WeakKeyDictionary()
+
+def _merged_index(ws):
+    ranges = ws.merged_cells.ranges
+    cached = _merged_index_cache.get(ws)
+    if cached and cached["count"] == len(ranges):
+        return cached
+    by_min = sorted((m.min_row, m.max_row, str(m)) for m in ranges)
+    by_max = sorted(by_min, key=lambda m: m[1])
+    index = {
+        "count": len(ranges),
+        "ranges": [m[2] for m in by_min],
+        "by_min": by_min, "min_rows": [m[0] for m in by_min],
+        "by_max": by_max, "max_rows": [m[1] for m in by_max],
+    }
+    _merged_index_cache[ws] = index
+    return index
+
+def _merged_ranges_starting(index, first_row, last_row):
+    lo = bisect_left(index["min_rows"], first_row)
+    hi = bisect_right(index["min_rows"], last_row)
+    return [m[2] for m in index["by_min"][lo:hi]]
+
+def _merged_ranges_touching(index, first_row, last_row):
+    # Ranges that start or end inside [first_row, last_row]
+    found = _merged_ranges_starting(index, first_row, last_row)
+    lo = bisect_left(index["max_rows"], first_row)
+    hi = bisect_right(index["max_rows"], last_row)
+    found += [m[2] for m in index["by_max"][lo:hi] if m[0] < first_row]
+    return found
+
+def _copy_column_widths(source, target, max_col, min_width=None, fallback=None):
+    for col_idx in range(1, max_col + 1):
+        col_letter = get_column_letter(col_idx)
+        if min_width is not None:
+            dimension = source.column_dimensions.get(col_letter)  # [] would add the column to the source
+            width = dimension.width if dimension is not None else None
+            target.column_dimensions[col_letter].width = width if (width and width > min_width) else fallback
+        elif col_letter in source.column_dimensions:
+            target.column_dimensions[col_letter].width = source.column_dimensions[col_letter].width
+
+def _export_evaluator(wb, export_type, template_path=None):
+    # Values-only exports compute every formula in-process from the formulas workbook, so rows Excel
+    # never recalculated still get values; Excel's cached values are only used where the evaluator can't.
+    if export_type != "without":
+        return wb, None
+    if wb.data_only:
+        wb = get_workbook(template_path, data_only=False)
+    return wb, FormulaEvaluator(wb, graph=_template_dependency_graph(wb))
+
+def _value_exporter(values_wb, overlay, template_path=None):
+    values_wb = [values_wb if values_wb.data_only else None]
+    evaluator = overlay.evaluator
+
+    def export_value(cell):
+        key = (cell.parent.title, cell.row, cell.column)
+        value = overlay.cells[key] if key in overlay.cells else cell.value
+        if evaluator is None:
+            return value
+        if not (isinstance(value, str) and value.startswith("=")) and key not in evaluator.overrides:
+            return value
+        try:
+            value = evaluator.value(*key)
+        except FormulaError as e:
+            if values_wb[0] is None:
+                values_wb[0] = get_workbook(template_path, data_only=True)
+            cached = _cell_value(values_wb[0][key[0]], *key[1:]) if key[0] in values_wb[0].sheetnames else None
+            log(f"Formula fallback at {key[0]}!{cell.coordinate}: {e}", sheet=key[0], cell=cell.coordinate)
+            return cached
+        return value.code if isinstance(value, ExcelError) else value
+
+    return export_value
+
+def _find_export_rows(wb, zf_part, template_path=None):
+    # (Calculation row, Entries row) of a part; the Entries row is None if only Calculation has it
+    calc_ws = wb["Calculation"]
+    found_row = None
+    found_entries_row = None
+
+    with span("export.lookup", zf_part=zf_part) as lookup:
+        # Find row by ZF Part Number in Entries and Calculation (sidecar index first)
+        found_entries_row, found_row = _indexed_rows(wb, zf_part, template_path)
+        entries_ws = wb["Entries"] if "Entries" in wb.sheetnames else None
+        if entries_ws and not found_entries_row:
+            for row in range(3, entries_ws.max_row + 1):
+                val = _cell_value(entries_ws, row, 3)
+                if val and str(val).strip().lower() == zf_part.strip().lower():
+                    found_entries_row = row
+                    break
+        # Column C is the ZF Part Number or the =Entries!C{row} link save_entry writes
+        link = f"=entries!c{found_entries_row}" if found_entries_row else None
+        for row in ([] if found_row else range(6, calc_ws.max_row + 1)):
+            val = _cell_value(calc_ws, row, 3)
+            if val and str(val).strip().lower() in (zf_part.strip().lower(), link):
+                found_row = row
+                break
+
+        if not found_row:
+            try:
+                temp_wb = get_workbook(template_path, data_only=True)
+                temp_calc = temp_wb["Calculation"]
+                for row in range(6, temp_calc.max_row + 1):
+                    val = _cell_value(temp_calc, row, 3)
+                    if val and str(val).strip().lower() == zf_part.strip().lower():
+                        found_row = row
+                        break
+            except Exception as e:
+                raise ExportError(f"Fallback lookup failed:\n{str(e)}")
+
+        if not found_row:
+            raise PartNotFoundError(f"ZF Part Number '{zf_part}' not found in Calculation sheet.")
+        lookup.set(calc_row=found_row, entries_row=found_entries_row)
+    return found_row, found_entries_row
+
+def _update_summary(wb, found_entries_row, overlay):
+    # Summary row 6 gets the part's data straight from Entries (in the overlay)
+    if "Entries" not in wb.sheetnames:
+        log("Entries sheet not found, Summary row 6 left as in the template", "warning")
+        return
+    with span("export.summary", entries_row=found_entries_row):
+        try:
+            values = _row_values(wb["Entries"], found_entries_row, len(sheet_schema()["entries_columns"]))
+            changes = _summary_changes(values)
+        except JarvisError:
+            raise
+        except Exception as e:
+            raise ExportError(f"Failed to update Summary sheet: {e}") from e
+        overlay.update(changes)
+
+def _summary_changes(values):
+    # Copied straight from the part's Entries row through the schema's Summary mapping
+    schema = sheet_schema()
+    row = schema["summary_row"]
+    changes = {}
+
+    # Number of Cavity = X direction * Y direction
+    cavities_col, (x_col, y_col) = schema["summary_cavities"]
+    changes[("Summary", row, cavities_col)] = int(values[x_col - 1] or 1) * int(values[y_col - 1] or 1)
+
+    # Part Size (As per tooling direction) = L x W x H
+    size_col, size_fields = schema["summary_size"]
+    size = [values[c - 1] or 0 for c in size_fields]
+    # Don't keep the previous part's size in a batch
+    changes[("Summary", row, size_col)] = " x ".join(str(v) for v in size) if all(size) else None
+
+    for summary_col, entries_col in schema["summary_entries"]:
+        changes[("Summary", row, summary_col)] = values[entries_col - 1]
+    return changes
+
+def _link_tooling_results(wb, found_row, overlay):
+    # Values-only exports: the computed tooling results (AD6/AE6) go into Calculation AQ/AR. "With formulas"
+    # exports keep the template's AQ/AR lookups, which find the part's Tooling row in the exported workbook
+    evaluator = overlay.evaluator
+    if evaluator is None:
+        return
+    tooling_row = sheet_schema()["tooling_row"]
+    with span("export.formulas", calc_row=found_row):
+        overlay.update({("Calculation", found_row, calc_col): evaluator.value("Tooling", tooling_row, tooling_col)
+                        for calc_col, tooling_col, _ in sheet_schema()["calc_tool_results"]})
+
+def _copy_whole_sheet(source, target, max_row, max_col, export_value, copy_style, rows=None):
+    # Master Data / Entries: every cell, widths and merges at the same positions. A pruned export passes
+    # rows ({template row: export row}) and gets only those, with the merges whose rows all stay
+    for row, new_row in (rows or {row: row for row in range(1, max_row + 1)}).items():
+        for col in range(1, max_col + 1):
+            cell = _source_cell(source, row, col)
+            tgt = target.cell(row=new_row, column=col, value=export_value(cell))
+            copy_style(cell, tgt)
+    _copy_column_widths(source, target, max_col)
+    for m in _merged_index(source)["ranges"]:
+        if rows is None:
+            target.merge_cells(m)
+            continue
+        min_col, min_row, max_c, max_r = range_boundaries(m)
+        first, last = rows.get(min_row), rows.get(max_r)
+        if first is not None and last is not None and last - first == max_r - min_row:
+            target.merge_cells(start_row=first, start_column=min_col, end_row=last, end_column=max_c)
+
+def _export_filename(name, export_type, output_dir):
+    safe_name = name.replace(" ", "_").replace("/", "_").replace("\\", "_")
+    suffix = "WithFormulas" if export_type == "with" else "ValuesOnly"
+    export_filename = f"{safe_name}_Export_{suffix}.xlsx"
+    if output_dir:
+        export_filename = os.path.join(output_dir, export_filename)
+    return export_filename
+
+def export_logic(wb, zf_part, export_type="with", output_dir=None, progress=None, prune=None, template_path=None):
+    # template_path: the file wb was loaded from, for the index and cached values (default EXCEL_TEMPLATE)
+    with span("export", zf_part=zf_part, mode=export_type):
+        return _export_logic(wb, zf_part, export_type, output_dir, progress, PRUNE_EXPORTS if prune is None else prune,
+                             template_path or base.EXCEL_TEMPLATE)
+
+def _export_logic(wb, zf_part, export_type, output_dir, progress, prune, template_path):
+    # progress(done, total, text) is called between stages; it may raise JobCancelled to stop the export
+    _load_openpyxl()
+    total_steps = 4 + len(EXPORT_SHEETS)
+    progress = progress or (lambda done, total, text="": None)
+    progress(0, total_steps, "Finding part")
+    export_wb = Workbook()
+    export_wb.remove(export_wb.active)
+    copy_style = _style_copier()
+
+    values_wb = wb
+    wb, evaluator = _export_evaluator(wb, export_type, template_path)
+    overlay = ExportOverlay(evaluator)
+    export_value = _value_exporter(values_wb, overlay, template_path)
+
+    summary_ws = wb["Summary"] if "Summary" in wb.sheetnames else None
+    entries_ws = wb["Entries"] if "Entries" in wb.sheetnames else None
+    found_row, found_entries_row = _find_export_rows(wb, zf_part, template_path)
+
+    # Import formulas look the part up by the Sl.# in A2
+    if found_entries_row:
+        overlay.update({("Import", 2, 1): _cell_value(entries_ws, found_entries_row, 1)})
+
+    # Update tooling sheet with correct data BEFORE export
+    progress(1, total_steps, "Updating Tooling")
+    if found_entries_row:
+        update_tooling_by_zf_part_number(wb, zf_part, overlay)
+
+    # Update Summary sheet with the same data as Tooling
+    progress(2, total_steps, "Updating Summary")
+    if found_entries_row and summary_ws:
+        _update_summary(wb, found_entries_row, overlay)
+
+    _link_tooling_results(wb, found_row, overlay)
+
+    # Find corresponding summary row (after we updated it to row 6)
+    found_summary_row = sheet_schema()["summary_row"]  # We always update Summary at row 6, same as Tooling
+    if not summary_ws:
+        log("Summary sheet not found, using the Calculation row number", "warning")
+        found_summary_row = found_row
+
+    sheet_rows = {"Calculation": found_row, "Tooling": sheet_schema()["tooling_row"], "Summary": found_summary_row}
+
+    row_maps = {}
+    if prune:
+        headers = list(EXPORT_HEADER_ROWS)
+        row_maps = _workbook_prune_plan(wb, overlay, {
+            "Calculation": headers + [found_row],
+            "Tooling": headers + [sheet_rows["Tooling"]] + list(range(8, 49)),
+            "Summary": headers + [found_summary_row],
+            "Import": range(1, wb["Import"].max_row + 1) if "Import" in wb.sheetnames else []},
+            names=[item.attr_text for item in _defined_names(wb)])
+        export_value = _pruned_exporter(export_value, row_maps)
+
+    for sheet_number, sheet_name in enumerate(EXPORT_SHEETS):
+        progress(3 + sheet_number, total_steps, f"Copying {sheet_name}")
+        # Check if the sheet exists before trying to access it
+        if sheet_name not in wb.sheetnames:
+            log(f"Sheet '{sheet_name}' not found in workbook, skipping", "warning", sheet=sheet_name)
+            continue
+
+        with span("export.copy", sheet=sheet_name):
+            source = wb[sheet_name]
+            target = export_wb.create_sheet(sheet_name)
+            # Hide Master Data and Entries sheets in exported file
+            if sheet_name in ["Master Data", "Entries"]:
+                target.sheet_state = 'hidden'
+
+            if sheet_name == "Master Data":
+                # Rows 1 to 110, columns A to R
+                _copy_whole_sheet(source, target, EXPORT_MAX_ROWS[sheet_name], EXPORT_COLUMNS[sheet_name],
+                                  export_value, copy_style, row_maps.get(sheet_name))
+                continue
+
+            elif sheet_name == "Entries":
+                _copy_whole_sheet(source, target, source.max_row, 38, export_value, copy_style, row_maps.get(sheet_name))
+                continue
+
+            elif sheet_name == "Import":
+                # The source is always the formulas workbook: "with" keeps the VLOOKUPs on the new Sl.#,
+                # values-only evaluates them against it (A2, the requested part's Sl.#, is in the overlay)
+                for row in range(1, source.max_row + 1):
+                    for col in range(1, 29):
+                        cell = _source_cell(source, row, col)
+                        tgt = target.cell(row=row, column=col, value=export_value(cell))
+                        copy_style(cell, tgt)
+
+                # Copy column widths
+                _copy_column_widths(source, target, 28)
+
+                # Copy merged cells
+                for m in _merged_index(source)["ranges"]:
+                    target.merge_cells(m)
+
+                continue
+
+            # Logic for Calculation, Tooling, Summary (one row + headers)
+            max_col = EXPORT_COLUMNS[sheet_name]
+            data_row = sheet_rows[sheet_name]
+
+            # Copy headers (rows 3, 4, 5)
+            for row_idx in EXPORT_HEADER_ROWS:
+                for col in range(1, max_col + 1):
+                    cell = _source_cell(source, row_idx, col)
+                    tgt = target.cell(row=row_idx, column=col, value=export_value(cell))
+                    copy_style(cell, tgt)
+
+            # Copy the actual data row to row 6 in export: computed values for values-only, formulas moved
+            # with it for "with formulas"
+            _copy_part_row(source, data_row, target, 6, export_value, copy_style, evaluator)
+
+            # Copy merged cells for headers
+            for m in _merged_ranges_touching(_merged_index(source), min(EXPORT_HEADER_ROWS), max(EXPORT_HEADER_ROWS)):
+                target.merge_cells(m)
+
+            # Special handling for Tooling sheet - copy additional rows
+            if sheet_name == "Tooling":
+                # Copy merged cells for the additional rows
+                for m in _merged_ranges_starting(_merged_index(source), 8, 48):
+                    target.merge_cells(m)
+
+                # Copy rows 8-48 for tooling sheet
+                for r in range(8, 49):
+                    for c in range(1, max_col + 1):
+                        cell = _source_cell(source, r, c)
+                        tgt = target.cell(row=r, column=c, value=export_value(cell))
+                        copy_style(cell, tgt)
+
+            # If original width is None or too small, set a fallback width (like 15)
+            _copy_column_widths(source, target, max_col, min_width=6, fallback=15)
+
+    _copy_defined_names(wb, export_wb, row_maps)
+
+    # Save the exported file
+    export_filename = _export_filename(zf_part, export_type, output_dir)
+
+    progress(total_steps - 1, total_steps, "Saving")
+    try:
+        with span("export.save", path=export_filename):
+            export_wb.save(export_filename)
+    except Exception as e:
+        raise ExportError(f"Failed to save export file: {str(e)}")
+    return export_filename
+
+def _defined_names(wb):
+    # The workbook's defined names, sheet-level ones too
+    names = list(wb.defined_names.values())
+    for ws in wb.worksheets:
+        names += ws.defined_names.values()
+    return names
+
+def _copy_defined_names(source_wb, export_wb, row_maps=None):
+    # Names into the exported sheets go across (sheet-level ones to their sheet), following pruned rows;
+    # names into sheets the export drops would be #REF! in Excel and are left out
+    from openpyxl.workbook.defined_name import DefinedName
+    dropped = {name.lower() for name in source_wb.sheetnames if name not in export_wb.sheetnames}
+
+    def copied(item):
+        text = item.attr_text
+        if text and _defined_name_sheets(text) & dropped:
+            return None
+        if text and row_maps:
+            text = _remap_formula_rows("=" + text, "", row_maps)[1:]
+        return DefinedName(item.name, attr_text=text, comment=item.comment, hidden=item.hidden)
+
+    for item in source_wb.defined_names.values():
+        item = copied(item)
+        if item is not None:
+            export_wb.defined_names[item.name] = item
+    for ws in source_wb.worksheets:
+        if ws.title not in export_wb.sheetnames:
+            continue
+        for item in ws.defined_names.values():
+            item = copied(item)
+            if item is not None:
+                export_wb[ws.title].defined_names[item.name] = item
+
+# Portfolio export: many parts as consecutive rows of one workbook (one quote, one save).
+# Part i goes to row 6+i of Calculation/Summary and row 2+i of Import; headers are copied once. Tooling rows
+# 8-48 are the tool breakdown of its row 6, so the first part keeps row 6 and its breakdown, and the other
+# parts' Tooling rows follow the breakdown block (see _portfolio_tooling_rows).
+def _shift_reference(ref, delta):
+    parts = []
+    for part in ref.split(":"):
+        letters = part.rstrip("0123456789")
+        digits = part[len(letters):]
+        if digits and not letters.endswith("$"):
+            row = int(digits) + delta
+            if row < 1:
+                return "#REF!"
+            part = letters + str(row)
+        parts.append(part)
+    return ":".join(parts)
+
+def _shift_formula_rows(formula, host_sheet, delta):
+    # Moves a formula down/up like Excel's copy-paste does, but only for references into its own sheet:
+    # Entries/Master Data are exported whole at their original rows, so references there stay put
+    if not delta or not (isinstance(formula, str) and formula.startswith("=")):
+        return formula
+    _load_openpyxl()
+    try:
+        tokenizer = Tokenizer(formula)
+    except Exception:
+        return formula
+    for token in tokenizer.items:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
+            continue
+        sheet, ref = _split_reference(token.value, host_sheet)
+        if sheet.lower() != host_sheet.lower():
+            continue
+        try:
+            range_boundaries(ref.replace("$", ""))
+        except ValueError:
+            continue  # Defined names stay as they are
+        token.value = token.value[:len(token.value) - len(ref)] + _shift_reference(ref, delta)
+    return tokenizer.render()
+
+def _copy_part_row(source, src_row, target, dst_row, export_value, copy_style, evaluator):
+    for col in range(1, EXPORT_COLUMNS[source.title] + 1):
+        src = _source_cell(source, src_row, col)
+        value = export_value(src)
+        if evaluator is None:
+            value = _shift_formula_rows(value, source.title, dst_row - src_row)
+        tgt = target.cell(row=dst_row, column=col, value=value)
+        copy_style(src, tgt)
+
+def _portfolio_tooling_rows(n_parts):
+    # Tooling row of each part: the first at row 6 above its breakdown, the rest after a blank row below it
+    schema = sheet_schema()
+    last = schema["tooling_lookup_rows"][1]
+    return [schema["tooling_row"]] + [last + 1 + i for i in range(1, n_parts)]
+
+def export_portfolio(zf_parts, export_type="with", output_dir=None, name=None, progress=None, prune=None):
+    # All parts in one workbook; returns its path. Raises PartNotFoundError naming every unknown part.
+    zf_parts = [p.strip() for p in zf_parts if p and p.strip()]
+    zf_parts = list(dict.fromkeys(zf_parts))
+    if not zf_parts:
+        raise ValidationError("No ZF Part Numbers to export.")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    sync_template()
+    _require_template()
+    wb = get_workbook(base.EXCEL_TEMPLATE, data_only=False)
+    with span("export.portfolio", parts=len(zf_parts), mode=export_type):
+        return portfolio_logic(wb, zf_parts, export_type, output_dir, name, progress, prune)
+
+def portfolio_logic(wb, zf_parts, export_type="with", output_dir=None, name=None, progress=None, prune=None):
+    _load_openpyxl()
+    total_steps = len(zf_parts) + 4
+    progress = progress or (lambda done, total, text="": None)
+    progress(0, total_steps, "Finding parts")
+    export_wb = Workbook()
+    export_wb.remove(export_wb.active)
+    copy_style = _style_copier()
+
+    values_wb = wb
+    wb, evaluator = _export_evaluator(wb, export_type)
+    # One overlay for the whole portfolio: each part overwrites the same row 6 / A2 cells
+    overlay = ExportOverlay(evaluator)
+    export_value = _value_exporter(values_wb, overlay)
+
+    # Every part is looked up before anything is written, so a typo fails fast with the full list
+    rows, missing = [], []
+    for zf_part in zf_parts:
+        try:
+            rows.append(_find_export_rows(wb, zf_part))
+        except PartNotFoundError:
+            missing.append(zf_part)
+    if missing:
+        raise PartNotFoundError("ZF Part Numbers not found in Calculation sheet: " + ", ".join(missing))
+
+    summary_ws = wb["Summary"] if "Summary" in wb.sheetnames else None
+    entries_ws = wb["Entries"] if "Entries" in wb.sheetnames else None
+    schema = sheet_schema()
+    breakdown_rows = range(8, schema["tooling_lookup_rows"][1] + 1)
+    tooling_rows = _portfolio_tooling_rows(len(zf_parts))
+    row_maps = {}
+    if PRUNE_EXPORTS if prune is None else prune:
+        # Row 6 of Tooling/Summary only ever gets Entries values and links for each part
+        headers = list(EXPORT_HEADER_ROWS)
+        row_maps = _workbook_prune_plan(wb, overlay, {
+            "Calculation": headers + [found_row for found_row, _ in rows],
+            "Tooling": headers + [schema["tooling_row"]] + list(breakdown_rows),
+            "Summary": headers + [schema["summary_row"]],
+            "Import": [1, 2]})
+        export_value = _pruned_exporter(export_value, row_maps)
+    targets = {}
+    for sheet_name in EXPORT_SHEETS:
+        if sheet_name not in wb.sheetnames:
+            log(f"Sheet '{sheet_name}' not found in workbook, skipping", "warning")
+            continue
+        targets[sheet_name] = export_wb.create_sheet(sheet_name)
+        if sheet_name in ["Master Data", "Entries"]:
+            targets[sheet_name].sheet_state = 'hidden'
+
+    # Headers once: rows 3-5 of the row sheets, row 1 of Import
+    with span("export.copy", sheet="headers"):
+        for sheet_name in ("Calculation", "Tooling", "Summary", "Import"):
+            if sheet_name not in targets:
+                continue
+            source, target = wb[sheet_name], targets[sheet_name]
+            max_col = EXPORT_COLUMNS[sheet_name]
+            header_rows = [1] if sheet_name == "Import" else EXPORT_HEADER_ROWS
+            for row_idx in header_rows:
+                for col in range(1, max_col + 1):
+                    cell = _source_cell(source, row_idx, col)
+                    tgt = target.cell(row=row_idx, column=col, value=export_value(cell))
+                    copy_style(cell, tgt)
+            for m in _merged_ranges_touching(_merged_index(source), min(header_rows), max(header_rows)):
+                target.merge_cells(m)
+            if sheet_name == "Import":
+                _copy_column_widths(source, target, max_col)
+            else:
+                _copy_column_widths(source, target, max_col, min_width=6, fallback=15)
+
+    # One row per part. Tooling/Summary row 6 is refilled for each part exactly as a single export does,
+    # then copied to the part's row; "with formulas" rows keep live formulas shifted to their new row, so
+    # Calculation AQ/AR find the part's Tooling row through the lookup on Sl.#.
+    for i, (zf_part, (found_row, found_entries_row)) in enumerate(zip(zf_parts, rows)):
+        progress(1 + i, total_steps, f"Adding {zf_part}")
+        with span("export.part", zf_part=zf_part, row=6 + i):
+            sl_no = _cell_value(entries_ws, found_entries_row, 1) if found_entries_row else None
+            overlay.update({("Import", 2, 1): sl_no})
+            if found_entries_row:
+                update_tooling_by_zf_part_number(wb, zf_part, overlay)
+            if found_entries_row and summary_ws:
+                _update_summary(wb, found_entries_row, overlay)
+            if evaluator is not None:
+                _link_tooling_results(wb, found_row, overlay)
+
+            sheet_rows = {"Calculation": (found_row, 6 + i), "Tooling": (schema["tooling_row"], tooling_rows[i]),
+                          "Summary": (schema["summary_row"], 6 + i)}
+            for sheet_name, (src_row, dst_row) in sheet_rows.items():
+                if sheet_name in targets:
+                    _copy_part_row(wb[sheet_name], src_row, targets[sheet_name], dst_row,
+                                   export_value, copy_style, evaluator)
+            if i == 0 and "Tooling" in targets:
+                # The breakdown reads row 6, so it is copied while row 6 holds the first part
+                for row in breakdown_rows:
+                    _copy_part_row(wb["Tooling"], row, targets["Tooling"], row, export_value, copy_style, evaluator)
+                for m in _merged_ranges_starting(_merged_index(wb["Tooling"]), breakdown_rows[0], breakdown_rows[-1]):
+                    targets["Tooling"].merge_cells(m)
+            if evaluator is None and "Tooling" in targets and "Calculation" in targets:
+                # Tooling AB/AC link to the part's own Calculation row (AP, AS) in the exported workbook
+                links = schema["tooling_calc"]
+                _write_row(targets["Tooling"], tooling_rows[i], [tooling_col for tooling_col, _, _ in links],
+                           [f"=Calculation!{letter}{6 + i}" for _, _, letter in links])
+                # Bounded lookups have to reach the last part's Tooling row
+                match_col, _ = schema["calc_tool_match"]
+                if str(_cell_value(wb["Calculation"], found_row, match_col) or "").upper().startswith("=MATCH("):
+                    lookups = _tool_lookup_formulas(6 + i, max(schema["tooling_lookup_rows"][1], tooling_rows[-1]))
+                    _write_row(targets["Calculation"], 6 + i, list(lookups), list(lookups.values()))
+            if "Import" in targets:
+                _copy_part_row(wb["Import"], 2, targets["Import"], 2 + i, export_value, copy_style, evaluator)
+
+    progress(len(zf_parts) + 1, total_steps, "Copying Master Data")
+    if "Master Data" in targets:
+        with span("export.copy", sheet="Master Data"):
+            _copy_whole_sheet(wb["Master Data"], targets["Master Data"], 110, 18, export_value, copy_style,
+                              row_maps.get("Master Data"))
+    progress(len(zf_parts) + 2, total_steps, "Copying Entries")
+    if "Entries" in targets:
+        with span("export.copy", sheet="Entries"):
+            _copy_whole_sheet(entries_ws, targets["Entries"], entries_ws.max_row, 38, export_value, copy_style,
+                              row_maps.get("Entries"))
+
+    export_filename = _export_filename(name or f"Portfolio_{len(zf_parts)}_parts", export_type, output_dir)
+    progress(total_steps - 1, total_steps, "Saving")
+    try:
+        with span("export.save", path=export_filename):
+            export_wb.save(export_filename)
+    except Exception as e:
+        raise ExportError(f"Failed to save export file: {str(e)}")
+    return export_filename
+
+# Pruned exports: Entries and Master Data keep only their header rows and the rows the exported formulas
+# read (followed through the formulas in those rows), packed under the headers, and every reference into
+# them is remapped to the new rows. A sheet that some formula reads by whole columns is exported whole.
+PRUNE_EXPORTS = os.environ.get("JARVIS_PRUNE_EXPORTS", "") == "1"
+PRUNED_SHEETS = {"Entries": 2, "Master Data": 1}  # sheet -> header rows kept at the top
+
+def _pruned_sheet(sheet):
+    for name in PRUNED_SHEETS:
+        if name.lower() == sheet.lower():
+            return name
+    return None
+
+def pruned_row_maps(formulas, row_formulas):
+    # formulas: (host sheet, formula) of the exported cells; row_formulas(sheet, row) -> the formulas in a
+    # row of a pruned sheet. Returns {sheet: {template row: export row}} for the sheets that can be pruned
+    keep = {name: set(range(1, headers + 1)) for name, headers in PRUNED_SHEETS.items()}
+    whole = set()
+    pending = list(formulas)
+    while pending:
+        host, formula = pending.pop()
+        cells, ranges = _formula_references(formula, host)
+        areas = [(sheet, row, row) for sheet, row, _ in cells] + [(sheet, first, last) for sheet, first, _, last, _ in ranges]
+        for sheet, first, last in areas:
+            name = _pruned_sheet(sheet)
+            if name is None or name in whole:
+                continue
+            if first is None or last is None:
+                whole.add(name)
+                continue
+            for row in range(first, last + 1):
+                if row not in keep[name]:
+                    keep[name].add(row)
+                    pending.extend((name, f) for f in row_formulas(name, row))
+    return {name: {row: i for i, row in enumerate(sorted(rows), 1)} for name, rows in keep.items() if name not in whole}
+
+def _map_reference_rows(ref, rows):
+    parts = []
+    for part in ref.split(":"):
+        letters = part.rstrip("0123456789")
+        digits = part[len(letters):]
+        if digits:
+            row = rows.get(int(digits))
+            if row is None:
+                return "#REF!"
+            part = letters + str(row)
+        parts.append(part)
+    return ":".join(parts)
+
+def _remap_formula_rows(formula, host_sheet, row_maps):
+    # References into pruned sheets (absolute ones too: the rows themselves moved) follow their rows
+    if not row_maps or not (isinstance(formula, str) and formula.startswith("=")):
+        return formula
+    text = formula.lower()
+    if _pruned_sheet(host_sheet) not in row_maps and not any(name.lower() in text for name in row_maps):
+        return formula
+    _load_openpyxl()
+    try:
+        tokenizer = Tokenizer(formula)
+    except Exception:
+        return formula
+    for token in tokenizer.items:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
+            continue
+        sheet, ref = _split_reference(token.value, host_sheet)
+        rows = row_maps.get(_pruned_sheet(sheet))
+        if rows is None:
+            continue
+        try:
+            range_boundaries(ref.replace("$", ""))
+        except ValueError:
+            continue  # Defined names stay as they are
+        token.value = token.value[:len(token.value) - len(ref)] + _map_reference_rows(ref, rows)
+    return tokenizer.render()
+
+def _pruned_exporter(export_value, row_maps):
+    if not row_maps:
+        return export_value
+    return lambda cell: _remap_formula_rows(export_value(cell), cell.parent.title, row_maps)
+
+def _workbook_prune_plan(wb, overlay, sheet_rows, names=()):
+    # Row maps for an export of sheet_rows ({sheet: template rows}) out of a parsed workbook; names are the
+    # texts of the defined names the export keeps
+    formulas = [("", "=" + text) for text in names if text]
+    for sheet_name, rows in sheet_rows.items():
+        if sheet_name not in wb.sheetnames:
+            continue
+        ws = wb[sheet_name]
+        for row in rows:
+            for col in range(1, EXPORT_COLUMNS[sheet_name] + 1):
+                value = overlay.raw(ws, row, col)
+                if isinstance(value, str) and value.startswith("="):
+                    formulas.append((sheet_name, value))
+
+    def row_formulas(sheet, row):
+        if sheet not in wb.sheetnames:
+            return []
+        values = (_cell_value(wb[sheet], row, col) for col in range(1, EXPORT_COLUMNS[sheet] + 1))
+        return [v for v in values if isinstance(v, str) and v.startswith("=")]
+
+    with span("export.prune"):
+        return pruned_row_maps(formulas, row_formulas)
+
+# Package-level export: the template's xlsx package is cloned part by part instead of rebuilt cell by cell.
+# Sheet XML is streamed an element at a time and only the rows export_logic writes are written back, at the
+# same places and with the sheets in EXPORT_SHEETS order; styles.xml, shared strings, column widths,
+# conditional formats, defined names and print settings go across untouched, and sheets the export doesn't
+# ship are dropped. Parts are read with ElementTree and written back with the template's own namespace
+# prefixes and declarations (mc:Ignorable names prefixes, so renaming them breaks the file). "with" exports
+# never parse the workbook; values-only ones evaluate the kept cells against the parsed template, like
+# export_logic.
+EXPORT_ENGINE = os.environ.get("JARVIS_EXPORT_ENGINE", "copy")  # "xml": single-part exports go through export_xml()
+_XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_XML_ERROR_CODES = ("#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A")
+
+def _xml_escape(text):
+    if "&" in text or "<" in text or ">" in text or '"' in text:
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    return text
+
+def _xml_attribute(text):
+    text = _xml_escape(text)
+    if "\n" in text or "\r" in text or "\t" in text:
+        text = text.replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+    return text
+
+class _XmlPart:
+    # One package part read with ElementTree, which forgets namespace prefixes: the ones the part binds
+    # are recorded and all declared again on the root when it is written back (mc:Ignorable names
+    # prefixes, so Excel refuses a part whose prefixes were renamed)
+    def __init__(self):
+        self.prefixes = {_XML_NAMESPACE: "xml"}  # namespace -> its prefix in the part
+        self.names = {}  # "{namespace}tag" -> "prefix:tag"
+
+    def bind(self, prefix, namespace):
+        if namespace not in self.prefixes:
+            if prefix in self.prefixes.values():
+                prefix = f"ns{len(self.prefixes)}"  # bound again to another namespace further down
+            self.prefixes[namespace] = prefix
+
+    def iterparse(self, f):
+        # The part's elements as they end, like ElementTree.iterparse
+        from xml.etree import ElementTree
+        for event, item in ElementTree.iterparse(f, ("start-ns", "end")):
+            if event == "start-ns":
+                self.bind(*item)
+            else:
+                yield item
+
+    def parse(self, data):
+        import io
+        for root in self.iterparse(io.BytesIO(data)):
+            pass
+        return root
+
+    def name(self, tag):
+        name = self.names.get(tag)
+        if name is None:
+            if not tag.startswith("{"):
+                return tag
+            namespace, local = tag[1:].split("}", 1)
+            prefix = self.prefixes.get(namespace)
+            name = self.names[tag] = f"{prefix}:{local}" if prefix else local
+        return name
+
+    def start_tag(self, elem, root=False):
+        # "<tag ..." without its closing ">"; the root declares the part's namespaces
+        names = self.names
+        text = "<" + (names.get(elem.tag) or self.name(elem.tag))
+        if root:
+            for namespace, prefix in self.prefixes.items():
+                if prefix != "xml":
+                    text += f' xmlns:{prefix}="{_xml_attribute(namespace)}"' if prefix else f' xmlns="{_xml_attribute(namespace)}"'
+        for key, value in elem.items():
+            text += f' {names.get(key) or self.name(key)}="{_xml_attribute(value)}"'
+        return text
+
+    def tostring(self, elem, root=False):
+        out = [self.start_tag(elem, root)]
+        self._write(elem, out)
+        return "".join(out)
+
+    def _write(self, elem, out):
+        # elem's content and end tag, its start tag being in out already
+        text = elem.text
+        if text or len(elem):
+            out.append(">" + _xml_escape(text) if text else ">")
+            for child in elem:
+                out.append(self.start_tag(child))
+                self._write(child, out)
+            out.append(f"</{self.names.get(elem.tag) or self.name(elem.tag)}>")
+        else:
+            out.append("/>")
+        if elem.tail:
+            out.append(_xml_escape(elem.tail))
+
+def _xml_cell(ref, style, value):
+    # <c> for a value written by the export; the template cell's style index is kept
+    from xml.etree.ElementTree import Element, SubElement
+    cell = Element(f"{_XL_NS}c", r=ref)
+    if style is not None:
+        cell.set("s", style)
+    if value is None:
+        return cell
+    if isinstance(value, bool):
+        cell.set("t", "b")
+        SubElement(cell, f"{_XL_NS}v").text = str(int(value))
+        return cell
+    if hasattr(value, "isoformat"):
+        from openpyxl.utils.datetime import to_excel
+        value = to_excel(value)
+    if isinstance(value, (int, float)):
+        if math.isfinite(value):
+            SubElement(cell, f"{_XL_NS}v").text = "%.16g" % value  # as openpyxl writes numbers
+        return cell
+    text = str(value)
+    if text.startswith("=") and len(text) > 1:
+        SubElement(cell, f"{_XL_NS}f").text = text[1:]
+    elif text in _XML_ERROR_CODES:
+        cell.set("t", "e")
+        SubElement(cell, f"{_XL_NS}v").text = text
+    else:
+        cell.set("t", "inlineStr")
+        inline = SubElement(cell, f"{_XL_NS}is")
+        SubElement(inline, f"{_XL_NS}t", {f"{{{_XML_NAMESPACE}}}space": "preserve"}).text = text
+    return cell
+
+def _xml_formula(cell, ref, shared):
+    # The formula of a <c> as "=...", shared formulas expanded (None for a value). Masters are remembered
+    # for the rows below, which may be kept when the master's row is dropped
+    formula = cell.find(f"{_XL_NS}f")
+    if formula is None:
+        return None
+    text = formula.text or ""
+    if formula.get("t") == "shared":
+        if text:
+            shared[formula.get("si")] = (text, ref)
+        elif formula.get("si") in shared:
+            from openpyxl.formula.translate import Translator
+            master, origin = shared[formula.get("si")]
+            text = Translator("=" + master, origin=origin).translate_formula(ref)[1:]
+    return "=" + text if text else None
+
+def _xml_row_formulas(row, src_row, shared):
+    # [(column, formula)] of a <row>
+    found, col = [], 0
+    for cell in row.iter(f"{_XL_NS}c"):
+        ref = cell.get("r")
+        col = _column_number(ref) if ref else col + 1
+        formula = _xml_formula(cell, ref or f"{get_column_letter(col)}{src_row}", shared)
+        if formula:
+            found.append((col, formula))
+    return found
+
+def _has_shared_formulas(row):
+    return any(f.get("t") == "shared" for f in row.iter(f"{_XL_NS}f"))
+
+def _export_row_xml(row, sheet_name, src_row, dst_row, max_col, row_changes, shared, value_of, row_maps=None):
+    # One kept <row>, changed in place: cells past max_col dropped, changed and (values-only) formula cells
+    # rewritten with the template's style, shared formulas expanded and formulas moved with the row (and the
+    # pruned rows)
+    cells, col = {}, 0
+    for cell in row.findall(f"{_XL_NS}c"):
+        src_ref = cell.get("r")
+        col = _column_number(src_ref) if src_ref else col + 1
+        src_ref = src_ref or f"{get_column_letter(col)}{src_row}"
+        f = cell.find(f"{_XL_NS}f")
+        formula = _xml_formula(cell, src_ref, shared)
+        if col > max_col:
+            continue
+        ref = f"{get_column_letter(col)}{dst_row}"
+        style = cell.get("s")
+        if col in row_changes and value_of is None:
+            cell = _xml_cell(ref, style, _remap_formula_rows(row_changes[col], sheet_name, row_maps))
+        elif value_of is not None and (f is not None or col in row_changes):
+            cell = _xml_cell(ref, style, value_of(sheet_name, src_row, col))
+        elif f is not None and f.get("t") in ("array", "dataTable") and dst_row == src_row:
+            pass
+        elif formula:
+            # Rows of a pruned sheet move by its row map rather than by one offset
+            if _pruned_sheet(sheet_name) not in (row_maps or {}):
+                formula = _shift_formula_rows(formula, sheet_name, dst_row - src_row)
+            cell = _xml_cell(ref, style, _remap_formula_rows(formula, sheet_name, row_maps))
+        else:
+            cell.set("r", ref)
+        cells[col] = cell
+    for col, value in row_changes.items():
+        if col not in cells and col <= max_col:
+            value = value_of(sheet_name, src_row, col) if value_of else _remap_formula_rows(value, sheet_name, row_maps)
+            cells[col] = _xml_cell(f"{get_column_letter(col)}{dst_row}", None, value)
+    row[:] = [cells[col] for col in sorted(cells)]
+    row.set("r", str(dst_row))
+    row.attrib.pop("spans", None)
+    return row
+
+def _export_merges(merges, row_map):
+    # <mergeCells> with the ranges whose rows are all kept, moved with their rows; None if none is left
+    for merge in merges.findall(f"{_XL_NS}mergeCell"):
+        min_col, min_row, max_col, max_row = range_boundaries(merge.get("ref"))
+        first, last = row_map(min_row), row_map(max_row)
+        if first is None or last is None or last - first != max_row - min_row:
+            merges.remove(merge)
+        else:
+            merge.set("ref", f"{get_column_letter(min_col)}{first}:{get_column_letter(max_col)}{last}")
+    merges.set("count", str(len(merges)))
+    return merges if len(merges) else None
+
+def _export_row_map(sheet_name, calc_row, row_maps=None):
+    # Template row -> export row, or None for rows the export drops. The rows export_logic writes: the
+    # header rows, the part's Calculation row at row 6, Tooling's part row and tool breakdown, Summary's
+    # part row and the first EXPORT_MAX_ROWS of Master Data
+    if row_maps and sheet_name in row_maps:
+        return row_maps[sheet_name].get
+    schema = sheet_schema()
+    headers = set(EXPORT_HEADER_ROWS)
+    if sheet_name == "Calculation":
+        part_row = max(EXPORT_HEADER_ROWS) + 1
+        return lambda row: row if row in headers else (part_row if row == calc_row else None)
+    if sheet_name == "Tooling":
+        kept = headers | {schema["tooling_row"]} | set(range(8, schema["tooling_lookup_rows"][1] + 1))
+        return lambda row: row if row in kept else None
+    if sheet_name == "Summary":
+        kept = headers | {schema["summary_row"]}
+        return lambda row: row if row in kept else None
+    if sheet_name in EXPORT_MAX_ROWS:
+        return lambda row: row if row <= EXPORT_MAX_ROWS[sheet_name] else None
+    return lambda row: row
+
+def _export_last_row(sheet_name, calc_row, row_maps=None):
+    # The last template row _export_row_map keeps, None for sheets exported whole
+    if row_maps and sheet_name in row_maps:
+        return max(row_maps[sheet_name], default=0)
+    schema = sheet_schema()
+    headers = max(EXPORT_HEADER_ROWS)
+    if sheet_name == "Calculation":
+        return max(headers, calc_row)
+    if sheet_name == "Tooling":
+        return max(headers, schema["tooling_row"], schema["tooling_lookup_rows"][1])
+    if sheet_name == "Summary":
+        return max(headers, schema["summary_row"])
+    return EXPORT_MAX_ROWS.get(sheet_name)
+
+def _part_without_rows(source, part, sheet_data, chunk_size=1 << 20):
+    # The part with an empty <sheetData>, cut out of its bytes so the rows aren't parsed; None if the
+    # element isn't written the way Excel and openpyxl write it
+    start, end = f"<{sheet_data}>".encode("utf-8"), f"</{sheet_data}>".encode("utf-8")
+    head, buffer = None, b""
+    with source.open(part) as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return None
+            buffer += data
+            if head is None:
+                found = buffer.find(start)
+                if found < 0:
+                    continue
+                head, buffer = buffer[:found], buffer[found + len(start):]
+            found = buffer.find(end)
+            if found >= 0:
+                return head + f"<{sheet_data}/>".encode("utf-8") + buffer[found + len(end):] + f.read()
+            buffer = buffer[-len(end):]
+
+def _sheet_unchanged(source, part, max_col, formulas, selected):
+    # Whether a sheet exported whole can go across byte for byte: its cells fit in the exported columns,
+    # it has no formulas unless they're kept (formulas) and its tab is selected as the export's would be
+    row_tag, formula_tag = f"{_XL_NS}row", f".//{_XL_NS}f"
+    with source.open(part) as f:
+        for elem in _XmlPart().iterparse(f):
+            if elem.tag == row_tag:
+                if len(elem) and _column_number(elem[-1].get("r") or "ZZZZ") > max_col:
+                    return False
+                if not formulas and elem.find(formula_tag) is not None:
+                    return False
+                elem.clear()
+    tabs = [view.get("tabSelected") in ("1", "true") for view in elem.iter(f"{_XL_NS}sheetView")]
+    return tabs == [selected and k == 0 for k in range(len(tabs))]
+
+def _write_export_sheet(source, part, target, sheet_name, calc_row, changes, value_of, selected, row_maps=None):
+    # Rows are streamed into a spool as they are parsed and written back inside the rest of the sheet
+    # (<worksheet> and everything but the rows), which is only known once the part is read. Sheets with a
+    # last kept row stop there: the rest of the sheet is read without its rows
+    import shutil
+    import tempfile
+    from xml.etree.ElementTree import Element
+    row_map = _export_row_map(sheet_name, calc_row, row_maps)
+    last_row = _export_last_row(sheet_name, calc_row, row_maps)
+    max_col = EXPORT_COLUMNS.get(sheet_name, EXCEL_MAX_COLUMNS)
+    by_row = {}
+    for (sheet, row, col), value in changes.items():
+        if sheet == sheet_name and row_map(row) is not None:
+            by_row.setdefault(row, {})[col] = value
+    pending = sorted(by_row)  # changed rows the template may not have
+    if (not row_maps and last_row is None and not pending
+            and _sheet_unchanged(source, part, max_col, value_of is None, selected)):
+        with source.open(part) as f, target.open(part, "w", force_zip64=True) as out:
+            shutil.copyfileobj(f, out, 1 << 20)
+        return
+    shared = {}
+    xml = _XmlPart()
+    row_tag, formula_tag = f"{_XL_NS}row", f".//{_XL_NS}f"
+
+    def write_row(row, src_row):
+        row_changes = by_row.get(src_row, {})
+        dst_row = row_map(src_row)
+        unchanged = (dst_row == src_row and not row_changes and row.find(formula_tag) is None
+                     and (not len(row) or _column_number(row[-1].get("r") or "ZZZZ") <= max_col))
+        if not unchanged:
+            row = _export_row_xml(row, sheet_name, src_row, dst_row, max_col, row_changes, shared, value_of, row_maps)
+        rows.write(xml.tostring(row).encode("utf-8"))
+
+    with source.open(part) as f, tempfile.SpooledTemporaryFile(max_size=1 << 24) as rows:
+        frame, src_row = None, 0
+        for elem in xml.iterparse(f):
+            if elem.tag != row_tag:
+                continue
+            src_row = int(elem.get("r")) if elem.get("r") else src_row + 1
+            while pending and pending[0] <= src_row:
+                row = pending.pop(0)
+                if row < src_row:
+                    write_row(Element(row_tag, r=str(row)), row)
+            if last_row is not None and src_row > last_row and not pending:
+                last_row = None
+                frame = _part_without_rows(source, part, xml.name(f"{_XL_NS}sheetData"))
+                if frame is not None:
+                    break
+            if row_map(src_row) is not None:
+                write_row(elem, src_row)
+            elif _has_shared_formulas(elem):
+                _xml_row_formulas(elem, src_row, shared)
+            elem.clear()  # one row in memory at a time
+        # The whole part read, the last element is <worksheet> (emptied of its rows)
+        root = xml.parse(frame) if frame is not None else elem
+        for row in pending:
+            write_row(Element(row_tag, r=str(row)), row)
+
+        with target.open(part, "w", force_zip64=True) as out:
+            out.write((_XML_DECLARATION + xml.start_tag(root, root=True) + ">").encode("utf-8"))
+            for child in root:
+                if child.tag == f"{_XL_NS}sheetData":
+                    out.write(f"<{xml.name(child.tag)}>".encode("utf-8"))
+                    rows.seek(0)
+                    shutil.copyfileobj(rows, out, 1 << 20)
+                    out.write(f"</{xml.name(child.tag)}>".encode("utf-8"))
+                    continue
+                if child.tag == f"{_XL_NS}sheetViews":
+                    for k, view in enumerate(child.findall(f"{_XL_NS}sheetView")):
+                        view.attrib.pop("tabSelected", None)
+                        if selected and k == 0:
+                            view.set("tabSelected", "1")
+                elif child.tag == f"{_XL_NS}mergeCells":
+                    child = _export_merges(child, row_map)
+                if child is not None and child.tag != f"{_XL_NS}dimension":
+                    out.write(xml.tostring(child).encode("utf-8"))
+            out.write(f"</{xml.name(root.tag)}>".encode("utf-8"))
+
+def _defined_name_sheets(text):
+    # The sheets (lower case) a defined name's formula refers to
+    _load_openpyxl()
+    try:
+        tokens = Tokenizer("=" + text).items
+    except Exception:
+        return set()
+    return {_split_reference(token.value, "")[0].lower() for token in tokens
+            if token.type == Token.OPERAND and token.subtype == Token.RANGE and "!" in token.value}
+
+def _export_workbook_xml(data, names, kept, hidden, row_maps=None):
+    # workbook.xml with the kept sheets in that order (EXPORT_SHEETS order, as export_logic creates them), the
+    # dropped ones and their defined names removed, localSheetId following the new order, Entries / Master
+    # Data hidden, the first visible sheet active and a full recalculation when Excel opens it. Names into
+    # pruned sheets follow their rows. Also returns the position of the active sheet in kept
+    from xml.etree.ElementTree import Element
+    xml = _XmlPart()
+    root = xml.parse(data)
+    dropped = {name.lower() for name in names if name not in kept}
+    visible = [name for name in kept if name not in hidden]
+
+    sheets = root.find(f"{_XL_NS}sheets")
+    by_name = {sheet.get("name"): sheet for sheet in sheets.findall(f"{_XL_NS}sheet")}
+    sheets[:] = [by_name[name] for name in kept]
+    for name in hidden & set(kept):
+        by_name[name].set("state", "hidden")
+
+    defined = root.find(f"{_XL_NS}definedNames")
+    if defined is not None:
+        for item in defined.findall(f"{_XL_NS}definedName"):
+            local = item.get("localSheetId")
+            if local is not None:
+                if names[int(local)] not in kept:
+                    defined.remove(item)
+                    continue
+                item.set("localSheetId", str(kept.index(names[int(local)])))
+            if _defined_name_sheets(item.text or "") & dropped:
+                defined.remove(item)
+            elif row_maps and item.text:
+                item.text = _remap_formula_rows("=" + item.text, "", row_maps)[1:]
+        if not len(defined):
+            root.remove(defined)
+
+    active = kept.index(visible[0]) if visible else None
+    for view in root.iter(f"{_XL_NS}workbookView"):
+        view.attrib.pop("firstSheet", None)
+        view.set("activeTab", str(active or 0))
+
+    calc = root.find(f"{_XL_NS}calcPr")
+    if calc is None:
+        before = {f"{_XL_NS}{tag}" for tag in ("sheets", "functionGroups", "externalReferences", "definedNames")}
+        calc = Element(f"{_XL_NS}calcPr")
+        root.insert(max(i for i, child in enumerate(root) if child.tag in before) + 1, calc)
+    calc.set("fullCalcOnLoad", "1")
+    return _XML_DECLARATION + xml.tostring(root, root=True), active
+
+def _export_package_xml(data, element, dropped):
+    # [Content_Types].xml / workbook rels without the <element>s whose attributes point at dropped parts;
+    # dropped is {attribute: values}
+    xml = _XmlPart()
+    root = xml.parse(data)
+    for child in list(root):
+        if child.tag.rpartition("}")[2] == element and any(child.get(attr) in values for attr, values in dropped.items()):
+            root.remove(child)
+    return _XML_DECLARATION + xml.tostring(root, root=True)
+
+def _xml_calc_row(zf_part, entries_row, template_path):
+    # First Calculation row from row 6 whose column C is the ZF Part Number or links to its Entries row
+    import zipfile
+    from xml.etree import ElementTree
+    zf_norm, link = _norm(zf_part), f"=entries!c{entries_row}"
+    with zipfile.ZipFile(template_path) as archive:
+        part = _sheet_part_name(archive, "Calculation")
+        if part is None:
+            return None
+        shared, row_idx = {}, 0
+        with archive.open(part) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag != f"{_XL_NS}row":
+                    continue
+                row_idx = int(elem.get("r")) if elem.get("r") else row_idx + 1
+                col = 0
+                for cell in elem.iter(f"{_XL_NS}c"):
+                    col = _column_number(cell.get("r")) if cell.get("r") else col + 1
+                    if col < 3:
+                        continue
+                    if col == 3 and row_idx >= 6:
+                        formula = _xml_formula(cell, f"C{row_idx}", shared)
+                        if (entries_row and _norm(formula) == link) or \
+                                _norm(_xml_cell_value(cell, archive, template_path)) == zf_norm:
+                            return row_idx
+                    break
+                elem.clear()
+    return None
+
+def _xml_export_changes(zf_part, template_path):
+    # "with" exports: the part's rows from the index, its Entries row streamed; Tooling row 6 gets the
+    # Entries values and links to the Calculation row the export moves to row 6, Summary row 6 the
+    # Entries values and Import A2 the Sl.#. Without a usable index the sheets are scanned instead
+    hit = lookup_part(zf_part, template_path=template_path)
+    if not hit or not hit["calc_row"]:
+        entries_row = hit["entries_row"] if hit else find_entry_row(zf_part.strip(), template_path=template_path)
+        hit = {"entries_row": entries_row, "calc_row": _xml_calc_row(zf_part, entries_row, template_path)}
+    if not hit["calc_row"]:
+        raise PartNotFoundError(f"ZF Part Number '{zf_part}' not found in Calculation sheet.")
+    changes = {}
+    values = None
+    if hit["entries_row"]:
+        rows = stream_sheet("Entries", hit["entries_row"], 1, len(all_fields), template_path=template_path)
+        try:
+            row_idx, values = next(rows, (None, None))
+        finally:
+            rows.close()
+        if row_idx != hit["entries_row"]:
+            values = None
+    if values is not None:
+        schema = sheet_schema()
+        tooling_row = schema["tooling_row"]
+        changes[("Import", 2, 1)] = values[0]
+        changes.update({("Tooling", tooling_row, col): values[col - 1] for col in schema["tooling_entries"]})
+        changes.update({("Tooling", tooling_row, tooling_col): f"=Calculation!{letter}{max(EXPORT_HEADER_ROWS) + 1}"
+                        for tooling_col, _, letter in schema["tooling_calc"]})
+        changes.update(_summary_changes(values))
+    return hit["calc_row"], changes
+
+def _xml_sheet_formulas(source, part, row_map, last_row=None):
+    # (row, [(column, formula)]) for the kept rows of a sheet part that have formulas
+    from xml.etree import ElementTree
+    shared, row_idx = {}, 0
+    with source.open(part) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f"{_XL_NS}row":
+                continue
+            row_idx = int(elem.get("r")) if elem.get("r") else row_idx + 1
+            if last_row is not None and row_idx > last_row:
+                break
+            if elem.find(f".//{_XL_NS}f") is not None and (row_map(row_idx) is not None or _has_shared_formulas(elem)):
+                found = _xml_row_formulas(elem, row_idx, shared)
+                if found and row_map(row_idx) is not None:
+                    yield row_idx, found
+            elem.clear()
+
+_pruned_formulas_cache = {}  # (template, stamp) -> {pruned sheet: {row: [(column, formula)]}}
+
+def _xml_prune_plan(source, sheets, calc_row, changes, workbook_xml, template_path):
+    # Row maps from the package: formulas of the rows the export keeps (each sheet read up to its last
+    # kept row), of the changed cells and of the defined names; Entries / Master Data formulas from one pass
+    # per template
+    from xml.etree import ElementTree
+    parts = {name: part for name, _, part in sheets}
+    formulas = [(sheet, v) for (sheet, _, _), v in changes.items() if isinstance(v, str) and v.startswith("=")]
+    formulas += [("", "=" + item.text) for item in ElementTree.fromstring(workbook_xml).iter(f"{_XL_NS}definedName")
+                 if item.text]
+    for sheet_name in ("Calculation", "Tooling", "Summary", "Import"):
+        if sheet_name in parts:
+            row_map = _export_row_map(sheet_name, calc_row)
+            last_row = _export_last_row(sheet_name, calc_row)
+            for _, found in _xml_sheet_formulas(source, parts[sheet_name], row_map, last_row):
+                formulas += [(sheet_name, f) for col, f in found if col <= EXPORT_COLUMNS[sheet_name]]
+    key = (os.path.abspath(template_path), _template_stamp(template_path))
+    if key not in _pruned_formulas_cache:
+        _pruned_formulas_cache.clear()
+        _pruned_formulas_cache[key] = {name: dict(_xml_sheet_formulas(source, parts[name], lambda row: row))
+                                       for name in PRUNED_SHEETS if name in parts}
+    pruned = _pruned_formulas_cache[key]
+
+    def row_formulas(sheet, row):
+        return [f for col, f in pruned.get(sheet, {}).get(row, []) if col <= EXPORT_COLUMNS[sheet]]
+
+    with span("export.prune"):
+        return pruned_row_maps(formulas, row_formulas)
+
+def export_xml(zf_part, export_type="with", output_dir=None, progress=None, prune=None, template_path=None):
+    with span("export.xml", zf_part=zf_part, mode=export_type):
+        return _export_xml(zf_part, export_type, output_dir, progress, PRUNE_EXPORTS if prune is None else prune,
+                           template_path or base.EXCEL_TEMPLATE)
+
+def _export_xml(zf_part, export_type, output_dir, progress, prune, template_path):
+    import zipfile
+    _load_openpyxl()
+    total_steps = 3 + len(EXPORT_SHEETS)
+    progress = progress or (lambda done, total, text="": None)
+    progress(0, total_steps, "Finding part")
+
+    if export_type == "without":
+        wb, evaluator = _export_evaluator(get_workbook(template_path, data_only=False), export_type, template_path)
+        overlay = ExportOverlay(evaluator)
+        export_value = _value_exporter(wb, overlay, template_path)
+        calc_row, entries_row = _find_export_rows(wb, zf_part, template_path)
+        progress(1, total_steps, "Updating Tooling")
+        if entries_row:
+            overlay.update({("Import", 2, 1): _cell_value(wb["Entries"], entries_row, 1)})
+            update_tooling_by_zf_part_number(wb, zf_part, overlay)
+            if "Summary" in wb.sheetnames:
+                _update_summary(wb, entries_row, overlay)
+        _link_tooling_results(wb, calc_row, overlay)
+        changes = overlay.cells
+        value_of = lambda sheet, row, col: export_value(_source_cell(wb[sheet], row, col))
+    else:
+        calc_row, changes = _xml_export_changes(zf_part, template_path)
+        value_of = None
+        progress(1, total_steps, "Updating Tooling")
+
+    export_filename = _export_filename(zf_part, export_type, output_dir)
+    try:
+        with zipfile.ZipFile(template_path) as source, \
+                zipfile.ZipFile(export_filename, "w", zipfile.ZIP_DEFLATED) as target:
+            sheets = _package_sheets(source)
+            names = [name for name, _, _ in sheets]
+            kept = [name for name in EXPORT_SHEETS if name in names]
+            for sheet_name in EXPORT_SHEETS:
+                if sheet_name not in kept:
+                    log(f"Sheet '{sheet_name}' not found in the template, skipping it", "warning", sheet=sheet_name)
+            hidden = {"Master Data", "Entries"}
+            workbook_xml = source.read("xl/workbook.xml")
+            row_maps = _xml_prune_plan(source, sheets, calc_row, changes, workbook_xml, template_path) if prune else {}
+            workbook_xml, active = _export_workbook_xml(workbook_xml, names, kept, hidden, row_maps)
+            parts = {part: name for name, _, part in sheets if name in kept}
+            dropped = {part for name, _, part in sheets if name not in kept} | {"xl/calcChain.xml"}
+            dropped |= {f"{os.path.dirname(p)}/_rels/{os.path.basename(p)}.rels" for p in list(dropped)}
+            dropped_ids = {rel_id for name, rel_id, _ in sheets if name not in kept}
+            for info in source.infolist():
+                name = info.filename
+                if name in dropped:
+                    continue
+                if name in parts:
+                    sheet_name = parts[name]
+                    progress(2 + EXPORT_SHEETS.index(sheet_name), total_steps, f"Copying {sheet_name}")
+                    with span("export.copy", sheet=sheet_name):
+                        _write_export_sheet(source, name, target, sheet_name, calc_row, changes, value_of,
+                                            active is not None and kept.index(sheet_name) == active, row_maps)
+                elif name == "xl/workbook.xml":
+                    target.writestr(info, workbook_xml)
+                elif name == "xl/_rels/workbook.xml.rels":
+                    target.writestr(info, _export_package_xml(source.read(name), "Relationship", {
+                        "Id": dropped_ids, "Target": {"calcChain.xml", "/xl/calcChain.xml"}}))
+                elif name == "[Content_Types].xml":
+                    target.writestr(info, _export_package_xml(source.read(name), "Override", {
+                        "PartName": {"/" + part for part in dropped}}))
+                else:
+                    target.writestr(info, source.read(name))
+    except JarvisError:
+        if os.path.exists(export_filename):
+            os.remove(export_filename)
+        raise
+    except Exception as e:
+        if os.path.exists(export_filename):
+            os.remove(export_filename)
+        raise ExportError(f"Failed to save export file: {str(e)}")
+    progress(total_steps - 1, total_steps, "Saving")
+    return export_filename
+
+# Batch export: many ZF Part Numbers from one template parse
+def read_part_numbers(path):
+    # One ZF Part Number per line (first column of a CSV); blank lines and '#' comments are skipped
+    zf_parts = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            value = line.split(",")[0].strip().strip('"')
+            if value and not value.startswith("#") and value not in zf_parts:
+                zf_parts.append(value)
+    return zf_parts
+
+def _export_chunk(zf_parts, export_type, output_dir, template_path, engine, progress=None, prune=None):
+    # Worker processes don't inherit a template path or engine changed at runtime, so both come as arguments
+    # The xml engine streams the package; only its values-only exports need the parsed template
+    wb = None if engine == "xml" else get_workbook(template_path, data_only=False)
+
+    results = []
+    for done, zf_part in enumerate(zf_parts):
+        if progress:
+            progress(done, len(zf_parts), zf_part)
+        try:
+            if wb is None:
+                path = export_xml(zf_part, export_type, output_dir=output_dir, prune=prune, template_path=template_path)
+            else:
+                path = export_logic(wb, zf_part, export_type, output_dir=output_dir, prune=prune,
+                                    template_path=template_path)
+            results.append({"zf_part": zf_part, "ok": True, "path": path})
+        except Exception as e:
+            results.append({"zf_part": zf_part, "ok": False, "error": str(e)})
+    return results
+
+def export_batch(zf_parts, export_type="with", output_dir=None, workers=1, progress=None, prune=None):
+    # workers=1 runs in this process, workers=None uses every core; each worker parses the template once.
+    # progress(done, total, text) is called as parts finish and may raise JobCancelled to stop early
+    # A part listed twice would be exported twice, racing on the same output file
+    zf_parts = list(dict.fromkeys(p.strip() for p in zf_parts if p and p.strip()))
+    if not zf_parts:
+        return []
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    sync_template()
+
+    workers = min(workers or os.cpu_count() or 1, len(zf_parts))
+    with span("export.batch", parts=len(zf_parts), workers=workers):
+        return _export_batch(zf_parts, export_type, output_dir, workers, progress,
+                             PRUNE_EXPORTS if prune is None else prune)
+
+def _export_batch(zf_parts, export_type, output_dir, workers, progress, prune=False):
+    if workers <= 1:
+        return _export_chunk(zf_parts, export_type, output_dir, base.EXCEL_TEMPLATE, EXPORT_ENGINE, progress, prune)
+
+    # More chunks than workers so progress moves steadily; workers keep their parsed template between chunks
+    n_chunks = min(len(zf_parts), workers * 4)
+    chunks = [zf_parts[i::n_chunks] for i in range(n_chunks)]
+    by_part = {}
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_export_chunk, chunk, export_type, output_dir, base.EXCEL_TEMPLATE, EXPORT_ENGINE, None,
+                               prune)
+                   for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                for result in future.result():
+                    by_part[result["zf_part"]] = result
+                if progress:
+                    progress(len(by_part), len(zf_parts), f"{len(by_part)} of {len(zf_parts)} parts")
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    # Report in the order the parts were requested
+    return [by_part[p] for p in zf_parts]
+
+def format_batch_report(results):
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    lines = [f"Exported {len(ok)} of {len(results)} parts."]
+    if failed:
+        lines.append("")
+        lines.append("Failed:")
+        lines.extend(f"  {r['zf_part']}: {r['error']}" for r in failed)
+    return "\n".join(lines)
@@ -0,0 +1,799 @@
+# The template's formulas in Python: the evaluator, the cell dependency graph and recalculation cost
+import gc
+import json
+import math
+import os
+import threading
+import time
+
+from . import base
+from .base import JarvisError, TemplateError, log, span
+from .workbook import _cell_value, _stored_cells, _template_stamp, _workbook_cache_entry
+
+# openpyxl is imported by _load_openpyxl() on first use, so importing this module stays cheap
+load_workbook = get_column_letter = range_boundaries = Tokenizer = Token = None
+
+def _load_openpyxl():
+    global load_workbook, get_column_letter, range_boundaries, Tokenizer, Token
+    if load_workbook is None:
+        from openpyxl import load_workbook
+        from openpyxl.utils import get_column_letter
+        from openpyxl.utils.cell import range_boundaries
+        from openpyxl.formula.tokenizer import Tokenizer, Token
+
+# Formula evaluator for the subset of Excel the template uses: cell/range references across sheets,
+# arithmetic, comparisons, & and the lookup/logic functions in _FORMULA_FUNCTIONS.
+# Each distinct formula text is compiled once into a Python closure and cached.
+class FormulaError(JarvisError):
+    pass
+
+class ExcelError:
+    __slots__ = ("code",)
+
+    def __init__(self, code):
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return self.code
+
+    __str__ = __repr__
+
+NA_ERROR = ExcelError("#N/A")
+VALUE_ERROR = ExcelError("#VALUE!")
+REF_ERROR = ExcelError("#REF!")
+DIV0_ERROR = ExcelError("#DIV/0!")
+NUM_ERROR = ExcelError("#NUM!")
+
+class _Range:
+    __slots__ = ("sheet", "min_row", "min_col", "max_row", "max_col")
+
+    def __init__(self, sheet, min_row, min_col, max_row, max_col):
+        self.sheet, self.min_row, self.min_col, self.max_row, self.max_col = sheet, min_row, min_col, max_row, max_col
+
+def _split_reference(text, host_sheet):
+    if "!" in text:
+        sheet, ref = text.rsplit("!", 1)
+        if sheet.startswith("'") and sheet.endswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+        return sheet, ref
+    return host_sheet, text
+
+def _to_number(value):
+    if isinstance(value, ExcelError):
+        return value
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip().rstrip("%")) / (100 if value.strip().endswith("%") else 1)
+        except ValueError:
+            return VALUE_ERROR
+    return VALUE_ERROR
+
+def _to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _to_bool(value):
+    if isinstance(value, str):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        return VALUE_ERROR
+    number = _to_number(value)
+    return number if isinstance(number, ExcelError) else number != 0
+
+def _lookup_key(value):
+    # Exact-match key: text compares case-insensitively, 1 and "1" stay different like in Excel
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return ("n", float(value))
+    if value is None:
+        return ("n", 0.0)
+    return ("s", str(value).strip().lower())
+
+def _compare(op, a, b):
+    if isinstance(a, ExcelError):
+        return a
+    if isinstance(b, ExcelError):
+        return b
+    # Blank takes the type of the other side
+    if a is None:
+        a = "" if isinstance(b, str) else 0
+    if b is None:
+        b = "" if isinstance(a, str) else 0
+    rank = lambda v: 2 if isinstance(v, bool) else (1 if isinstance(v, str) else 0)
+    ka = (rank(a), a.lower() if isinstance(a, str) else a)
+    kb = (rank(b), b.lower() if isinstance(b, str) else b)
+    if op == "=":
+        return ka == kb
+    if op == "<>":
+        return ka != kb
+    if op == "<":
+        return ka < kb
+    if op == ">":
+        return ka > kb
+    if op == "<=":
+        return ka <= kb
+    return ka >= kb
+
+def _arith(op, a, b):
+    a, b = _to_number(a), _to_number(b)
+    if isinstance(a, ExcelError):
+        return a
+    if isinstance(b, ExcelError):
+        return b
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        return DIV0_ERROR if b == 0 else a / b
+    try:
+        return a ** b
+    except (OverflowError, ZeroDivisionError, ValueError):
+        return NUM_ERROR
+
+def _range_values(ev, arg):
+    # Every value in a range argument (row by row), or the single value of a scalar argument
+    if isinstance(arg, _Range):
+        max_row = arg.max_row or ev.max_row(arg.sheet)
+        max_col = arg.max_col or ev.max_column(arg.sheet)
+        for row in range(arg.min_row or 1, max_row + 1):
+            for col in range(arg.min_col or 1, max_col + 1):
+                yield ev.value(arg.sheet, row, col)
+    else:
+        yield arg
+
+def _numbers(ev, args):
+    for arg in args:
+        for value in _range_values(ev, arg(ev)):
+            if isinstance(value, ExcelError):
+                raise _ErrorResult(value)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield value
+
+class _ErrorResult(Exception):
+    def __init__(self, error):
+        self.error = error
+
+def _fn_if(ev, args):
+    cond = _to_bool(args[0](ev))
+    if isinstance(cond, ExcelError):
+        return cond
+    if cond:
+        return args[1](ev) if len(args) > 1 else True
+    return args[2](ev) if len(args) > 2 else False
+
+def _fn_ifna(ev, args):
+    value = args[0](ev)
+    return args[1](ev) if value == NA_ERROR else value
+
+def _fn_iferror(ev, args):
+    value = args[0](ev)
+    return args[1](ev) if isinstance(value, ExcelError) else value
+
+def _fn_vlookup(ev, args):
+    lookup, table, col_index = args[0](ev), args[1](ev), _to_number(args[2](ev))
+    approximate = _to_bool(args[3](ev)) if len(args) > 3 else True
+    for value in (lookup, col_index, approximate):
+        if isinstance(value, ExcelError):
+            return value
+    if not isinstance(table, _Range):
+        return VALUE_ERROR
+    col_index = int(col_index)
+    width = (table.max_col or ev.max_column(table.sheet)) - table.min_col + 1
+    if col_index < 1 or col_index > width:
+        return REF_ERROR
+    row = ev.match_row(table.sheet, table.min_col, table.min_row or 1, table.max_row, lookup, approximate)
+    if row is None:
+        return NA_ERROR
+    return ev.value(table.sheet, row, table.min_col + col_index - 1)
+
+def _fn_match(ev, args):
+    lookup, area = args[0](ev), args[1](ev)
+    match_type = _to_number(args[2](ev)) if len(args) > 2 else 1
+    if isinstance(lookup, ExcelError):
+        return lookup
+    if isinstance(match_type, ExcelError):
+        return match_type
+    if not isinstance(area, _Range):
+        return VALUE_ERROR
+    # Like Excel only the sign counts: 1 the largest value <= lookup in ascending data, 0 an exact match,
+    # -1 the smallest value >= lookup in descending data
+    first_row = area.min_row or 1
+    row = ev.match_row(area.sheet, area.min_col or 1, first_row, area.max_row, lookup, match_type != 0,
+                       descending=match_type < 0)
+    return NA_ERROR if row is None else row - first_row + 1
+
+def _fn_index(ev, args):
+    area = args[0](ev)
+    row = _to_number(args[1](ev)) if len(args) > 1 else 1
+    col = _to_number(args[2](ev)) if len(args) > 2 else 1
+    if not isinstance(area, _Range):
+        return area if row in (0, 1) and col in (0, 1) else REF_ERROR
+    for value in (row, col):
+        if isinstance(value, ExcelError):
+            return value
+    first_row, first_col = area.min_row or 1, area.min_col or 1
+    last_row = area.max_row or ev.max_row(area.sheet)
+    last_col = area.max_col or ev.max_column(area.sheet)
+    row, col = first_row + int(row) - 1, first_col + int(col) - 1
+    if not (first_row <= row <= last_row and first_col <= col <= last_col):
+        return REF_ERROR
+    return ev.value(area.sheet, row, col)
+
+def _aggregate(fn, empty=0):
+    def call(ev, args):
+        try:
+            values = list(_numbers(ev, args))
+        except _ErrorResult as e:
+            return e.error
+        return fn(values) if values else empty
+    return call
+
+def _rounding(mode):
+    def call(ev, args):
+        number = _to_number(args[0](ev))
+        digits = _to_number(args[1](ev)) if len(args) > 1 else 0
+        for value in (number, digits):
+            if isinstance(value, ExcelError):
+                return value
+        factor = 10 ** int(digits)
+        scaled = abs(number) * factor
+        if mode == "up":
+            scaled = math.ceil(scaled - 1e-9)
+        elif mode == "down":
+            scaled = math.floor(scaled + 1e-9)
+        else:
+            scaled = math.floor(scaled + 0.5 + 1e-9)
+        return math.copysign(scaled / factor, number) if number else 0
+    return call
+
+def _fn_logical(combine):
+    def call(ev, args):
+        results = []
+        for arg in args:
+            for value in _range_values(ev, arg(ev)):
+                flag = _to_bool(value)
+                if isinstance(flag, ExcelError):
+                    return flag
+                results.append(flag)
+        return combine(results)
+    return call
+
+def _fn_concatenate(ev, args):
+    parts = []
+    for arg in args:
+        value = arg(ev)
+        if isinstance(value, ExcelError):
+            return value
+        parts.append(_to_text(value))
+    return "".join(parts)
+
+def _single_number(fn):
+    def call(ev, args):
+        number = _to_number(args[0](ev))
+        return number if isinstance(number, ExcelError) else fn(number)
+    return call
+
+_FORMULA_FUNCTIONS = {
+    "IF": _fn_if, "IFNA": _fn_ifna, "IFERROR": _fn_iferror,
+    "VLOOKUP": _fn_vlookup, "MATCH": _fn_match, "INDEX": _fn_index,
+    "SUM": _aggregate(sum), "MIN": _aggregate(min), "MAX": _aggregate(max),
+    "AVERAGE": _aggregate(lambda v: sum(v) / len(v), DIV0_ERROR),
+    "ROUND": _rounding("half"), "ROUNDUP": _rounding("up"), "ROUNDDOWN": _rounding("down"),
+    "AND": _fn_logical(all), "OR": _fn_logical(any),
+    "NOT": lambda ev, args: (lambda v: v if isinstance(v, ExcelError) else not v)(_to_bool(args[0](ev))),
+    "ABS": _single_number(abs), "INT": _single_number(math.floor),
+    "CONCATENATE": _fn_concatenate,
+    "ISNA": lambda ev, args: args[0](ev) == NA_ERROR,
+    "ISERROR": lambda ev, args: isinstance(args[0](ev), ExcelError),
+    "ISBLANK": lambda ev, args: args[0](ev) is None,
+}
+
+_INFIX_BINDING = {
+    "=": (1, 2), "<>": (1, 2), "<": (1, 2), ">": (1, 2), "<=": (1, 2), ">=": (1, 2),
+    "&": (3, 4), "+": (5, 6), "-": (5, 6), "*": (7, 8), "/": (7, 8), "^": (9, 10),
+}
+_PREFIX_BINDING = 11  # Excel applies unary minus before ^, so =-2^2 is 4
+
+def _compile_operand(token, host_sheet):
+    value, subtype = token.value, token.subtype
+    if subtype == Token.NUMBER:
+        number = float(value)
+        number = int(number) if number.is_integer() and "." not in value and "E" not in value.upper() else number
+        return lambda ev: number
+    if subtype == Token.TEXT:
+        text = value[1:-1].replace('""', '"')
+        return lambda ev: text
+    if subtype == Token.LOGICAL:
+        flag = value.upper() == "TRUE"
+        return lambda ev: flag
+    if subtype == Token.ERROR:
+        error = ExcelError(value.upper())
+        return lambda ev: error
+    sheet, ref = _split_reference(value, host_sheet)
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(ref.replace("$", ""))
+    except ValueError:
+        raise FormulaError(f"Unsupported reference '{value}'")
+    if min_row == max_row and min_col == max_col and min_row is not None:
+        return lambda ev: ev.value(sheet, min_row, min_col)
+    area = _Range(sheet, min_row, min_col, max_row, max_col)
+    return lambda ev: area
+
+class _ClosureBuilder:
+    # What _compile_tokens turns each piece of a formula into: here closures over a FormulaEvaluator
+    def __init__(self, host_sheet):
+        self.host_sheet = host_sheet
+
+    def operand(self, token):
+        return _compile_operand(token, self.host_sheet)
+
+    def empty(self):
+        return lambda ev: None  # Empty argument, e.g. IFNA(x,)
+
+    def call(self, name, args):
+        fn = _FORMULA_FUNCTIONS.get(name)
+        if fn is None:
+            raise FormulaError(f"Unsupported function {name}()")
+        return lambda ev: fn(ev, args)
+
+    def prefix(self, op, operand):
+        if op == "-":
+            return lambda ev: _arith("-", 0, operand(ev))
+        return lambda ev: _to_number(operand(ev))
+
+    def percent(self, inner):
+        return lambda ev: _arith("/", inner(ev), 100)
+
+    def infix(self, op, a, b):
+        if op == "&":
+            return lambda ev: _fn_concatenate(ev, [a, b])
+        if op in ("+", "-", "*", "/", "^"):
+            return lambda ev: _arith(op, a(ev), b(ev))
+        return lambda ev: _compare(op, a(ev), b(ev))
+
+def _compile_tokens(tokens, build):
+    _load_openpyxl()  # costs.py compiles its column programs through here without compile_formula()
+    pos = [0]
+
+    def peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+    def take():
+        token = peek()
+        if token is None:
+            raise FormulaError("Unexpected end of formula")
+        pos[0] += 1
+        return token
+
+    def parse_call(name):
+        args = []
+        token = peek()
+        if token is not None and token.type == Token.FUNC and token.subtype == Token.CLOSE:
+            take()
+            return build.call(name, args)
+        while True:
+            token = peek()
+            if token is not None and (token.type == Token.SEP or (token.type == Token.FUNC and token.subtype == Token.CLOSE)):
+                args.append(build.empty())
+            else:
+                args.append(parse(0))
+            token = take()
+            if token.type == Token.FUNC and token.subtype == Token.CLOSE:
+                return build.call(name, args)
+            if token.type != Token.SEP or token.subtype != Token.ARG:
+                raise FormulaError(f"Unexpected '{token.value}' in {name}()")
+
+    def parse(min_binding):
+        token = take()
+        if token.type == Token.OP_PRE:
+            lhs = build.prefix(token.value, parse(_PREFIX_BINDING))
+        elif token.type == Token.OPERAND:
+            lhs = build.operand(token)
+        elif token.type == Token.FUNC and token.subtype == Token.OPEN:
+            lhs = parse_call(token.value[:-1].upper())
+        elif token.type == Token.PAREN and token.subtype == Token.OPEN:
+            lhs = parse(0)
+            closing = take()
+            if closing.type != Token.PAREN:
+                raise FormulaError("Missing ')'")
+        else:
+            raise FormulaError(f"Unexpected '{token.value}'")
+
+        while True:
+            token = peek()
+            if token is None:
+                return lhs
+            if token.type == Token.OP_POST:
+                take()
+                lhs = build.percent(lhs)
+                continue
+            if token.type != Token.OP_IN:
+                return lhs
+            if token.value not in _INFIX_BINDING:
+                raise FormulaError(f"Unsupported operator '{token.value}'")
+            left_binding, right_binding = _INFIX_BINDING[token.value]
+            if left_binding < min_binding:
+                return lhs
+            take()
+            lhs = build.infix(token.value, lhs, parse(right_binding))
+
+    compiled = parse(0)
+    if peek() is not None:
+        raise FormulaError(f"Unexpected '{peek().value}'")
+    return compiled
+
+_compiled_formulas = {}
+COMPILED_FORMULA_CACHE_SIZE = 100000
+
+def compile_formula(formula, host_sheet):
+    key = (host_sheet, formula)
+    compiled = _compiled_formulas.get(key)
+    if compiled is None:
+        _load_openpyxl()
+        try:
+            tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+        except Exception as e:
+            raise FormulaError(f"Cannot parse {formula}: {e}")
+        compiled = _compile_tokens(tokens, _ClosureBuilder(host_sheet))
+        if len(_compiled_formulas) >= COMPILED_FORMULA_CACHE_SIZE:
+            _compiled_formulas.clear()
+        _compiled_formulas[key] = compiled
+    return compiled
+
+class FormulaEvaluator:
+    # Evaluates cells of a formulas workbook; overrides replace cell contents without touching the workbook.
+    # With a dependency graph, a change only drops the cached values of the cells that depend on it.
+    def __init__(self, wb, overrides=None, graph=None):
+        _load_openpyxl()
+        self.wb = wb
+        self.overrides = dict(overrides or {})
+        self.graph = graph
+        self._values = {}
+        self._in_progress = set()
+        self._match_tables = {}
+        self._max_rows = {}
+        self._ranges_by_sheet = None
+
+    def clear(self):
+        self._values.clear()
+        self._match_tables.clear()
+        self._max_rows.clear()
+
+    def invalidate(self, changed):
+        # Forget the values of changed cells and everything downstream; returns the dirty cells
+        changed = list(changed)
+        if self.graph is None:
+            self.clear()
+            return set(changed)
+        if self._ranges_by_sheet is None:
+            self._ranges_by_sheet = _ranges_by_sheet(self.graph)
+        dirty = dirty_cells(self.graph, changed, self._ranges_by_sheet)
+        for key in dirty:
+            self._values.pop(key, None)
+        for table_key in list(self._match_tables):
+            sheet, col, first_row, last_row = table_key
+            if any(k[0] == sheet and k[2] == col and first_row <= k[1] <= last_row for k in dirty):
+                del self._match_tables[table_key]
+        return dirty
+
+    def set_value(self, sheet, row, col, value):
+        self.overrides[(sheet, row, col)] = value
+        self.invalidate([(sheet, row, col)])
+
+    def recalculate(self, changed):
+        # Re-evaluate only the formulas downstream of the changed cells
+        results = {}
+        for key in self.invalidate(changed):
+            raw = self.raw(*key)
+            if isinstance(raw, str) and raw.startswith("="):
+                results[key] = self.value(*key)
+        return results
+
+    def _sheet(self, sheet):
+        if sheet in self.wb.sheetnames:
+            return self.wb[sheet]
+        for name in self.wb.sheetnames:
+            if name.lower() == sheet.lower():
+                return self.wb[name]
+        return None
+
+    def max_row(self, sheet):
+        # openpyxl scans every cell for max_row, and full-column lookups ask for it on each call
+        if sheet not in self._max_rows:
+            ws = self._sheet(sheet)
+            self._max_rows[sheet] = ws.max_row if ws is not None else 0
+        return self._max_rows[sheet]
+
+    def max_column(self, sheet):
+        ws = self._sheet(sheet)
+        return ws.max_column if ws is not None else 0
+
+    def raw(self, sheet, row, col):
+        key = (sheet, row, col)
+        if key in self.overrides:
+            return self.overrides[key]
+        ws = self._sheet(sheet)
+        if ws is None:
+            return REF_ERROR
+        return _cell_value(ws, row, col)
+
+    def value(self, sheet, row, col):
+        key = (sheet, row, col)
+        if key in self._values:
+            return self._values[key]
+        raw = self.raw(sheet, row, col)
+        if isinstance(raw, str) and raw.startswith("=") and len(raw) > 1:
+            if key in self._in_progress:
+                raise FormulaError(f"Circular reference at {sheet}!{get_column_letter(col)}{row}")
+            self._in_progress.add(key)
+            try:
+                result = compile_formula(raw, sheet)(self)
+            finally:
+                self._in_progress.discard(key)
+            if isinstance(result, _Range):
+                result = VALUE_ERROR
+            elif result is None:
+                result = 0  # A formula pointing at a blank cell shows 0 in Excel
+        elif raw is not None and not isinstance(raw, (str, int, float, bool, ExcelError)):
+            # Array/data-table formulas and dates are not evaluated here
+            if hasattr(raw, "text") or hasattr(raw, "ref"):
+                raise FormulaError(f"Unsupported formula object at {sheet}!{get_column_letter(col)}{row}")
+            result = raw
+        else:
+            result = raw
+        self._values[key] = result
+        return result
+
+    def match_row(self, sheet, col, first_row, last_row, lookup, approximate, descending=False):
+        # Row of the first exact match (hash table built once per column/range) or the last row <= lookup
+        # (>= lookup for descending data)
+        last_row = last_row or self.max_row(sheet)
+        if not approximate:
+            table_key = (sheet, col, first_row, last_row)
+            table = self._match_tables.get(table_key)
+            if table is None:
+                table = {}
+                for row in range(first_row, last_row + 1):
+                    value = self.value(sheet, row, col)
+                    if value is not None and not isinstance(value, ExcelError):
+                        table.setdefault(_lookup_key(value), row)
+                self._match_tables[table_key] = table
+            return table.get(_lookup_key(lookup))
+        found = None
+        for row in range(first_row, last_row + 1):
+            value = self.value(sheet, row, col)
+            if value is None or isinstance(value, ExcelError):
+                continue
+            if _compare("<" if descending else ">", value, lookup) is True:
+                break
+            found = row
+        return found
+
+# Cell dependency graph over Entries → Calculation → Tooling → Summary → Import.
+# Built from the template's formulas once per template version and stored next to it as JSON (plain data only,
+# so a sidecar on a shared drive can't run code when it is read back).
+DEPENDENCY_SHEETS = ("Entries", "Calculation", "Tooling", "Summary", "Import")
+
+_dependency_graphs = {}
+
+def _depgraph_path(template_path=None):
+    return os.path.splitext(template_path or base.EXCEL_TEMPLATE)[0] + ".depgraph.json"
+
+def _formula_references(formula, host_sheet):
+    _load_openpyxl()
+    cells, ranges = [], []
+    try:
+        tokens = Tokenizer(formula).items
+    except Exception:
+        return cells, ranges
+    for token in tokens:
+        if token.type != Token.OPERAND or token.subtype != Token.RANGE:
+            continue
+        sheet, ref = _split_reference(token.value, host_sheet)
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(ref.replace("$", ""))
+        except ValueError:
+            continue  # Defined names aren't tracked
+        if min_row == max_row and min_col == max_col and min_row is not None:
+            cells.append((sheet, min_row, min_col))
+        else:
+            ranges.append((sheet, min_row, min_col, max_row, max_col))
+    return cells, ranges
+
+def _add_formula_edges(graph, key, formula):
+    _remove_formula_edges(graph, key)
+    _link_precedents(graph, key, *_formula_references(formula, key[0]))
+
+def _link_precedents(graph, key, cells, ranges):
+    graph["precedents"][key] = (cells, ranges)
+    for cell in cells:
+        graph["dependents"].setdefault(cell, set()).add(key)
+    for area in ranges:
+        graph["range_dependents"].setdefault(area, set()).add(key)
+
+def _remove_formula_edges(graph, key):
+    cells, ranges = graph["precedents"].pop(key, ((), ()))
+    for cell in cells:
+        graph["dependents"].get(cell, set()).discard(key)
+    for area in ranges:
+        dependents = graph["range_dependents"].get(area)
+        if dependents is not None:
+            dependents.discard(key)
+            if not dependents:
+                del graph["range_dependents"][area]
+
+def _ranges_by_sheet(graph):
+    ranges_by_sheet = {}
+    for area, dependents in graph["range_dependents"].items():
+        ranges_by_sheet.setdefault(area[0], []).append((area, dependents))
+    return ranges_by_sheet
+
+def dirty_cells(graph, changed, ranges_by_sheet=None):
+    # Changed cells plus every formula that (transitively) reads one of them
+    if ranges_by_sheet is None:
+        ranges_by_sheet = _ranges_by_sheet(graph)
+    dirty = set(changed)
+    stack = list(changed)
+    while stack:
+        sheet, row, col = stack.pop()
+        found = set(graph["dependents"].get((sheet, row, col), ()))
+        for (_, min_row, min_col, max_row, max_col), dependents in ranges_by_sheet.get(sheet, ()):
+            if (min_row is None or min_row <= row) and (max_row is None or row <= max_row) \
+                    and (min_col is None or min_col <= col) and (max_col is None or col <= max_col):
+                found |= dependents
+        for key in found - dirty:
+            dirty.add(key)
+            stack.append(key)
+    return dirty
+
+def build_dependency_graph(template_path=None):
+    _load_openpyxl()
+    template_path = template_path or base.EXCEL_TEMPLATE
+    graph = {"stamp": _template_stamp(template_path), "dependents": {}, "range_dependents": {}, "precedents": {}}
+    # Streamed from the file so formulas overwritten in a cached workbook don't leak in
+    with span("graph.build", path=template_path):
+        wb = load_workbook(template_path, read_only=True)
+        try:
+            for sheet in DEPENDENCY_SHEETS:
+                if sheet not in wb.sheetnames:
+                    continue
+                for row_idx, row in enumerate(wb[sheet].iter_rows(values_only=True), start=1):
+                    for col_idx, value in enumerate(row, start=1):
+                        if isinstance(value, str) and value.startswith("=") and len(value) > 1:
+                            _add_formula_edges(graph, (sheet, row_idx, col_idx), value)
+        finally:
+            wb.close()
+    _store_dependency_graph(template_path, graph)
+    return graph
+
+def _store_dependency_graph(template_path, graph):
+    _dependency_graphs[os.path.abspath(template_path)] = graph
+    path = _depgraph_path(template_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # concurrent exports may rebuild it too
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_graph_to_json(graph), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log(f"Could not write dependency graph cache: {e}", "warning")
+
+def get_dependency_graph(template_path=None):
+    template_path = template_path or base.EXCEL_TEMPLATE
+    stamp = _template_stamp(template_path)
+    graph = _dependency_graphs.get(os.path.abspath(template_path))
+    if graph is not None and graph["stamp"] == stamp:
+        return graph
+    try:
+        with open(_depgraph_path(template_path), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("stamp") == stamp:
+            graph = _graph_from_json(data)
+            _dependency_graphs[os.path.abspath(template_path)] = graph
+            return graph
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        pass
+    return build_dependency_graph(template_path)
+
+def _template_dependency_graph(wb):
+    # Only trust the graph for the cached formulas workbook it was built from
+    key = _workbook_cache_entry(wb)
+    if key is None or key[1]:
+        return None
+    try:
+        graph = get_dependency_graph(key[0])
+    except OSError:
+        return None
+    return graph if graph["stamp"] == f"{key[2]}:{key[3]}" else None
+
+def _graph_to_json(graph):
+    # Only the precedents are stored; the reverse edges are rebuilt on load
+    return {"stamp": graph["stamp"],
+            "formulas": [[list(key), [list(c) for c in cells], [list(r) for r in ranges]]
+                         for key, (cells, ranges) in graph["precedents"].items()]}
+
+def _graph_from_json(data):
+    graph = {"stamp": data["stamp"], "dependents": {}, "range_dependents": {}, "precedents": {}}
+    # Only new containers are made here, so the cyclic GC passes would just slow the load down
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for key, cells, ranges in data["formulas"]:
+            _link_precedents(graph, tuple(key), list(map(tuple, cells)), list(map(tuple, ranges)))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return graph
+
+def _record_saved_formulas(stamp_before, formulas):
+    # Patch the graph with the formulas save_entry just wrote instead of re-reading the whole template
+    graph = _dependency_graphs.get(os.path.abspath(base.EXCEL_TEMPLATE))
+    if graph is None or stamp_before is None or graph["stamp"] != stamp_before:
+        return
+    for key, formula in formulas.items():
+        _add_formula_edges(graph, key, formula)
+    graph["stamp"] = _template_stamp()
+    _store_dependency_graph(base.EXCEL_TEMPLATE, graph)
+
+# Calculation lookups: rows written before the bounded MATCH/INDEX lookups carry two whole-column VLOOKUPs
+# (Tooling!A:AO) each, which Excel rescans for every row on every recalculation. journal.migrate_formulas()
+# rewrites them in place; recalc_cost() measures a sheet before and after.
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLUMNS = 16384
+
+def recalc_cost(template_path=None, sheet="Calculation"):
+    # What a full recalculation of the sheet costs: its formulas, the cells their ranges span (Excel keeps
+    # dependencies and scans lookups over these; a whole column is 1,048,576 rows) and the seconds this
+    # module's evaluator takes to compute all of them
+    _load_openpyxl()
+    path = template_path or base.EXCEL_TEMPLATE
+    if not os.path.exists(path):
+        raise TemplateError(f"Excel template not found: {path}")
+    wb = load_workbook(path)
+    ws = wb[sheet]
+    formulas = [(row, col, cell.value) for (row, col), cell in _stored_cells(ws).items()
+                if isinstance(cell.value, str) and cell.value.startswith("=")]
+    range_cells = errors = 0
+    for _, _, formula in formulas:
+        try:
+            compile_formula(formula, sheet)  # parsing isn't recalculation: compile before the clock starts
+        except FormulaError:
+            pass
+        for _, min_row, min_col, max_row, max_col in _formula_references(formula, sheet)[1]:
+            rows = (max_row or EXCEL_MAX_ROWS) - (min_row or 1) + 1
+            cols = (max_col or EXCEL_MAX_COLUMNS) - (min_col or 1) + 1
+            range_cells += rows * cols
+    evaluator = FormulaEvaluator(wb)
+    start = time.perf_counter()
+    for row, col, _ in formulas:
+        try:
+            evaluator.value(sheet, row, col)
+        except FormulaError:
+            errors += 1
+    seconds = time.perf_counter() - start
+    return {"sheet": sheet, "formulas": len(formulas), "range_cells": range_cells,
+            "seconds": round(seconds, 3), "unsupported": errors}
+
+def format_recalc_cost(cost):
+    return (f"{cost['sheet']}: {cost['formulas']} formulas, {cost['range_cells']:,} cells in ranges, "
+            f"evaluated in {cost['seconds']:.3f}s" + (f" ({cost['unsupported']} unsupported)" if cost["unsupported"] else ""))
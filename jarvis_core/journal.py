@@ -0,0 +1,294 @@
+# Saving entries: straight into the template (or the store), through the write-behind journal, or in bulk
+# from a file; plus the reads that must see journaled entries
+import csv
+import json
+import os
+import platform
+import threading
+import time
+
+from . import base
+from .base import JarvisError, SaveError, TemplateError, ValidationError, all_fields, log, sheet_schema, span
+from .workbook import _cell_value, find_entry_row, get_workbook, _norm, _open_part_index, _require_template, _write_row
+from .entries import _apply_entry, _check_tool_match_column, _tool_lookup_formulas, validate_entries
+from .lock import LOCK_STALE_SECONDS, _locked_save, _process_gone
+from .store import render_template, store_has_part, store_rows, store_save_entries
+
+# openpyxl is imported by _load_openpyxl() on first use, so importing this module stays cheap
+load_workbook = None
+
+def _load_openpyxl():
+    global load_workbook
+    if load_workbook is None:
+        from openpyxl import load_workbook
+
+# Headless save: returns Sl.#, Entries row and whether an existing row was overwritten
+def save_entries(entries):
+    # Any number of entries with one workbook parse and one save (one transaction with the store)
+    if not entries:
+        return []
+    if base.DB_PATH:
+        return store_save_entries(entries)
+    def apply(wb):
+        with span("save.apply", entries=len(entries)):
+            new_rows = {}
+            results = [_apply_entry(wb, entry_data, new_rows) for entry_data in entries]
+
+        calc_ws = wb["Calculation"]
+        formulas = {
+            ("Calculation", r["calc_row"], cell.column): cell.value
+            for r in results for cell in calc_ws[r["calc_row"]]
+            if isinstance(cell.value, str) and cell.value.startswith("=")
+        }
+        return results, results, formulas
+
+    try:
+        results = _locked_save(apply)
+    except JarvisError:
+        raise
+    except Exception as e:
+        raise SaveError(str(e))
+
+    return [{"sl_no": r["sl_no"], "row": r["row"], "updated": r["updated"]} for r in results]
+
+def save_entry(entry_data):
+    return save_entries([entry_data])[0]
+
+# Calculation rows written before the bounded MATCH/INDEX lookups carry two whole-column VLOOKUPs each;
+# migrate_formulas() rewrites them in place (recalc_cost() in formulas.py measures before and after)
+def _is_old_tool_lookup(value):
+    text = str(value or "").upper()
+    return text.startswith("=") and "VLOOKUP(" in text and "TOOLING!" in text
+
+def migrate_formulas():
+    # Rewrites every Calculation row whose Tooling results still use VLOOKUP; returns the rewritten rows
+    _require_template()
+    schema = sheet_schema()
+    result_cols = [calc_col for calc_col, _, _ in schema["calc_tool_results"]]
+    def apply(wb):
+        calc_ws = wb["Calculation"]
+        # Refused before anything is written if the MATCH column (header included) holds anything else
+        _check_tool_match_column(calc_ws, range(1, calc_ws.max_row + 1))
+        rows = [row for row in range(1, calc_ws.max_row + 1)
+                if any(_is_old_tool_lookup(_cell_value(calc_ws, row, col)) for col in result_cols)]
+        formulas = {}
+        with span("formulas.migrate", rows=len(rows)):
+            for row in rows:
+                lookups = _tool_lookup_formulas(row)
+                _write_row(calc_ws, row, list(lookups), list(lookups.values()))
+                formulas.update({("Calculation", row, col): value for col, value in lookups.items()})
+        return rows, [], formulas
+    try:
+        rows = _locked_save(apply)
+    except JarvisError:
+        raise
+    except Exception as e:
+        raise SaveError(str(e))
+    log(f"Rewrote the Tooling lookups of {len(rows)} Calculation rows in {base.EXCEL_TEMPLATE}", rows=len(rows))
+    return rows
+
+# Write-behind journal: Submit only appends the entry here (instant), flush_journal() writes every
+# pending entry into the workbook with one save. A crash before the flush is recovered on next start.
+JOURNAL_FLUSH_SECONDS = float(os.environ.get("JARVIS_FLUSH_SECONDS", "60"))
+_journal_lock = threading.RLock()
+_flush_lock = threading.Lock()
+
+def _journal_path(template_path=None):
+    return os.path.splitext(template_path or base.EXCEL_TEMPLATE)[0] + ".journal.jsonl"
+
+def journal_entry(entry_data):
+    line = json.dumps({"queued_at": time.time(), "entry": entry_data}, default=str)
+    with _journal_lock:
+        with open(_journal_path(), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _journal_files():
+    # The live journal plus journals claimed by a flush that never finished (oldest first)
+    path = _journal_path()
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(folder):
+        return []
+    prefix = os.path.basename(path) + "."
+    claimed = sorted(name for name in os.listdir(folder) if name.startswith(prefix) and name.endswith(".flushing"))
+    return [os.path.join(folder, name) for name in claimed] + ([path] if os.path.exists(path) else [])
+
+def _claim_journal(path):
+    # A name of our own for a journal file being flushed: <journal>.<host>-<pid>-<claimed at, ns>.flushing
+    while True:
+        claimed = f"{_journal_path()}.{platform.node()}-{os.getpid()}-{time.time_ns()}.flushing"
+        if not os.path.exists(claimed):
+            break
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return None  # claimed by someone else meanwhile
+    return claimed
+
+def _abandoned_claim(claimed):
+    # A journal claimed by a flush that no longer runs: an earlier flush of this process that failed, one
+    # claimed more than LOCK_STALE_SECONDS ago (its save would hold the template lock that long) or one of a
+    # process on this machine that has exited. Anything else is still being saved by its flush
+    tag = os.path.basename(claimed)[len(os.path.basename(_journal_path())) + 1:-len(".flushing")]
+    try:
+        host, pid, claimed_ns = tag.rsplit("-", 2)
+        pid, age = int(pid), (time.time_ns() - int(claimed_ns)) / 1e9
+    except ValueError:
+        try:
+            return time.time() - os.path.getmtime(claimed) > LOCK_STALE_SECONDS
+        except OSError:
+            return False
+    if host == platform.node() and pid == os.getpid():
+        return True
+    return age > LOCK_STALE_SECONDS or _process_gone(host, pid)
+
+def pending_journal_entries(paths=None):
+    entries = []
+    with _journal_lock:
+        for path in (_journal_files() if paths is None else paths):
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue  # flushed by someone else meanwhile
+            with f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entries.append(json.loads(line)["entry"])
+                    except (ValueError, KeyError):
+                        # Torn write from a crash
+                        log(f"Skipping unreadable journal line: {line.strip()[:80]}", "warning", journal=path)
+    return entries
+
+def flush_journal():
+    # One flush at a time per process. _journal_lock is only held to claim the journal and read the claimed
+    # files: Submit appends to a new journal meanwhile, and the Next check still sees the claimed entries
+    with _flush_lock:
+        with _journal_lock:
+            # Claim the journal by renaming it: entries queued from now on (by anyone sharing the template)
+            # start a new journal instead of being removed with this one. Claims of flushes that died are
+            # taken over the same way, so only one flush saves them
+            paths = []
+            for path in _journal_files():
+                if path.endswith(".flushing") and not _abandoned_claim(path):
+                    continue
+                claimed = _claim_journal(path)
+                if claimed is not None:
+                    paths.append(claimed)
+                elif path == _journal_path() and os.path.exists(path):
+                    log("Journal is busy, leaving it for the next flush", "warning")
+            entries = pending_journal_entries(paths)
+        if entries:
+            with span("journal.flush", entries=len(entries)):
+                results = save_entries(entries)
+        else:
+            results = []
+        # Dropped only after the workbook save succeeded; replaying the same entries is harmless
+        # because they overwrite their own (ZF Part Number, Part No) rows
+        for claimed in paths:
+            try:
+                os.remove(claimed)
+            except OSError:
+                pass
+    if results:
+        log(f"Flushed {len(results)} journaled entries into {base.DB_PATH or base.EXCEL_TEMPLATE}", entries=len(results))
+    return results
+
+def sync_template():
+    # What every Excel consumer runs first: queued entries saved and, with the store, the template rendered
+    flush_journal()
+    if base.DB_PATH:
+        render_template()
+
+# Bulk import of supplier sheets: CSV / JSON / XLSX rows keyed by the names in `fields`
+def read_entry_rows(path):
+    # Returns (row_number, raw_dict) pairs; row numbers are as the user sees them in the source file
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("entries", [data])
+        return [(i, row) for i, row in enumerate(data, start=1)]
+    if ext == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return [(i, row) for i, row in enumerate(csv.DictReader(f), start=2)]
+    if ext in (".xlsx", ".xlsm"):
+        _load_openpyxl()
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb["Entries"] if "Entries" in wb.sheetnames else wb.worksheets[0]
+            header, rows = None, []
+            for row_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
+                if header is None:
+                    # Header is the first row naming "ZF Part Number" (row 2 in an Entries sheet)
+                    if "ZF Part Number" in [str(v).strip() if v is not None else "" for v in row]:
+                        header = [str(v).strip() if v is not None else "" for v in row]
+                    continue
+                if any(v not in (None, "") for v in row):
+                    rows.append((row_idx, dict(zip(header, row))))
+            return rows
+        finally:
+            wb.close()
+    raise ValidationError(f"Unsupported import file type '{ext}' (use .csv, .json or .xlsx)")
+
+def import_entries(path):
+    # All valid rows go in with one save; bad rows are reported together and skipped
+    rows = read_entry_rows(path)
+    entries, errors = validate_entries([raw for _, raw in rows], require_zf=True)
+    valid = [entry for entry in entries if entry is not None]
+    flush_journal()  # earlier form submissions land first, so the import wins on conflicts
+    results = save_entries(valid)
+    saved = [dict(result, zf_part=entry["ZF Part Number"], part_no=entry["Part No"])
+             for entry, result in zip(valid, results)]
+    return {
+        "saved": saved,
+        "errors": [{"row": rows[i][0], "messages": messages} for i, messages in sorted(errors.items())],
+    }
+
+def format_import_report(report):
+    updated = sum(1 for r in report["saved"] if r["updated"])
+    lines = [f"Imported {len(report['saved'])} rows ({len(report['saved']) - updated} new, {updated} updated), "
+             f"{len(report['errors'])} rejected"]
+    for bad in report["errors"]:
+        lines.append(f"  row {bad['row']}: " + "; ".join(bad["messages"]))
+    return "\n".join(lines)
+
+# Check if part exists in Entries sheet
+def part_already_exists(zf_part):
+    if any(str(e.get("ZF Part Number", "")).strip() == zf_part for e in pending_journal_entries()):
+        return True
+    if base.DB_PATH:
+        return store_has_part(zf_part)
+    if not os.path.exists(base.EXCEL_TEMPLATE):
+        return False
+    # A current index answers from SQLite; a stale one is not rebuilt here, the Entries stream is cheaper
+    con = _open_part_index(rebuild=False)
+    if con is not None:
+        try:
+            rows = con.execute("SELECT zf_part FROM parts WHERE zf_norm = ?", (_norm(zf_part),)).fetchall()
+        finally:
+            con.close()
+        return any(raw == zf_part for raw, in rows)
+    try:
+        return find_entry_row(zf_part) is not None
+    except Exception as e:
+        raise TemplateError(f"Error checking part existence: {e}")
+
+# All parts in the Entries sheet as dicts keyed by all_fields
+def list_parts():
+    flush_journal()
+    if base.DB_PATH:
+        return [dict(zip(all_fields, values)) for _, values in store_rows()]
+    _require_template()
+    wb = get_workbook(base.EXCEL_TEMPLATE, data_only=True)
+    if "Entries" not in wb.sheetnames:
+        return []
+    ws = wb["Entries"]
+    parts = []
+    for row in ws.iter_rows(min_row=3, max_row=ws.max_row, max_col=len(all_fields), values_only=True):
+        if row and len(row) > 2 and row[2] not in (None, ""):
+            parts.append(dict(zip(all_fields, row)))
+    return parts
@@ -0,0 +1,189 @@
+# Shared-drive saves. Every writer takes <template>.lock (created exclusively, so only one process holds it),
+# waits its turn instead of retrying whole saves, and keeps the critical section short: the workbook is
+# parsed before the lock is taken; under it only Entries is re-read if someone saved meanwhile, their rows
+# are merged in, and the result is written to a temp file that replaces the template in one rename.
+import json
+import os
+import platform
+import threading
+import time
+
+from . import base
+from .base import SaveError, all_fields, log, span
+from .workbook import (_cache_workbook, invalidate_workbook_cache, _record_saved_parts, _row_values, stream_entries,
+                       _template_stamp, _workbook_cache_key, _write_row)
+from .formulas import _record_saved_formulas
+from .entries import _load_entries_workbook, _write_calculation_links
+
+LOCK_TIMEOUT_SECONDS = float(os.environ.get("JARVIS_LOCK_TIMEOUT", "120"))
+LOCK_STALE_SECONDS = float(os.environ.get("JARVIS_LOCK_STALE", "600"))
+_save_lock = threading.Lock()  # threads of this process queue here before touching the lock file
+
+def _lock_path(template_path=None):
+    return (template_path or base.EXCEL_TEMPLATE) + ".lock"
+
+def _lock_owner(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _lock_is_stale(path, owner):
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return False  # already released
+    if age > LOCK_STALE_SECONDS:
+        return True
+    # A lock left by a crashed process on this machine
+    return age > 1 and _process_gone(owner.get("host"), owner.get("pid", 0))
+
+def _process_gone(host, pid):
+    # Only answerable for this machine (os.kill(pid, 0) would kill the process on Windows)
+    if host != platform.node() or platform.system() == "Windows":
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+def _lock_stamp(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _remove_stale_lock(path, owner, stamp):
+    # The stale lock is renamed to a name of our own before it is deleted: of two processes taking over
+    # the same stale lock only one gets it, and a fresh lock that replaced it since we looked (another
+    # process's takeover) is put back instead of deleted
+    claimed = f"{path}.{platform.node()}.{os.getpid()}.{threading.get_ident()}.stale"
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return  # taken over by someone else
+    if _lock_stamp(claimed) == stamp and _lock_owner(claimed) == owner:
+        os.remove(claimed)
+        return
+    try:
+        os.link(claimed, path)
+    except OSError:
+        log("A template lock changed hands while a stale one was removed", "warning", lock=path)
+    os.remove(claimed)
+
+class TemplateLock:
+    def __init__(self, template_path=None, timeout=None):
+        self.path = _lock_path(template_path)
+        self.timeout = LOCK_TIMEOUT_SECONDS if timeout is None else timeout
+        self.owner = None
+
+    def __enter__(self):
+        with span("save.lock", path=self.path):
+            if not _save_lock.acquire(timeout=self.timeout):
+                raise SaveError("Another save in this window is still running, try again.")
+            try:
+                self._acquire_file()
+            except BaseException:
+                _save_lock.release()
+                raise
+        return self
+
+    def _acquire_file(self):
+        deadline = time.time() + self.timeout
+        delay = 0.05
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                owner = _lock_owner(self.path)
+                stamp = _lock_stamp(self.path)
+                if _lock_is_stale(self.path, owner):
+                    log(f"Removing stale template lock left by {owner.get('user') or 'unknown'} "
+                        f"on {owner.get('host') or '?'}", "warning", lock=self.path)
+                    _remove_stale_lock(self.path, owner, stamp)
+                    continue
+                if time.time() > deadline:
+                    who = owner.get("user") or "another user"
+                    raise SaveError(f"The template is being saved by {who} ({owner.get('host') or 'unknown host'}). "
+                                    f"Try again in a moment.")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            self.owner = {"user": os.environ.get("USERNAME") or os.environ.get("USER") or "",
+                          "host": platform.node(), "pid": os.getpid(), "time": time.time()}
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.owner, f)
+            return
+
+    def __exit__(self, *exc):
+        # Only our own lock: after LOCK_STALE_SECONDS another process may have taken it over
+        if _lock_owner(self.path) == self.owner:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        _save_lock.release()
+        return False
+
+def _merge_entries_from_disk(wb):
+    # Someone saved since our parse: take their Entries rows cell by cell (formula cells are left alone),
+    # and give rows they added their Calculation links. Returns the number of rows that changed.
+    ws = wb["Entries"]
+    calc_ws = wb["Calculation"]
+    n_cols = len(all_fields)
+    merged = 0
+    last_row = 2
+    with span("save.merge") as trace:
+        for row_idx, values in stream_entries(1, n_cols):
+            last_row = row_idx
+            current = _row_values(ws, row_idx, n_cols)
+            had_row = any(v not in (None, "") for v in current)
+            changed = [col for col, (old, new) in enumerate(zip(current, values), start=1)
+                       if old != new and not (old in (None, "") and new in (None, ""))
+                       and not (isinstance(old, str) and old.startswith("="))]
+            _write_row(ws, row_idx, changed, [values[col - 1] for col in changed])
+            if changed:
+                merged += 1
+                if not had_row and any(v not in (None, "") for v in values):
+                    _write_calculation_links(calc_ws, row_idx)
+        # Rows past the end of the file on disk were removed there
+        if ws.max_row > last_row:
+            ws.delete_rows(last_row + 1, ws.max_row - last_row)
+        trace.set(rows=merged)
+    return merged
+
+def _locked_save(apply):
+    # apply(wb) -> (result, saved_parts, formulas) runs on an up-to-date workbook while the lock is held
+    exists = os.path.exists(base.EXCEL_TEMPLATE)
+    stamp_parsed = _template_stamp() if exists else None
+    with span("save.load"):
+        wb = _load_entries_workbook()
+    with TemplateLock():
+        stamp_before = _template_stamp() if os.path.exists(base.EXCEL_TEMPLATE) else None
+        if stamp_before != stamp_parsed and stamp_parsed is not None:
+            _merge_entries_from_disk(wb)
+        result, saved_parts, formulas = apply(wb)
+        with span("save.write", path=base.EXCEL_TEMPLATE):
+            _save_template(wb, stamp_before, saved_parts, formulas)
+    return result
+
+def _save_template(wb, stamp_before, saved_parts=(), formulas=None):
+    # Written next to the template and renamed over it, so readers never see a half-written file
+    tmp_path = f"{base.EXCEL_TEMPLATE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, base.EXCEL_TEMPLATE)
+    except PermissionError:
+        raise SaveError(f"Could not replace '{base.EXCEL_TEMPLATE}'. Close it in Excel and try again.")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # The workbook we just wrote is exactly what is on disk now, so keep it for the next export
+    invalidate_workbook_cache(base.EXCEL_TEMPLATE)
+    _cache_workbook(_workbook_cache_key(base.EXCEL_TEMPLATE, False), wb)
+    _record_saved_parts(stamp_before, saved_parts)
+    _record_saved_formulas(stamp_before, formulas or {})
@@ -0,0 +1,262 @@
+# Optional SQLite system of record. With JARVIS_DB=<file> (or --db) the Entries rows live in the database:
+# saves and lookups are single indexed statements, and the template is only filled in ("rendered") when
+# someone needs Excel: an export or the Open Excel button. `jarvis db migrate` copies an Entries sheet in once.
+import os
+import sqlite3
+
+from . import base
+from .base import JarvisError, SaveError, all_fields, log, sheet_schema, span
+from .workbook import _require_template, _row_values, stream_entries, _template_stamp, _write_row
+from .entries import _load_entries_workbook, _write_calculation_links
+from .lock import LOCK_TIMEOUT_SECONDS, _locked_save
+
+def search_parts(text, limit=50, template_path=None):
+    # Case-insensitive substring match on ZF Part Number, Part No and Part Name
+    if base.DB_PATH and template_path is None:
+        return store_search(text, limit)
+    text = text.strip().lower()
+    found = []
+    for row_idx, row in stream_entries(1, 5, template_path):
+        if row[2] in (None, ""):
+            continue
+        if any(text in str(v).lower() for v in row[2:5] if v is not None):
+            found.append(dict(zip(all_fields[:5], row), row=row_idx))
+            if len(found) >= limit:
+                break
+    return found
+
+def _store_path(template_path=None):
+    return base.DB_PATH or os.path.splitext(template_path or base.EXCEL_TEMPLATE)[0] + ".db"
+
+def _field_columns():
+    return ", ".join('"' + field.replace('"', '""') + '"' for field in all_fields)
+
+def _connect_store(path=None):
+    # Field columns have no declared type, so "80%" stays text and 2 stays an integer, as in the sheet
+    con = sqlite3.connect(path or _store_path(), timeout=LOCK_TIMEOUT_SECONDS, isolation_level=None)
+    con.executescript(f"""
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+        CREATE TABLE IF NOT EXISTS entries (
+            entries_row INTEGER PRIMARY KEY, zf_part TEXT NOT NULL, part_no TEXT NOT NULL,
+            version INTEGER NOT NULL, {_field_columns()}
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS entries_by_part ON entries (zf_part, part_no);
+        CREATE INDEX IF NOT EXISTS entries_by_version ON entries (version);
+        CREATE TABLE IF NOT EXISTS results (
+            entries_row INTEGER PRIMARY KEY, version INTEGER NOT NULL, calc_row INTEGER, data TEXT NOT NULL
+        );
+    """)
+    return con
+
+def _store_meta(con):
+    return dict(con.execute("SELECT key, value FROM meta").fetchall())
+
+def _bump_store_version(con):
+    # Every write stamps its rows with a new version; the renderer writes rows newer than its last render
+    version = (_store_meta(con).get("version") or 0) + 1
+    con.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+    return version
+
+def _insert_sql():
+    return f"INSERT OR REPLACE INTO entries VALUES ({', '.join('?' * (len(all_fields) + 4))})"
+
+def store_save_entries(entries):
+    # Same results as save_entries: a part keeps its row, a new part goes below the last row in use
+    con = _connect_store()
+    try:
+        with span("store.save", entries=len(entries)):
+            con.execute("BEGIN IMMEDIATE")
+            version = _bump_store_version(con)
+            last_row = max(con.execute("SELECT MAX(entries_row) FROM entries").fetchone()[0] or 2,
+                           _store_meta(con).get("last_row") or 2)
+            results = []
+            for entry_data in entries:
+                zf_part = str(entry_data.get("ZF Part Number", "")).strip()
+                part_no = str(entry_data.get("Part No", "")).strip()
+                found = con.execute("SELECT entries_row FROM entries WHERE zf_part = ? AND part_no = ?",
+                                    (zf_part, part_no)).fetchone()
+                if found:
+                    target_row = found[0]
+                else:
+                    last_row += 1
+                    target_row = last_row
+                entry_data["Sl.#"] = target_row - 2
+                con.execute(_insert_sql(), (target_row, zf_part, part_no, version,
+                                            *(entry_data.get(field, "") for field in all_fields)))
+                results.append({"sl_no": target_row - 2, "row": target_row, "updated": bool(found)})
+            con.execute("COMMIT")
+    except sqlite3.Error as e:
+        raise SaveError(f"Could not save to {_store_path()}: {e}")
+    finally:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        con.close()
+    return results
+
+def store_has_part(zf_part):
+    con = _connect_store()
+    try:
+        return con.execute("SELECT 1 FROM entries WHERE zf_part = ? LIMIT 1", (zf_part,)).fetchone() is not None
+    finally:
+        con.close()
+
+def store_rows(where="", params=(), limit=-1):
+    # (entries_row, values in all_fields order) ordered by row
+    con = _connect_store()
+    try:
+        return [(row[0], row[1:]) for row in con.execute(
+            f"SELECT entries_row, {_field_columns()} FROM entries {where} ORDER BY entries_row LIMIT ?",
+            (*params, limit))]
+    finally:
+        con.close()
+
+def store_search(text, limit=50):
+    pattern = "%" + text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    like = " ESCAPE '\\'"
+    rows = store_rows(f'WHERE zf_part LIKE ?{like} OR part_no LIKE ?{like} OR "Part Name" LIKE ?{like}',
+                      (pattern, pattern, pattern), limit)
+    return [dict(zip(all_fields[:5], values[:5]), row=row_idx) for row_idx, values in rows]
+
+def _render_rows(wb, rows):
+    # Writes store rows into Entries; rows new to the sheet get their Calculation links like a save would
+    ws = wb["Entries"]
+    calc_ws = wb["Calculation"]
+    schema = sheet_schema()
+    saved, formulas = [], {}
+    for entries_row, values in rows:
+        current = _row_values(ws, entries_row, len(values))
+        had_row = current[2] not in (None, "")
+        changed = [col for col, (old, new) in enumerate(zip(current, values), start=1)
+                   if old != new and not (isinstance(old, str) and old.startswith("="))]
+        _write_row(ws, entries_row, changed, [values[col - 1] for col in changed])
+        calc_row = entries_row + schema["calc_offset"]
+        if not had_row:
+            calc_row = _write_calculation_links(calc_ws, entries_row)
+            formulas.update({("Calculation", calc_row, cell.column): cell.value for cell in calc_ws[calc_row]
+                             if isinstance(cell.value, str) and cell.value.startswith("=")})
+        saved.append({"zf_part": str(values[2]).strip(), "part_no": str(values[3] or "").strip(),
+                      "row": entries_row, "calc_row": calc_row, "sl_no": values[0]})
+    return saved, formulas
+
+def render_template(path=None, full=False):
+    # Fills the template from the store: rows changed since the last render, or every row if the template
+    # was replaced or edited since (or full=True). With a path, a full render is written there instead.
+    con = _connect_store()
+    try:
+        con.execute("BEGIN")
+        meta = _store_meta(con)
+        version = meta.get("version") or 0
+        since = 0
+        if path is None and not full and os.path.exists(base.EXCEL_TEMPLATE) \
+                and meta.get("rendered_stamp") == _template_stamp():
+            since = meta.get("rendered_version") or 0
+        rows = [(row[0], row[1:]) for row in con.execute(
+            f"SELECT entries_row, {_field_columns()} FROM entries WHERE version > ? ORDER BY entries_row", (since,))]
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+    with span("store.render", rows=len(rows), full=since == 0):
+        if path is not None:
+            wb = _load_entries_workbook()
+            _render_rows(wb, rows)
+            wb.save(path)
+            return len(rows)
+        if since == version and os.path.exists(base.EXCEL_TEMPLATE):
+            return 0
+        def apply(wb):
+            saved, formulas = _render_rows(wb, rows)
+            return len(saved), saved, formulas
+        try:
+            rendered = _locked_save(apply)
+        except JarvisError:
+            raise
+        except Exception as e:
+            raise SaveError(str(e))
+
+    con = _connect_store()
+    try:
+        con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                        [("rendered_version", version), ("rendered_stamp", _template_stamp())])
+    finally:
+        con.close()
+    if rendered:
+        log(f"Rendered {rendered} parts from {_store_path()} into {base.EXCEL_TEMPLATE}", rendered=rendered)
+    return rendered
+
+def migrate_to_store(replace=False):
+    # One-time copy of the Entries sheet; the first row of a duplicated (ZF Part Number, Part No) wins
+    _require_template()
+    n_cols = len(all_fields)
+    con = _connect_store()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        existing = con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if existing and not replace:
+            raise SaveError(f"{_store_path()} already holds {existing} parts (use --replace to migrate again)")
+        con.execute("DELETE FROM entries")
+        con.execute("DELETE FROM results")
+        version = _bump_store_version(con)
+        rows, seen, duplicates, last_row = [], set(), [], 2
+        with span("store.migrate") as trace:
+            for row_idx, values in stream_entries(1, n_cols):
+                if any(v not in (None, "") for v in values):
+                    last_row = row_idx
+                if values[2] in (None, ""):
+                    continue
+                key = (str(values[2]).strip(), "" if values[3] is None else str(values[3]).strip())
+                if key in seen:
+                    duplicates.append(row_idx)
+                    continue
+                seen.add(key)
+                rows.append((row_idx, *key, version, *values))
+            con.executemany(_insert_sql(), rows)
+            trace.set(parts=len(rows))
+        # The template already shows these rows, so nothing needs rendering until the next save
+        con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                        [("last_row", last_row), ("rendered_version", version), ("rendered_stamp", _template_stamp())])
+        con.execute("COMMIT")
+    except sqlite3.Error as e:
+        raise SaveError(f"Could not migrate into {_store_path()}: {e}")
+    finally:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        con.close()
+    return {"parts": len(rows), "duplicates": duplicates, "path": _store_path()}
+
+def _same_cell_value(a, b):
+    if a in (None, "") and b in (None, ""):
+        return True
+    numbers = (int, float)
+    if isinstance(a, numbers) and isinstance(b, numbers) and not isinstance(a, bool) and not isinstance(b, bool):
+        return float(a) == float(b)
+    return a == b
+
+def check_store_roundtrip():
+    # Store -> Excel -> store: a full render into a scratch copy must read back exactly as stored,
+    # and the rows the store does not hold must come through untouched. Returns the differences.
+    _require_template()
+    import tempfile
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        render_template(path)
+        stored = dict(store_rows())
+        original = dict(stream_entries(1, len(all_fields)))
+        problems = []
+        seen = set()
+        for row_idx, values in stream_entries(1, len(all_fields), path):
+            seen.add(row_idx)
+            expected = stored.get(row_idx, original.get(row_idx))
+            if expected is None:
+                if any(v not in (None, "") for v in values):
+                    problems.append(f"Entries row {row_idx}: not in the store or the template")
+                continue
+            for field, got, want in zip(all_fields, values, expected):
+                if not _same_cell_value(got, want):
+                    problems.append(f"Entries row {row_idx} '{field}': {want!r} became {got!r}")
+        for row_idx in sorted(set(stored) - seen):
+            problems.append(f"Entries row {row_idx}: stored but missing from the rendered workbook")
+        return problems
+    finally:
+        os.remove(path)
@@ -0,0 +1,348 @@
+# Reading the template: the parsed-workbook cache, the sidecar part index and streaming Entries reads
+from collections import OrderedDict
+import os
+import sqlite3
+import threading
+
+from . import base
+from .base import TemplateError, all_fields, _column_number, log, span
+
+# openpyxl is imported by _load_openpyxl() on first use, so importing this module stays cheap
+load_workbook = None
+
+def _load_openpyxl():
+    global load_workbook
+    if load_workbook is None:
+        from openpyxl import load_workbook
+
+# Parsed-workbook cache shared by every export/lookup path in this process.
+# Keyed by (path, data_only, mtime, size) so an edited file is parsed again; least recently used
+# workbooks are dropped once the estimated memory goes over the budget.
+WORKBOOK_CACHE_BUDGET_MB = float(os.environ.get("JARVIS_WB_CACHE_MB", "512"))
+WORKBOOK_MB_PER_FILE_MB = 40  # rough in-memory size of an openpyxl workbook vs. the zipped .xlsx
+
+_workbook_cache = OrderedDict()
+_workbook_cache_lock = threading.Lock()
+
+def _workbook_cache_key(path, data_only):
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    return (path, bool(data_only), st.st_mtime_ns, st.st_size)
+
+def _cache_workbook(key, wb):
+    size_mb = key[3] / (1024 * 1024) * WORKBOOK_MB_PER_FILE_MB
+    with _workbook_cache_lock:
+        for old_key in [k for k in _workbook_cache if k[:2] == key[:2]]:
+            del _workbook_cache[old_key]
+        _workbook_cache[key] = (wb, size_mb)
+        while len(_workbook_cache) > 1 and sum(mb for _, mb in _workbook_cache.values()) > WORKBOOK_CACHE_BUDGET_MB:
+            _workbook_cache.popitem(last=False)
+
+def get_workbook(path=None, data_only=False):
+    _load_openpyxl()
+    key = _workbook_cache_key(path or base.EXCEL_TEMPLATE, data_only)
+    with _workbook_cache_lock:
+        if key in _workbook_cache:
+            _workbook_cache.move_to_end(key)
+            return _workbook_cache[key][0]
+    with span("workbook.load", path=key[0], data_only=data_only):
+        wb = load_workbook(key[0], data_only=data_only)
+    _cache_workbook(key, wb)
+    return wb
+
+def _workbook_cache_entry(wb):
+    with _workbook_cache_lock:
+        for key, (cached, _) in _workbook_cache.items():
+            if cached is wb:
+                return key
+    return None
+
+def invalidate_workbook_cache(path=None):
+    path = os.path.abspath(path or base.EXCEL_TEMPLATE)
+    with _workbook_cache_lock:
+        for key in [k for k in _workbook_cache if k[0] == path]:
+            del _workbook_cache[key]
+
+# Sidecar part index next to the template (ZF Part Number / Part No -> Entries row, Calculation row, Sl.#)
+# It is stamped with the template's mtime and size and rebuilt whenever the workbook changed behind our back.
+def _norm(value):
+    return str(value).strip().lower() if value is not None else ""
+
+def _index_path(template_path=None):
+    return os.path.splitext(template_path or base.EXCEL_TEMPLATE)[0] + ".index.sqlite"
+
+def _template_stamp(template_path=None):
+    st = os.stat(template_path or base.EXCEL_TEMPLATE)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+def _read_index_stamp(con):
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def build_part_index(template_path=None):
+    _load_openpyxl()
+    template_path = template_path or base.EXCEL_TEMPLATE
+    stamp = _template_stamp(template_path)
+    with span("index.build", path=template_path) as trace:
+        wb = load_workbook(template_path, read_only=True)
+        try:
+            parts = []
+            entries_zf = {}
+            if "Entries" in wb.sheetnames:
+                for row_idx, row in enumerate(wb["Entries"].iter_rows(min_row=3, max_col=4, values_only=True), start=3):
+                    zf_value = row[2] if len(row) > 2 else None
+                    if zf_value in (None, ""):
+                        continue
+                    part_value = row[3] if len(row) > 3 else None
+                    entries_zf[row_idx] = _norm(zf_value)
+                    parts.append((_norm(zf_value), _norm(part_value), row_idx, row[0],
+                                  str(zf_value).strip(), "" if part_value is None else str(part_value).strip()))
+
+            # Calculation column C is either a cached value or the =Entries!C{row} formula written by save_entry
+            calc_rows = {}
+            if "Calculation" in wb.sheetnames:
+                for row_idx, row in enumerate(wb["Calculation"].iter_rows(min_row=6, min_col=3, max_col=3, values_only=True), start=6):
+                    val = row[0] if row else None
+                    if val in (None, ""):
+                        continue
+                    text = str(val).strip()
+                    if text.upper().startswith("=ENTRIES!C") and text[10:].isdigit():
+                        key = entries_zf.get(int(text[10:]))
+                    else:
+                        key = _norm(val)
+                    if key and key not in calc_rows:
+                        calc_rows[key] = row_idx
+        finally:
+            wb.close()
+        trace.set(parts=len(parts))
+
+    path = _index_path(template_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # concurrent exports may rebuild it too
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE parts (
+                zf_norm TEXT NOT NULL, part_no_norm TEXT NOT NULL,
+                entries_row INTEGER, calc_row INTEGER, sl_no, zf_part TEXT, part_no TEXT,
+                PRIMARY KEY (zf_norm, part_no_norm)
+            );
+            CREATE INDEX parts_by_zf ON parts (zf_norm, entries_row);
+        """)
+        # First occurrence wins, the same as the row scans it replaces
+        con.executemany("INSERT OR IGNORE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(zf, pn, row, calc_rows.get(zf), sl, raw_zf, raw_pn) for zf, pn, row, sl, raw_zf, raw_pn in parts])
+        con.execute("INSERT INTO meta VALUES ('stamp', ?)", (stamp,))
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, path)
+    return path
+
+def _open_part_index(template_path=None, rebuild=True):
+    # Connection to an index that matches the template on disk, or None if there is no usable index
+    template_path = template_path or base.EXCEL_TEMPLATE
+    if not os.path.exists(template_path):
+        return None
+    try:
+        stamp = _template_stamp(template_path)
+        path = _index_path(template_path)
+        if os.path.exists(path):
+            con = sqlite3.connect(path)
+            if _read_index_stamp(con) == stamp:
+                return con
+            con.close()
+        if not rebuild:
+            return None
+        build_part_index(template_path)
+        return sqlite3.connect(path)
+    except (sqlite3.Error, OSError) as e:
+        log(f"Part index unavailable, falling back to sheet scan: {e}", "warning")
+        return None
+
+def lookup_part(zf_part, part_no=None, template_path=None):
+    con = _open_part_index(template_path)
+    if con is None:
+        return None
+    try:
+        if part_no is None:
+            row = con.execute("SELECT entries_row, calc_row, sl_no, zf_part, part_no FROM parts "
+                              "WHERE zf_norm = ? ORDER BY entries_row LIMIT 1", (_norm(zf_part),)).fetchone()
+        else:
+            row = con.execute("SELECT entries_row, calc_row, sl_no, zf_part, part_no FROM parts "
+                              "WHERE zf_norm = ? AND part_no_norm = ?", (_norm(zf_part), _norm(part_no))).fetchone()
+    finally:
+        con.close()
+    if not row:
+        return None
+    return dict(zip(("entries_row", "calc_row", "sl_no", "zf_part", "part_no"), row))
+
+# Streaming Entries reads straight from the sheet XML: no other sheet is touched, cells outside
+# the asked columns are skipped without being converted, and the caller can stop at the first match
+_XL_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_shared_strings_cache = {}
+
+def _sheet_part_name(archive, sheet_name):
+    for name, _, part in _package_sheets(archive):
+        if name == sheet_name:
+            return part
+    return None
+
+def _package_sheets(archive):
+    # [(sheet name, relationship id, part name)] in workbook order
+    from xml.etree import ElementTree
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+    sheets = []
+    for sheet in workbook.iter(f"{_XL_NS}sheet"):
+        rel_id = sheet.get(f"{_REL_NS}id")
+        target = targets.get(rel_id)
+        if target is not None:
+            sheets.append((sheet.get("name"), rel_id, target.lstrip("/") if target.startswith("/") else "xl/" + target))
+    return sheets
+
+def _shared_strings(archive, template_path):
+    from xml.etree import ElementTree
+    key = (os.path.abspath(template_path), _template_stamp(template_path))
+    if key not in _shared_strings_cache:
+        strings = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            with archive.open("xl/sharedStrings.xml") as f:
+                for _, elem in ElementTree.iterparse(f):
+                    if elem.tag == f"{_XL_NS}si":
+                        # Plain <t> or rich text runs <r><t>; phonetic hints (rPh) are not part of the value
+                        strings.append(elem.findtext(f"{_XL_NS}t") or
+                                       "".join(r.findtext(f"{_XL_NS}t") or "" for r in elem.findall(f"{_XL_NS}r")))
+                        elem.clear()
+        _shared_strings_cache.clear()
+        _shared_strings_cache[key] = strings
+    return _shared_strings_cache[key]
+
+def _xml_cell_value(cell, archive, template_path):
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(f"{_XL_NS}t")) or None
+    v = cell.find(f"{_XL_NS}v")
+    if v is None or v.text is None:
+        return None
+    if kind == "s":
+        return _shared_strings(archive, template_path)[int(v.text)]
+    if kind in ("str", "e"):
+        return v.text
+    if kind == "b":
+        return v.text == "1"
+    try:
+        return int(v.text)
+    except ValueError:
+        return float(v.text)
+
+def stream_entries(min_col=1, max_col=None, template_path=None):
+    # Yields (row number, values) for Entries rows from row 3 using cached values for formula cells
+    return stream_sheet("Entries", 3, min_col, max_col or len(all_fields), template_path)
+
+def stream_sheet(sheet_name, min_row, min_col, max_col, template_path=None):
+    import zipfile
+    from xml.etree import ElementTree
+    template_path = template_path or base.EXCEL_TEMPLATE
+    with zipfile.ZipFile(template_path) as archive:
+        part = _sheet_part_name(archive, sheet_name)
+        if part is None:
+            return
+        with archive.open(part) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag != f"{_XL_NS}row":
+                    continue
+                row_idx = int(elem.get("r"))
+                if row_idx >= min_row:
+                    values = [None] * (max_col - min_col + 1)
+                    for cell in elem.iter(f"{_XL_NS}c"):
+                        col = _column_number(cell.get("r"))
+                        if min_col <= col <= max_col:
+                            values[col - min_col] = _xml_cell_value(cell, archive, template_path)
+                    yield row_idx, tuple(values)
+                elem.clear()
+
+def find_entry_row(zf_part, part_no=None, template_path=None):
+    # First Entries row with this exact ZF Part Number (and Part No), or None
+    for row_idx, (zf_value, part_value) in stream_entries(3, 4, template_path):
+        if (str(zf_value).strip() if zf_value is not None else "") != zf_part:
+            continue
+        if part_no is None or (str(part_value).strip() if part_value is not None else "") == part_no:
+            return row_idx
+    return None
+
+def _record_saved_parts(stamp_before, saved):
+    # Keep the index current after our own save; if it was already stale it is rebuilt on next lookup
+    path = _index_path()
+    if stamp_before is None or not os.path.exists(path):
+        return
+    try:
+        con = sqlite3.connect(path)
+        try:
+            if _read_index_stamp(con) != stamp_before:
+                return
+            for part in saved:
+                zf_part, calc_row = part["zf_part"], part["calc_row"]
+                existing = con.execute("SELECT MIN(calc_row) FROM parts WHERE zf_norm = ?", (_norm(zf_part),)).fetchone()[0]
+                con.execute("INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (_norm(zf_part), _norm(part["part_no"]), part["row"],
+                             min(existing, calc_row) if existing else calc_row, part["sl_no"], zf_part, part["part_no"]))
+            con.execute("UPDATE meta SET value = ? WHERE key = 'stamp'", (_template_stamp(),))
+            con.commit()
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError) as e:
+        log(f"Could not update part index: {e}", "warning")
+
+def _indexed_rows(wb, zf_part, template_path=None):
+    # Index hit verified against the loaded workbook, so a different or edited workbook falls back to scanning
+    entries_row = calc_row = None
+    hit = lookup_part(zf_part, template_path=template_path)
+    if not hit:
+        return entries_row, calc_row
+    zf_norm = _norm(zf_part)
+    if hit["entries_row"] and "Entries" in wb.sheetnames:
+        if _norm(_cell_value(wb["Entries"], hit["entries_row"], 3)) == zf_norm:
+            entries_row = hit["entries_row"]
+    if hit["calc_row"] and "Calculation" in wb.sheetnames:
+        val = _cell_value(wb["Calculation"], hit["calc_row"], 3)
+        if _norm(val) == zf_norm or (entries_row and _norm(val) == f"=entries!c{entries_row}"):
+            calc_row = hit["calc_row"]
+    return entries_row, calc_row
+
+# Cell reads of a cached worksheet. They never create cells, so one parsed template can serve concurrent
+# exports (see ExportOverlay in export.py).
+def _stored_cells(ws):
+    # The worksheet's {(row, col): Cell} of cells that exist. ws.cell(), ws["A1"] and iter_rows() create every
+    # cell they touch, which would grow the cached template and race between threads exporting from it, and
+    # openpyxl has no public read that doesn't. The dict has had this shape from openpyxl 2.4 through 3.1;
+    # fail loudly instead of misreading the template if a release changes it.
+    cells = getattr(ws, "_cells", None)
+    if not isinstance(cells, dict):
+        import openpyxl
+        raise TemplateError(f"openpyxl {openpyxl.__version__} is not supported: worksheets have no cell dict")
+    return cells
+
+def _cell_value(ws, row, col):
+    cell = _stored_cells(ws).get((row, col))
+    return cell.value if cell is not None else None
+
+def _row_values(ws, row, width):
+    # One row as a tuple (None for empty cells) without creating cells in the sheet
+    cells = _stored_cells(ws)
+    return tuple(cells[(row, col)].value if (row, col) in cells else None for col in range(1, width + 1))
+
+def _write_row(ws, row, columns, values):
+    for col, value in zip(columns, values):
+        ws.cell(row=row, column=col).value = value
+
+def _require_template():
+    if not os.path.exists(base.EXCEL_TEMPLATE):
+        raise TemplateError(f"Excel template not found: {base.EXCEL_TEMPLATE}")
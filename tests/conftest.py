@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+import jarvis  # noqa: E402
+from jarvis_core import base  # noqa: E402
+
+
+@pytest.fixture
+def template_path(tmp_path, monkeypatch):
+    # Where this test's template lives, with jarvis pointed at it; nothing is written there yet
+    path = str(tmp_path / "t.xlsx")
+    monkeypatch.setattr(base, "EXCEL_TEMPLATE", path)
+    monkeypatch.setattr(base, "DB_PATH", None)
+    return path
+
+
+@pytest.fixture
+def template(template_path):
+    # A five-part synthetic template (bench.make_template)
+    bench.make_template(template_path, 5)
+    jarvis.invalidate_workbook_cache(template_path)
+    return template_path
+
+
+@pytest.fixture
+def edit_calculation():
+    # edit_calculation(path, edit): edit(ws) on the Calculation sheet of the file on disk
+    def edit_calculation(path, edit):
+        from openpyxl import load_workbook
+        wb = load_workbook(path)
+        edit(wb["Calculation"])
+        wb.save(path)
+        jarvis.invalidate_workbook_cache(path)
+    return edit_calculation
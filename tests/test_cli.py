@@ -0,0 +1,58 @@
+import jarvis
+from jarvis_core import base, export
+
+
+def test_open_file_does_not_go_through_a_shell(monkeypatch):
+    launched = []
+    monkeypatch.setattr(jarvis.platform, "system", lambda: "Linux")
+    monkeypatch.setattr(jarvis.subprocess, "Popen", launched.append)
+    monkeypatch.setattr(jarvis.os, "system", lambda command: launched.append(command))
+    path = 'exports/ZF"$(touch x)"`id`_Export_WithFormulas.xlsx'
+    jarvis.open_file(path)
+    assert launched == [["xdg-open", path]]
+
+
+def run(template, monkeypatch, capsys, *argv):
+    # main() points the module at --template/--db; monkeypatch puts the originals back afterwards
+    monkeypatch.setattr(base, "EXCEL_TEMPLATE", base.EXCEL_TEMPLATE)
+    monkeypatch.setattr(base, "DB_PATH", base.DB_PATH)
+    monkeypatch.setattr(export, "EXPORT_ENGINE", export.EXPORT_ENGINE)
+    code = jarvis.main(["--template", template, *argv])
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def test_errors_exit_1_on_stderr(template, tmp_path, monkeypatch, capsys):
+    code, out, err = run(str(tmp_path / "missing.xlsx"), monkeypatch, capsys, "export", "ZF0000001")
+    assert (code, out) == (1, "")
+    assert err.startswith("Error: Excel template not found")
+
+    code, out, err = run(template, monkeypatch, capsys, "save", "--set", "ZF Part Number")
+    assert (code, out) == (1, "")
+    assert "Expected FIELD=VALUE" in err
+
+
+def test_export_exit_codes(template, tmp_path, monkeypatch, capsys):
+    out_dir = str(tmp_path / "out")
+    code, out, _ = run(template, monkeypatch, capsys, "export", "ZF0000001", "--output-dir", out_dir)
+    assert code == 0
+    assert out.startswith("ZF0000001\t")
+    code, out, _ = run(template, monkeypatch, capsys, "export", "ZF0000001", "ZF9999999", "--output-dir", out_dir)
+    assert code == 1
+    assert "ZF9999999\tFAILED: " in out
+    code, _, err = run(template, monkeypatch, capsys, "export")
+    assert code == 2
+    assert "No ZF Part Numbers" in err
+
+
+def test_exists_exit_code(template, monkeypatch, capsys):
+    assert run(template, monkeypatch, capsys, "exists", "ZF0000002")[0] == 0
+    assert run(template, monkeypatch, capsys, "exists", "ZF9999999")[0] == 1
+
+
+def test_import_leaves_the_gui_and_openpyxl_unloaded():
+    code = ("import sys, jarvis; "
+            "print(sorted(m for m in ('openpyxl', 'tkinter', 'numpy') if m in sys.modules))")
+    out = jarvis.subprocess.run([jarvis.sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=jarvis.os.path.dirname(jarvis.os.path.abspath(jarvis.__file__)), check=True)
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,118 @@
+import multiprocessing
+
+import pytest
+from openpyxl import load_workbook
+
+import jarvis
+from jarvis_core import costs
+
+
+def test_rollup_matches_the_template_formulas(template):
+    check = jarvis.check_cost_rollup(5)
+    assert check["problems"] == []
+    assert check["parts"] == 5
+    assert check["cells"] == 5 * 8
+
+
+def test_whatif_goes_through_the_formulas(template):
+    jarvis.cost_rollup()
+    rollup = jarvis.cost_rollup({"Scrap cost/Kg (INR)": 12.5})
+    assert rollup["recomputed"] == 5
+    col = jarvis.all_fields.index("Scrap cost/Kg (INR)") + 1
+    ev = jarvis.FormulaEvaluator(load_workbook(template), {("Entries", row, col): 12.5 for row in rollup["rows"]})
+    for i, row in enumerate(rollup["rows"]):
+        assert rollup["blocks"]["Raw material cost"][i] == pytest.approx(ev.value("Calculation", row + 3, 35))
+        assert rollup["total"][i] == pytest.approx(ev.value("Calculation", row + 3, 66))
+
+
+def test_row_with_its_own_formulas_is_priced_with_them(template, edit_calculation):
+    edit_calculation(template, lambda ws: setattr(ws["BL8"], "value", "=ROUND(BJ8*0.2,2)"))
+    model = jarvis.cost_model()
+    assert len(model["shapes"]) == 2
+    assert jarvis.check_cost_rollup(5)["problems"] == []
+
+
+def test_template_without_cost_formulas_is_refused(template, edit_calculation):
+    def values_only(ws):
+        for row in range(6, ws.max_row + 1):
+            ws.cell(row, 66).value = 100
+    edit_calculation(template, values_only)
+    with pytest.raises(jarvis.CostModelError, match="BN"):
+        jarvis.cost_rollup()
+
+
+def test_formula_pieces_follow_the_row():
+    pieces = costs._formula_pieces("=ROUND(BJ6*0.1,2)+$A$1+Tooling!A:A+SUM(AC6:AF6)+B$6", 6)
+    assert costs._render_pieces(pieces, 9) == "=ROUND(BJ9*0.1,2)+$A$1+Tooling!A:A+SUM(AC9:AF9)+B$6"
+
+
+def test_validation_gates_on_the_template(template, edit_calculation):
+    assert jarvis.validate_cost_model() is None
+    edit_calculation(template, lambda ws: [ws.cell(row, 66, 100) for row in range(6, ws.max_row + 1)])
+    assert "BN" in jarvis.validate_cost_model()
+
+
+def hand_built_template(path, captions):
+    # Not bench's layout: the cost columns sit at D:K under a banner, and BN holds a decoy number
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    field = lambda name: get_column_letter(jarvis.all_fields.index(name) + 1)
+    wb = Workbook()
+    entries = wb.active
+    entries.title = "Entries"
+    entries.append(["Part entries"])
+    entries.append(jarvis.all_fields)
+    for i, (weight, qty, price) in enumerate([(0.5, 2, 3.0), (1.25, 0, 9.0)], start=1):
+        row = {"Sl.#": i, "ZF Part Number": f"ZF{i}", "Finish wt.( Kgs)": weight, "Qty (Nos)": qty,
+               "Cost /part (INR)": price}
+        entries.append([row.get(name) for name in jarvis.all_fields])
+    calc = wb.create_sheet("Calculation")
+    calc["D3"] = "Cost sheet"
+    calc.merge_cells("D3:K3")
+    for col, caption in zip("DEFGHIJK", captions):
+        calc[f"{col}4"] = caption
+    for r in (6, 7):
+        e = r - 3
+        calc[f"A{r}"], calc[f"C{r}"] = f"=Entries!A{e}", f"=Entries!C{e}"
+        calc[f"D{r}"] = f"=ROUND(Entries!{field('Finish wt.( Kgs)')}{e}*120,2)"
+        calc[f"E{r}"] = f"=Entries!{field('Qty (Nos)')}{e}*Entries!{field('Cost /part (INR)')}{e}"
+        calc[f"F{r}"], calc[f"G{r}"], calc[f"H{r}"] = "=2.5", "=1.5", "=0.5"
+        calc[f"I{r}"] = f"=SUM(D{r}:H{r})"
+        calc[f"J{r}"] = f"=ROUND(I{r}*0.1,2)"
+        calc[f"K{r}"] = f"=I{r}+J{r}"
+        calc[f"BN{r}"] = 999
+    wb.save(path)
+    return path
+
+
+CAPTIONS = ["Raw material cost", "BOP parts cost", "Machine cost", "labor  cost", "Setting-up cost",
+            "Part cost", "Overheads", "Total Cost"]
+
+
+def test_cost_columns_come_from_the_template_headers(template_path):
+    hand_built_template(template_path, CAPTIONS)
+    model = jarvis.cost_model()
+    assert [letter for _, _, letter in model["blocks"] + model["totals"]] == list("DEFGHIJK")
+    rollup = jarvis.cost_rollup()
+    assert list(rollup["blocks"]["Raw material cost"]) == [60.0, 150.0]
+    assert list(rollup["blocks"]["BOP parts cost"]) == [6.0, 0.0]
+    assert list(rollup["total"]) == pytest.approx([77.55, 169.95])
+    assert jarvis.check_cost_rollup(2)["problems"] == []
+
+
+def test_missing_caption_is_named(template_path):
+    hand_built_template(template_path, CAPTIONS[:-1] + ["Grand total"])
+    with pytest.raises(jarvis.CostModelError, match="'Total cost'"):
+        jarvis.cost_model()
+
+
+def test_spawned_workers_rank_like_one_process(template, monkeypatch):
+    entry = jarvis.part_entry("ZF0000002")
+    started = []
+    real_context = multiprocessing.get_context
+    monkeypatch.setattr(multiprocessing, "get_context", lambda method=None: started.append(method) or real_context(method))
+    alone = jarvis.optimize_design(entry, top=5, workers=1)
+    pooled = jarvis.optimize_design(entry, top=5, workers=2)
+    assert pooled["evaluated"] >= 1000
+    assert started == ["spawn"]
+    assert pooled == alone
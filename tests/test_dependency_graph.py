@@ -0,0 +1,42 @@
+import os
+
+from openpyxl import Workbook
+
+import jarvis
+from jarvis_core import formulas
+
+
+def make_template(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Entries"
+    ws["A3"] = 1
+    calc = wb.create_sheet("Calculation")
+    calc["A6"] = "=Entries!A3"
+    calc["B6"] = "=A6*2"
+    calc["C6"] = "=SUM(Entries!A:A)+VLOOKUP(A6,'Master Data'!$A$2:$C$31,2,0)"
+    wb.create_sheet("Master Data")
+    wb.save(path)
+    return str(path)
+
+
+def test_graph_round_trips_through_json(tmp_path):
+    template = make_template(tmp_path / "t.xlsx")
+    built = jarvis.build_dependency_graph(template)
+    assert os.path.exists(formulas._depgraph_path(template))
+    formulas._dependency_graphs.clear()
+    loaded = jarvis.get_dependency_graph(template)
+    assert loaded is not built
+    for key in ("stamp", "precedents", "dependents", "range_dependents"):
+        assert loaded[key] == built[key]
+    assert jarvis.dirty_cells(loaded, [("Entries", 3, 1)]) == {
+        ("Entries", 3, 1), ("Calculation", 6, 1), ("Calculation", 6, 2), ("Calculation", 6, 3)}
+
+
+def test_unreadable_sidecar_is_rebuilt(tmp_path):
+    template = make_template(tmp_path / "t.xlsx")
+    with open(formulas._depgraph_path(template), "w", encoding="utf-8") as f:
+        f.write('{"stamp": ')
+    formulas._dependency_graphs.clear()
+    graph = jarvis.get_dependency_graph(template)
+    assert ("Calculation", 6, 2) in graph["precedents"]
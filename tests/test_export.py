@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+from openpyxl.workbook.defined_name import DefinedName
+
+import jarvis
+from jarvis_core import base, export, workbook
+
+PART = "ZF0000003"
+
+
+@pytest.fixture
+def template(template):
+    # conftest's template with merges, defined names and a sheet the export drops
+    wb = load_workbook(template)
+    wb["Calculation"].merge_cells("A3:B3")
+    wb["Tooling"].merge_cells("A8:B8")
+    wb["Entries"].cell(4, 40, "past the exported columns")
+    wb.defined_names["Rates"] = DefinedName("Rates", attr_text="'Master Data'!$B$2:$B$20")
+    wb["Calculation"].defined_names["PartCost"] = DefinedName("PartCost", attr_text="Calculation!$BN$6")
+    notes = wb.create_sheet("Notes")
+    notes["A1"] = "Quote notes"
+    wb.defined_names["NoteList"] = DefinedName("NoteList", attr_text="Notes!$A$1:$A$3")
+    notes.defined_names["Author"] = DefinedName("Author", attr_text="Notes!$B$1")
+    wb.save(template)
+    jarvis.invalidate_workbook_cache(template)
+    return template
+
+
+def export_both(tmp_path, mode, prune):
+    copy_dir, xml_dir = tmp_path / "copy", tmp_path / "xml"
+    copy_dir.mkdir()
+    xml_dir.mkdir()
+    copied = jarvis.export_logic(jarvis.get_workbook(base.EXCEL_TEMPLATE), PART, mode, str(copy_dir), prune=prune)
+    streamed = jarvis.export_xml(PART, mode, str(xml_dir), prune=prune)
+    return load_workbook(copied), load_workbook(streamed)
+
+
+def defined_names(wb):
+    names = {name: item.attr_text for name, item in wb.defined_names.items()}
+    for ws in wb.worksheets:
+        names.update({(ws.title, name): item.attr_text for name, item in ws.defined_names.items()})
+    return names
+
+
+def cell_values(ws):
+    return {(cell.row, cell.column): cell.value for row in ws.iter_rows() for cell in row if cell.value is not None}
+
+
+@pytest.mark.parametrize("mode", ["with", "without"])
+@pytest.mark.parametrize("prune", [False, True])
+def test_xml_engine_matches_the_copy_engine(template, tmp_path, mode, prune):
+    copied, streamed = export_both(tmp_path, mode, prune)
+    assert streamed.sheetnames == copied.sheetnames == [
+        "Calculation", "Tooling", "Summary", "Master Data", "Entries", "Import"]
+    assert [ws.sheet_state for ws in streamed] == [ws.sheet_state for ws in copied]
+    assert defined_names(streamed) == defined_names(copied)
+    assert set(defined_names(streamed)) == {"Rates", ("Calculation", "PartCost")}
+    for ws in copied:
+        assert set(map(str, streamed[ws.title].merged_cells.ranges)) == set(map(str, ws.merged_cells.ranges))
+        assert cell_values(streamed[ws.title]) == cell_values(ws), ws.title
+    assert "A3:B3" in map(str, streamed["Calculation"].merged_cells.ranges)
+    assert "A8:B8" in map(str, streamed["Tooling"].merged_cells.ranges)
+
+
+@pytest.mark.parametrize("engine", [0, 1])
+def test_with_formulas_part_row_follows_row_6(template, tmp_path, engine):
+    exported = export_both(tmp_path, "with", False)[engine]
+    calc = exported["Calculation"]
+    assert calc["C6"].value == "=Entries!C5"
+    assert calc["AE6"].value == "=AC6*1.05"
+    assert calc["AQ6"].value == '=IFNA(VLOOKUP(A6,Tooling!A:AO,30,0),"")'
+    assert exported["Tooling"]["AB6"].value == "=Calculation!AP6"
+    assert exported["Tooling"]["AC6"].value == "=Calculation!AS6"
+
+
+def test_xml_engine_scans_the_sheets_without_an_index(template, tmp_path, monkeypatch):
+    def unwritable(template_path=None):
+        raise sqlite3.OperationalError("unable to open database file")
+    monkeypatch.setattr(workbook, "build_part_index", unwritable)
+    assert jarvis.lookup_part(PART) is None
+    (tmp_path / "copy").mkdir()
+    (tmp_path / "xml").mkdir()
+    copied = load_workbook(jarvis.export_logic(jarvis.get_workbook(template), PART, "with", str(tmp_path / "copy")))
+    streamed = load_workbook(jarvis.export_xml(PART, "with", str(tmp_path / "xml")))
+    for ws in copied:
+        assert cell_values(streamed[ws.title]) == cell_values(ws), ws.title
+    with pytest.raises(jarvis.PartNotFoundError):
+        jarvis.export_xml("ZF9999999", "with", str(tmp_path))
+
+
+def test_namespace_prefixes_survive(template, tmp_path):
+    # Excel's sheets declare prefixes only named in mc:Ignorable; renaming them makes the file unreadable
+    with zipfile.ZipFile(template) as source:
+        parts = {info.filename: source.read(info.filename) for info in source.infolist()}
+        part = {name: part for name, _, part in workbook._package_sheets(source)}["Summary"]
+    xml = parts[part].decode("utf-8")
+    root = xml.index("<worksheet")
+    xml = (xml[:root] + xml[root:].replace(">", ' xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+           ' xmlns:x14ac="http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac" mc:Ignorable="x14ac">', 1))
+    parts[part] = xml.replace('<row r="3"', '<row r="3" x14ac:dyDescent="0.25"').encode("utf-8")
+    os.remove(template)
+    with zipfile.ZipFile(template, "w") as target:
+        for name, data in parts.items():
+            target.writestr(name, data)
+    jarvis.invalidate_workbook_cache(template)
+
+    with zipfile.ZipFile(jarvis.export_xml(PART, "with", str(tmp_path))) as exported:
+        xml = exported.read(part).decode("utf-8")
+    assert 'xmlns:x14ac="http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac"' in xml
+    assert 'mc:Ignorable="x14ac"' in xml
+    assert 'x14ac:dyDescent="0.25"' in xml
+    assert "ns0:" not in xml and "ns1:" not in xml
+
+
+def test_missing_sheet_is_a_warning_not_output(template, tmp_path, capsys):
+    wb = load_workbook(template)
+    del wb["Summary"]
+    wb.save(template)
+    jarvis.invalidate_workbook_cache(template)
+    path = jarvis.export_logic(jarvis.get_workbook(template), PART, "with", str(tmp_path))
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert "Summary" in err
+    assert "Summary" not in load_workbook(path).sheetnames
+
+
+def test_summary_failure_is_an_export_error(template, tmp_path, monkeypatch):
+    def broken(values):
+        raise ValueError("bad mapping")
+    monkeypatch.setattr(export, "_summary_changes", broken)
+    with pytest.raises(jarvis.ExportError, match="bad mapping"):
+        jarvis.export_logic(jarvis.get_workbook(template), PART, "with", str(tmp_path))
+
+
+def test_batch_exports_a_repeated_part_once(template, tmp_path):
+    results = jarvis.export_batch([PART, " ZF0000001", PART + " ", "ZF0000001"], "with", str(tmp_path / "out"))
+    assert [(r["zf_part"], r["ok"]) for r in results] == [(PART, True), ("ZF0000001", True)]
+
+
+@pytest.mark.parametrize("engine", ["copy", "xml"])
+def test_chunk_takes_the_template_without_touching_globals(template, tmp_path, monkeypatch, engine):
+    other = str(tmp_path / "other.xlsx")
+    with open(template, "rb") as src, open(other, "wb") as dst:
+        dst.write(src.read())
+    missing = str(tmp_path / "missing.xlsx")
+    monkeypatch.setattr(base, "EXCEL_TEMPLATE", missing)
+    monkeypatch.setattr(export, "EXPORT_ENGINE", "copy" if engine == "xml" else "xml")
+    for mode in ("with", "without"):
+        results = export._export_chunk([PART], mode, str(tmp_path), other, engine)
+        assert results[0]["ok"], results
+    assert base.EXCEL_TEMPLATE == missing
+    assert export.EXPORT_ENGINE != engine
+
+
+@pytest.mark.parametrize("mode", ["with", "without"])
+def test_export_creates_no_cells_in_the_cached_template(template, tmp_path, mode):
+    wb = jarvis.get_workbook(template)
+    before = {ws.title: set(workbook._stored_cells(ws)) for ws in wb}
+    jarvis.export_logic(wb, PART, mode, str(tmp_path))
+    assert {ws.title: set(workbook._stored_cells(ws)) for ws in wb} == before
+
+
+def test_unsupported_worksheet_layout_is_a_template_error():
+    with pytest.raises(jarvis.TemplateError, match="openpyxl"):
+        workbook._cell_value(object(), 1, 1)
+
+
+def row_values(ws, row):
+    return [cell.value for cell in ws[row]]
+
+
+def test_portfolio_keeps_the_tool_breakdown_and_every_part_row(template, tmp_path):
+    # Four parts: from the third on, Tooling rows 6+i used to land on the breakdown block (rows 8-48)
+    parts = ["ZF0000001", "ZF0000002", PART, "ZF0000004"]
+    portfolio = load_workbook(jarvis.export_portfolio(parts, "without", str(tmp_path / "p")))
+    tooling_rows = export._portfolio_tooling_rows(len(parts))
+    assert tooling_rows == [6, 50, 51, 52]
+    for i, zf_part in enumerate(parts):
+        single = load_workbook(jarvis.export_logic(jarvis.get_workbook(template), zf_part, "without",
+                                                   str(tmp_path)))
+        assert row_values(portfolio["Calculation"], 6 + i) == row_values(single["Calculation"], 6), zf_part
+        assert row_values(portfolio["Summary"], 6 + i) == row_values(single["Summary"], 6), zf_part
+        assert row_values(portfolio["Tooling"], tooling_rows[i]) == row_values(single["Tooling"], 6), zf_part
+        if i == 0:
+            for row in range(8, 49):
+                assert row_values(portfolio["Tooling"], row) == row_values(single["Tooling"], row), row
+    assert "A8:B8" in map(str, portfolio["Tooling"].merged_cells.ranges)
+
+
+def test_portfolio_with_formulas_links_each_tooling_row_to_its_part(template, tmp_path):
+    parts = ["ZF0000001", "ZF0000002", PART]
+    tooling = load_workbook(jarvis.export_portfolio(parts, "with", str(tmp_path)))["Tooling"]
+    assert [tooling.cell(row, 3).value for row in (6, 50, 51)] == parts
+    assert tooling["AB51"].value == "=Calculation!AP8"
+    assert tooling["AD51"].value == "=ROUND(AB51*1.15,0)"
+    assert tooling["C8"].value == "=ROUND($AB$6*B8,0)"
@@ -0,0 +1,131 @@
+import pytest
+from openpyxl import Workbook
+
+import jarvis
+from jarvis_core.formulas import DIV0_ERROR, NA_ERROR, REF_ERROR, VALUE_ERROR, FormulaError, FormulaEvaluator
+
+
+@pytest.fixture
+def wb():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Calc"
+    md = wb.create_sheet("Master Data")
+    # Rate table sorted ascending on A, a descending column in E
+    for row, (name, rate, limit) in enumerate([("ABS", 120, 900), ("PA66", 180, 600), ("PP", 90, 300)], start=2):
+        md.cell(row, 1, name)
+        md.cell(row, 2, rate)
+        md.cell(row, 5, limit)
+    md.cell(1, 1, "Material")
+    md.cell(2, 4, 10)
+    md.cell(3, 4, 20)
+    md.cell(4, 4, 30)
+    return wb
+
+
+def evaluate(wb, formula, sheet="Calc"):
+    wb[sheet]["Z1"] = formula
+    return FormulaEvaluator(wb).value(sheet, 1, 26)
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=1+2*3", 7),
+    ("=(1+2)*3", 9),
+    ("=-2^2", 4),
+    ("=2^3^2", 64),
+    ("=10/4", 2.5),
+    ("=50%", 0.5),
+    ("=ROUND(2.5,0)", 3),
+    ("=ROUND(-2.5,0)", -3),
+    ("=ROUNDUP(1.21,1)", 1.3),
+    ("=ROUNDDOWN(-1.29,1)", -1.2),
+    ("=SUM('Master Data'!B2:B4)", 390),
+    ("=MAX('Master Data'!B:B)", 180),
+    ("=AVERAGE('Master Data'!D2:D4)", 20),
+])
+def test_operators_and_functions(wb, formula, expected):
+    assert evaluate(wb, formula) == pytest.approx(expected)
+
+
+def test_text_and_logic(wb):
+    assert evaluate(wb, "=\"a\"&1&TRUE") == "a1TRUE"
+    assert evaluate(wb, "=\"A\"=\"a\"") is True
+    assert evaluate(wb, "=1<\"1\"") is True  # numbers sort before text
+    assert evaluate(wb, "=IF(AND(1,OR(0,\"TRUE\")),\"yes\",\"no\")") == "yes"
+
+
+def test_errors_propagate(wb):
+    assert evaluate(wb, "=1/0") == DIV0_ERROR
+    assert evaluate(wb, "=1+\"x\"") == VALUE_ERROR
+    assert evaluate(wb, "=IFERROR(1/0,7)") == 7
+    assert evaluate(wb, "=SUM(1/0,2)") == DIV0_ERROR
+
+
+def test_references_and_blanks(wb):
+    wb["Calc"]["A1"] = 4
+    wb["Calc"]["A2"] = "=A1*2"
+    wb["Calc"]["A3"] = "=A2+'Master Data'!B3"
+    ev = FormulaEvaluator(wb)
+    assert ev.value("Calc", 3, 1) == 188
+    # A formula pointing at a blank cell shows 0
+    wb["Calc"]["A4"] = "=B9"
+    assert FormulaEvaluator(wb).value("Calc", 4, 1) == 0
+
+
+def test_vlookup(wb):
+    table = "'Master Data'!$A$2:$B$4"
+    assert evaluate(wb, f"=VLOOKUP(\"pa66\",{table},2,0)") == 180
+    assert evaluate(wb, f"=VLOOKUP(\"PC\",{table},2,0)") == NA_ERROR
+    assert evaluate(wb, f"=VLOOKUP(\"PC\",{table},2,TRUE)") == 180
+    assert evaluate(wb, f"=VLOOKUP(\"ABS\",{table},3,0)") == REF_ERROR
+    assert evaluate(wb, "=VLOOKUP(\"PP\",'Master Data'!A:B,2,0)") == 90
+
+
+def test_match(wb):
+    ascending, descending = "'Master Data'!$D$2:$D$4", "'Master Data'!$E$2:$E$4"
+    assert evaluate(wb, f"=MATCH(20,{ascending},0)") == 2
+    assert evaluate(wb, f"=MATCH(25,{ascending},0)") == NA_ERROR
+    assert evaluate(wb, f"=MATCH(25,{ascending},1)") == 2
+    assert evaluate(wb, f"=MATCH(25,{ascending})") == 2
+    assert evaluate(wb, f"=MATCH(5,{ascending},1)") == NA_ERROR
+    # -1: smallest value >= lookup in descending data
+    assert evaluate(wb, f"=MATCH(500,{descending},-1)") == 2
+    assert evaluate(wb, f"=MATCH(600,{descending},-1)") == 2
+    assert evaluate(wb, f"=MATCH(1000,{descending},-1)") == NA_ERROR
+    assert evaluate(wb, f"=MATCH(100,{descending},-1)") == 3
+    assert evaluate(wb, "=MATCH(1,5,0)") == VALUE_ERROR
+
+
+def test_ifna_index_match(wb):
+    area = "'Master Data'!$B$2:$B$4"
+    keys = "'Master Data'!$A$2:$A$4"
+    assert evaluate(wb, f"=IFNA(INDEX({area},MATCH(\"PP\",{keys},0)),\"\")") == 90
+    assert evaluate(wb, f"=IFNA(INDEX({area},MATCH(\"PC\",{keys},0)),\"\")") == ""
+    # IFNA only catches #N/A
+    assert evaluate(wb, "=IFNA(1/0,\"\")") == DIV0_ERROR
+    assert evaluate(wb, f"=INDEX({area},4)") == REF_ERROR
+
+
+def test_overrides_and_recalculate(wb):
+    wb["Calc"]["A1"] = 4
+    wb["Calc"]["A2"] = "=A1*2"
+    ev = FormulaEvaluator(wb, overrides={("Calc", 1, 1): 5})
+    assert ev.value("Calc", 2, 1) == 10
+    ev.set_value("Calc", 1, 1, 6)
+    assert ev.value("Calc", 2, 1) == 12
+    assert wb["Calc"]["A1"].value == 4
+
+
+def test_unsupported_formulas_raise(wb):
+    with pytest.raises(FormulaError):
+        evaluate(wb, "=OFFSET(A1,1,1)")
+    wb["Calc"]["A1"] = "=A2"
+    wb["Calc"]["A2"] = "=A1"
+    with pytest.raises(FormulaError):
+        FormulaEvaluator(wb).value("Calc", 1, 1)
+
+
+def test_compiled_formulas_are_shared():
+    first = jarvis.compile_formula("=A1+1", "Calc")
+    assert jarvis.compile_formula("=A1+1", "Calc") is first
+    assert jarvis.compile_formula("=A1+1", "Other") is not first
@@ -0,0 +1,58 @@
+import os
+
+from openpyxl import load_workbook
+
+import jarvis
+from jarvis_core import workbook
+
+
+def count_builds(monkeypatch):
+    builds = []
+    real = jarvis.build_part_index
+
+    def build(template_path=None):
+        builds.append(template_path)
+        return real(template_path)
+    monkeypatch.setattr(workbook, "build_part_index", build)
+    return builds
+
+
+def test_lookup_builds_the_index_once(template, monkeypatch):
+    builds = count_builds(monkeypatch)
+    assert jarvis.lookup_part("zf0000003 ") == {"entries_row": 5, "calc_row": 8, "sl_no": 3,
+                                                "zf_part": "ZF0000003", "part_no": "P0000003"}
+    assert jarvis.lookup_part("ZF0000003", "P0000003")["entries_row"] == 5
+    assert jarvis.lookup_part("ZF0000003", "P-OTHER") is None
+    assert jarvis.lookup_part("ZF9999999") is None
+    assert len(builds) == 1
+    assert os.path.exists(workbook._index_path(template))
+
+
+def test_stale_index_is_rebuilt(template, monkeypatch):
+    assert jarvis.lookup_part("ZF0000003")["entries_row"] == 5
+    # Someone else's save moves the part: the index is stamped with the old mtime and size
+    wb = load_workbook(template)
+    wb["Entries"].delete_rows(4)
+    wb.save(template)
+    builds = count_builds(monkeypatch)
+    assert jarvis.lookup_part("ZF0000003")["entries_row"] == 4
+    assert jarvis.lookup_part("ZF0000002") is None
+    assert len(builds) == 1
+
+
+def test_unreadable_index_is_rebuilt(template):
+    jarvis.lookup_part("ZF0000001")
+    with open(workbook._index_path(template), "wb") as f:
+        f.write(b"not a database")
+    assert jarvis.lookup_part("ZF0000001")["entries_row"] == 3
+
+
+def test_own_save_updates_the_index_in_place(template, monkeypatch):
+    jarvis.lookup_part("ZF0000001")
+    builds = count_builds(monkeypatch)
+    entry = {field: "" for field in jarvis.all_fields}
+    entry.update({"ZF Part Number": "ZFNEW", "Part No": "PNEW"})
+    jarvis.save_entry(entry)
+    assert jarvis.lookup_part("ZFNEW")["entries_row"] == 8
+    assert jarvis.lookup_part("ZF0000005")["entries_row"] == 7
+    assert builds == []
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import jarvis
+from jarvis_core import journal, lock
+
+
+def test_submit_is_not_blocked_by_a_running_flush(template_path, monkeypatch):
+    saving, release, saved = threading.Event(), threading.Event(), []
+
+    def slow_save(entries):
+        saving.set()
+        assert release.wait(10)
+        saved.extend(entries)
+        return [{"sl_no": i, "row": i + 2, "updated": False} for i, _ in enumerate(entries, start=1)]
+
+    monkeypatch.setattr(journal, "save_entries", slow_save)
+    jarvis.journal_entry({"ZF Part Number": "ZF1"})
+    flush = threading.Thread(target=jarvis.flush_journal)
+    flush.start()
+    try:
+        assert saving.wait(10)
+        # Both would wait for the whole save if the flush held the journal lock through it
+        done, pending = threading.Event(), []
+
+        def submit_and_check():
+            jarvis.journal_entry({"ZF Part Number": "ZF2"})
+            pending.extend(e["ZF Part Number"] for e in jarvis.pending_journal_entries())
+            done.set()
+
+        threading.Thread(target=submit_and_check).start()
+        assert done.wait(2)
+        assert sorted(pending) == ["ZF1", "ZF2"]
+    finally:
+        release.set()
+        flush.join(10)
+    assert [e["ZF Part Number"] for e in saved] == ["ZF1"]
+    # The entry queued during the flush is left for the next one
+    assert [e["ZF Part Number"] for e in jarvis.pending_journal_entries()] == ["ZF2"]
+    assert len(jarvis.flush_journal()) == 1
+    assert jarvis.pending_journal_entries() == []
+
+
+def test_failed_flush_keeps_the_entries(template_path, monkeypatch):
+    def failing_save(entries):
+        raise jarvis.SaveError("template is read-only")
+
+    monkeypatch.setattr(journal, "save_entries", failing_save)
+    jarvis.journal_entry({"ZF Part Number": "ZF1"})
+    with pytest.raises(jarvis.SaveError):
+        jarvis.flush_journal()
+    assert [e["ZF Part Number"] for e in jarvis.pending_journal_entries()] == ["ZF1"]
+
+
+def claimed_elsewhere(template_path, entry, claimed_at):
+    path = f"{journal._journal_path()}.other-host-4242-{int(claimed_at * 1e9)}.flushing"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"queued_at": claimed_at, "entry": entry}) + "\n")
+    return path
+
+
+def test_flush_leaves_journals_another_flush_is_saving(template_path, monkeypatch):
+    saved = []
+    monkeypatch.setattr(journal, "save_entries", lambda entries: saved.extend(entries) or entries)
+    busy = claimed_elsewhere(template_path, {"ZF Part Number": "ZF-BUSY"}, time.time())
+    dead = claimed_elsewhere(template_path, {"ZF Part Number": "ZF-DEAD"}, time.time() - lock.LOCK_STALE_SECONDS - 5)
+    jarvis.journal_entry({"ZF Part Number": "ZF1"})
+    jarvis.flush_journal()
+    assert sorted(e["ZF Part Number"] for e in saved) == ["ZF-DEAD", "ZF1"]
+    assert os.path.exists(busy) and not os.path.exists(dead)
+
+
+def test_failed_flush_is_retried_by_the_same_process(template_path, monkeypatch):
+    def failing_save(entries):
+        raise jarvis.SaveError("template is read-only")
+
+    monkeypatch.setattr(journal, "save_entries", failing_save)
+    jarvis.journal_entry({"ZF Part Number": "ZF1"})
+    with pytest.raises(jarvis.SaveError):
+        jarvis.flush_journal()
+    saved = []
+    monkeypatch.setattr(journal, "save_entries", lambda entries: saved.extend(entries) or entries)
+    jarvis.flush_journal()
+    assert [e["ZF Part Number"] for e in saved] == ["ZF1"]
+    assert jarvis.pending_journal_entries() == []
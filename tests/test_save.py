@@ -0,0 +1,108 @@
+import json
+import os
+import time
+
+import pytest
+from openpyxl import load_workbook
+
+import jarvis
+from jarvis_core import entries, lock
+
+
+def edit_on_disk(path, edit):
+    wb = load_workbook(path)
+    edit(wb["Entries"])
+    wb.save(path)
+
+
+def test_merge_takes_rows_saved_by_someone_else(template):
+    wb = entries._load_entries_workbook()
+    edit_on_disk(template, lambda ws: [ws.cell(8, 1, 6), ws.cell(8, 3, "ZF-OTHER"), ws.cell(4, 4, "P-EDITED")])
+    assert lock._merge_entries_from_disk(wb) == 2
+    ws = wb["Entries"]
+    assert ws.max_row == 8
+    assert ws.cell(4, 4).value == "P-EDITED"
+    assert ws.cell(8, 3).value == "ZF-OTHER"
+    # The new row got its Calculation links
+    assert wb["Calculation"].cell(11, 3).value == "=Entries!C8"
+
+
+def test_merge_drops_rows_removed_on_disk(template):
+    wb = entries._load_entries_workbook()
+    edit_on_disk(template, lambda ws: ws.delete_rows(6, 2))
+    lock._merge_entries_from_disk(wb)
+    ws = wb["Entries"]
+    assert ws.max_row == 5
+    assert [ws.cell(r, 3).value for r in range(3, 6)] == ["ZF0000001", "ZF0000002", "ZF0000003"]
+
+
+def test_save_entries_writes_and_updates_rows(template):
+    entry = {field: "" for field in jarvis.all_fields}
+    entry.update({"ZF Part Number": "ZFNEW", "Part No": "PNEW", "Rawmaterial": "PP", "L(mm)": 10.0})
+    first = jarvis.save_entry(dict(entry))
+    assert first == {"sl_no": 6, "row": 8, "updated": False}
+    again = jarvis.save_entry(dict(entry, **{"L(mm)": 12.0}))
+    assert again == {"sl_no": 6, "row": 8, "updated": True}
+    wb = load_workbook(template)
+    assert wb["Entries"].cell(8, jarvis.all_fields.index("L(mm)") + 1).value == 12
+    assert wb["Calculation"].cell(11, 1).value == "=Entries!A8"
+    assert not os.path.exists(template + ".lock")
+
+
+def test_migrate_rewrites_old_tool_lookups(template):
+    assert jarvis.migrate_formulas() == [6, 7, 8, 9, 10]
+    calc = load_workbook(template)["Calculation"]
+    assert calc["CM6"].value == "=MATCH(A6,Tooling!$A$6:$A$48,0)"
+    assert calc["AQ6"].value == '=IFNA(INDEX(Tooling!$AD$6:$AD$48,CM6),"")'
+    # Our own MATCH formulas don't stop a second run
+    assert jarvis.migrate_formulas() == []
+
+
+@pytest.mark.parametrize("cell", ["CM4", "CM7"])
+def test_used_tool_match_column_is_not_overwritten(template, cell, edit_calculation):
+    edit_calculation(template, lambda ws: setattr(ws[cell], "value", "Notes"))
+    with pytest.raises(jarvis.SaveError, match=cell):
+        jarvis.migrate_formulas()
+    entry = {field: "" for field in jarvis.all_fields}
+    entry.update({"ZF Part Number": "ZFNEW", "Part No": "PNEW", "Rawmaterial": "PP"})
+    if cell == "CM4":
+        with pytest.raises(jarvis.SaveError, match=cell):
+            jarvis.save_entry(entry)
+    calc = load_workbook(template)["Calculation"]
+    assert calc[cell].value == "Notes"
+    assert "VLOOKUP" in calc["AQ6"].value
+
+
+def write_lock(path, owner, age=0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(owner, f)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_stale_lock_is_taken_over(template):
+    lock_file = template + ".lock"
+    write_lock(lock_file, {"user": "gone", "host": "elsewhere", "pid": 1, "time": 0}, age=lock.LOCK_STALE_SECONDS + 5)
+    with jarvis.TemplateLock(timeout=1):
+        assert lock._lock_owner(lock_file)["pid"] == os.getpid()
+    assert not os.path.exists(lock_file)
+
+
+def test_fresh_lock_from_a_racing_takeover_is_kept(template, monkeypatch):
+    # Another process removes the stale lock and takes its own between our staleness check and the removal
+    lock_file = template + ".lock"
+    write_lock(lock_file, {"user": "gone", "host": "elsewhere", "pid": 1, "time": 0}, age=lock.LOCK_STALE_SECONDS + 5)
+    fresh = {"user": "other", "host": "elsewhere", "pid": 2, "time": time.time()}
+    is_stale = lock._lock_is_stale
+
+    def racing(path, owner):
+        stale = is_stale(path, owner)
+        if stale and owner["user"] == "gone":
+            os.remove(path)
+            write_lock(path, fresh)
+        return stale
+    monkeypatch.setattr(lock, "_lock_is_stale", racing)
+    with pytest.raises(jarvis.SaveError, match="other"):
+        with jarvis.TemplateLock(timeout=0.3):
+            pass
+    assert lock._lock_owner(lock_file) == fresh
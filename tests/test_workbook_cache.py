@@ -0,0 +1,60 @@
+from collections import OrderedDict
+import os
+
+from openpyxl import Workbook
+
+import jarvis
+from jarvis_core import workbook
+
+
+def write_book(path, value):
+    wb = Workbook()
+    wb.active["A1"] = value
+    wb.save(path)
+    return str(path)
+
+
+def test_cached_until_the_file_changes(tmp_path):
+    path = write_book(tmp_path / "a.xlsx", "first")
+    wb = jarvis.get_workbook(path)
+    assert jarvis.get_workbook(path) is wb
+    assert jarvis.get_workbook(path, data_only=True) is not wb
+
+    write_book(path, "second")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    reloaded = jarvis.get_workbook(path)
+    assert reloaded is not wb
+    assert reloaded.active["A1"].value == "second"
+    # The stale version is dropped, not kept alongside
+    assert [key for key in workbook._workbook_cache if key[:2] == (os.path.abspath(path), False)] == \
+        [workbook._workbook_cache_key(path, False)]
+
+
+def test_touching_the_file_is_enough(tmp_path):
+    path = write_book(tmp_path / "a.xlsx", "same")
+    wb = jarvis.get_workbook(path)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert jarvis.get_workbook(path) is not wb
+
+
+def test_invalidate_drops_both_modes(tmp_path):
+    path = write_book(tmp_path / "a.xlsx", 1)
+    formulas, values = jarvis.get_workbook(path), jarvis.get_workbook(path, data_only=True)
+    jarvis.invalidate_workbook_cache(path)
+    assert jarvis.get_workbook(path) is not formulas
+    assert jarvis.get_workbook(path, data_only=True) is not values
+
+
+def test_least_recently_used_goes_over_budget(tmp_path, monkeypatch):
+    paths = [write_book(tmp_path / f"{name}.xlsx", name) for name in "abc"]
+    size_mb = os.path.getsize(paths[0]) / (1024 * 1024) * workbook.WORKBOOK_MB_PER_FILE_MB
+    monkeypatch.setattr(workbook, "_workbook_cache", OrderedDict())
+    monkeypatch.setattr(workbook, "WORKBOOK_CACHE_BUDGET_MB", size_mb * 2.5)
+    a = jarvis.get_workbook(paths[0])
+    jarvis.get_workbook(paths[1])
+    assert jarvis.get_workbook(paths[0]) is a  # a is now the most recently used
+    jarvis.get_workbook(paths[2])
+    cached = {key[0] for key in workbook._workbook_cache}
+    assert cached == {os.path.abspath(paths[0]), os.path.abspath(paths[2])}